@@ -34,7 +34,9 @@ $(document).ready(function () {
         $('#' + contenedorId).html(header);
     }
 
-    let intervaloActualizacion; // Variable para almacenar el intervalo de actualización
+    let intervaloActualizacion; // Variable para almacenar el intervalo de actualización (si no hay EventSource)
+    let streamLecturas = null; // Conexión al stream de lecturas en tiempo real (/api/sensor/stream)
+    let refrescoPendiente = null; // Agrupa en un solo refresco las lecturas que llegan juntas
     let lastSensorTimestamp = ''; // Usaremos el timestamp como último "ID" para el sensor
     let currentControllerUuid = null; // UUID del controlador actualmente seleccionado
     let currentEnsayoUuid = null; // UUID del ensayo actualmente seleccionado
@@ -252,10 +254,7 @@ $(document).ready(function () {
                     $('#controller-details-section').hide(); // Ocultar toda la sección de detalles
                     currentControllerUuid = null;
                     currentEnsayoUuid = null; // Resetear ensayo seleccionado
-                    if (intervaloActualizacion) {
-                        clearInterval(intervaloActualizacion);
-                        intervaloActualizacion = null;
-                    }
+                    detenerActualizacion();
                 }
             },
             error: function (jqXHR, textStatus, errorThrown) {
@@ -365,12 +364,47 @@ $(document).ready(function () {
         loadEnsayos(uuid); // Cargar los ensayos para el controlador seleccionado
         actualizarTablaSensores(uuid, null); // Cargar todos los datos del controlador seleccionado inicialmente
 
-        // Desactivar el intervalo de actualización si estaba activo para otro controlador
+        // Desactivar la actualización si estaba activa para otro controlador
+        detenerActualizacion();
+        // Iniciar la actualización automática para este controlador (todos los ensayos)
+        iniciarActualizacion(uuid);
+    }
+
+    // Función para refrescar la tabla cuando llegan lecturas nuevas del controlador.
+    // Usa el stream de Server-Sent Events; si el navegador no lo soporta, consulta cada 10 segundos.
+    function iniciarActualizacion(uuid) {
+        if (!window.EventSource) {
+            intervaloActualizacion = setInterval(() => actualizarTablaSensores(uuid, null), 10000);
+            return;
+        }
+        // EventSource se reconecta solo y envía Last-Event-ID para recuperar las lecturas perdidas
+        streamLecturas = new EventSource(API_ADDR + '/sensor/stream?uuid_controlador=' + uuid);
+        streamLecturas.addEventListener('lectura', function () {
+            // Los controladores envían sus 4 sensores a la vez: un solo refresco por grupo
+            if (refrescoPendiente) {
+                return;
+            }
+            refrescoPendiente = setTimeout(function () {
+                refrescoPendiente = null;
+                actualizarTablaSensores(uuid, null);
+            }, 500);
+        });
+    }
+
+    // Función para detener la actualización automática
+    function detenerActualizacion() {
+        if (streamLecturas) {
+            streamLecturas.close();
+            streamLecturas = null;
+        }
+        if (refrescoPendiente) {
+            clearTimeout(refrescoPendiente);
+            refrescoPendiente = null;
+        }
         if (intervaloActualizacion) {
             clearInterval(intervaloActualizacion);
+            intervaloActualizacion = null;
         }
-        // Iniciar la actualización automática para este controlador (todos los ensayos)
-        intervaloActualizacion = setInterval(() => actualizarTablaSensores(uuid, null), 10000);
     }
 
     // Función para actualizar la tabla de sensores de un controlador específico, opcionalmente filtrado por ensayo
@@ -0,0 +1,198 @@
+# archive.py
+import argparse
+import os
+import sqlite3
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import crud
+from database import ARCHIVO_DIR, get_db_connection, to_epoch_ms, _configure_connection
+from models import EstadoEnsayo, ResultadoArchivo
+
+# --- Configuración de la retención de lecturas ---
+# Las lecturas crudas con más de estos días se mueven a los archivos mensuales (0 desactiva la regla)
+RETENCION_DIAS = int(os.getenv("RETENCION_DIAS", "180"))
+# Si está activa, también se archivan todas las lecturas de los ensayos Finalizados
+ARCHIVAR_FINALIZADOS = os.getenv("ARCHIVAR_FINALIZADOS", "1").lower() in ("1", "true", "si", "sí")
+# Lecturas movidas por transacción: cada lote bloquea la escritura en sensores.db solo unos milisegundos
+ARCHIVO_LOTE = int(os.getenv("ARCHIVO_LOTE", "2000"))
+
+# Solo se archiva desde un hilo a la vez (endpoint o CLI dentro del mismo proceso)
+_archivando = threading.Lock()
+
+_ESQUEMA_ARCHIVO = [
+    """
+    CREATE TABLE IF NOT EXISTS identificadores (
+        id INTEGER PRIMARY KEY,
+        uuid TEXT NOT NULL UNIQUE
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS lecturas_sensor (
+        id INTEGER PRIMARY KEY,
+        uuid_lectura BLOB NOT NULL,
+        id_controlador INTEGER NOT NULL,
+        id_ensayo INTEGER,
+        id_sensor INTEGER NOT NULL,
+        ts INTEGER NOT NULL,
+        lectura_temperatura REAL NOT NULL,
+        lectura_humedad REAL NOT NULL,
+        lectura_bateria REAL
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS idx_lecturas_ensayo_timestamp ON lecturas_sensor (id_ensayo, ts)",
+    "CREATE INDEX IF NOT EXISTS idx_lecturas_controlador_timestamp ON lecturas_sensor (id_controlador, ts)",
+]
+
+def ruta_archivo(mes: str) -> Path:
+    """Archivo de las lecturas de un mes ('AAAA-MM', hora de Colombia)."""
+    return ARCHIVO_DIR / f"lecturas_{mes}.db"
+
+def _mes(ts: int) -> str:
+    return datetime.fromtimestamp(ts / 1000 - crud.DESFASE_COLOMBIA_S, timezone.utc).strftime("%Y-%m")
+
+def _abrir_archivo(mes: str) -> sqlite3.Connection:
+    """
+    Abre (creándolo si no existe) el archivo de un mes. Tiene el mismo esquema compacto que
+    lecturas_sensor, con las mismas llaves, y su propia copia de los identificadores que usa.
+    """
+    ARCHIVO_DIR.mkdir(parents=True, exist_ok=True)
+    conn = sqlite3.connect(ruta_archivo(mes))
+    _configure_connection(conn)
+    conn.execute("PRAGMA synchronous=FULL") # Se borra de sensores.db solo después de este commit
+    for sentencia in _ESQUEMA_ARCHIVO:
+        conn.execute(sentencia)
+    conn.commit()
+    return conn
+
+def _ids_ensayos_finalizados(cursor: sqlite3.Cursor) -> List[int]:
+    cursor.execute(
+        "SELECT i.id FROM ensayos e JOIN identificadores i ON i.uuid = e.uuid_ensayo WHERE e.estado = ?",
+        (EstadoEnsayo.finalizado.value,),
+    )
+    return [fila[0] for fila in cursor.fetchall()]
+
+def _siguiente_lote(limite_ts: Optional[int], ensayos: List[int], tamano: int) -> List[tuple]:
+    """Lecturas pendientes de archivar, las más antiguas primero (cada consulta usa un índice)."""
+    with get_db_connection() as conn:
+        cursor = conn.cursor()
+        if limite_ts is not None:
+            cursor.execute("SELECT * FROM lecturas_sensor WHERE ts < ? ORDER BY ts LIMIT ?", (limite_ts, tamano))
+            filas = cursor.fetchall()
+            if filas:
+                return filas
+        for id_ensayo in ensayos:
+            cursor.execute("SELECT * FROM lecturas_sensor WHERE id_ensayo = ? ORDER BY ts LIMIT ?", (id_ensayo, tamano))
+            filas = cursor.fetchall()
+            if filas:
+                return filas
+        return []
+
+def _copias_faltantes(archivo: sqlite3.Connection, filas: List[tuple]) -> int:
+    """Lecturas del lote cuya llave en el archivo no corresponde a la misma lectura (mismo uuid_lectura)."""
+    return sum(
+        1 for fila in filas
+        if archivo.execute("SELECT uuid_lectura FROM lecturas_sensor WHERE id = ?", (fila[0],)).fetchone() != (fila[1],)
+    )
+
+def _mover_lote(filas: List[tuple], conexiones: Dict[str, sqlite3.Connection]) -> Dict[str, int]:
+    """
+    Copia el lote a los archivos de cada mes y, una vez guardado allí, lo borra de sensores.db.
+    Si el proceso se interrumpe entre ambos pasos, la siguiente ejecución vuelve a copiar las mismas
+    lecturas (INSERT OR IGNORE las que ya están) y las borra. Antes de borrar se comprueba que cada
+    lectura del lote quedó en el archivo; si alguna llave ya la ocupa otra lectura, se lanza
+    sqlite3.IntegrityError y el lote se conserva en sensores.db.
+    """
+    por_mes: Dict[str, List[tuple]] = {}
+    for fila in filas:
+        por_mes.setdefault(_mes(fila[5]), []).append(fila)
+
+    with get_db_connection() as conn:
+        cursor = conn.cursor()
+        for mes, filas_mes in por_mes.items():
+            ids = {fila[2] for fila in filas_mes} | {fila[3] for fila in filas_mes if fila[3] is not None}
+            cursor.execute(f"SELECT id, uuid FROM identificadores WHERE id IN ({', '.join('?' for _ in ids)})", list(ids))
+            identificadores = cursor.fetchall()
+            if mes not in conexiones:
+                conexiones[mes] = _abrir_archivo(mes)
+            archivo = conexiones[mes]
+            try:
+                archivo.executemany("INSERT OR IGNORE INTO identificadores VALUES (?, ?)", identificadores)
+                antes = archivo.total_changes
+                archivo.executemany("INSERT OR IGNORE INTO lecturas_sensor VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)", filas_mes)
+                # Las ignoradas solo pueden ser copias de un intento anterior interrumpido
+                if archivo.total_changes - antes != len(filas_mes):
+                    faltantes = _copias_faltantes(archivo, filas_mes)
+                    if faltantes:
+                        raise sqlite3.IntegrityError(
+                            f"{faltantes} lecturas no se copiaron al archivo {ruta_archivo(mes)}: sus llaves ya pertenecen a otras lecturas."
+                        )
+                archivo.commit()
+            except sqlite3.Error:
+                archivo.rollback()
+                raise
+
+        cursor.executemany("DELETE FROM lecturas_sensor WHERE id = ?", [(fila[0],) for fila in filas])
+        conn.commit() # Si falla, el pool revierte la transacción al devolver la conexión
+        crud.versiones.cambiar("lecturas")
+    return {mes: len(filas_mes) for mes, filas_mes in por_mes.items()}
+
+def archivar_lecturas(
+    retencion_dias: int = RETENCION_DIAS,
+    archivar_finalizados: bool = ARCHIVAR_FINALIZADOS,
+    max_lecturas: Optional[int] = None,
+    tamano_lote: int = ARCHIVO_LOTE,
+    pausa: float = 0.01
+) -> Optional[ResultadoArchivo]:
+    """
+    Mueve a los archivos mensuales las lecturas crudas más antiguas que `retencion_dias` y las de los
+    ensayos Finalizados, por lotes de `tamano_lote` en transacciones cortas, con una pausa entre lotes
+    para que la ingesta nunca espere. Los resúmenes por hora y día se conservan en sensores.db.
+    Se detiene tras `max_lecturas` (si se indica); se puede volver a llamar para continuar.
+    Retorna None si ya hay un archivado en curso.
+    """
+    if not _archivando.acquire(blocking=False):
+        return None
+    conexiones: Dict[str, sqlite3.Connection] = {}
+    resultado = ResultadoArchivo(lecturas_archivadas=0, por_mes={}, completo=False)
+    try:
+        limite_ts = None
+        if retencion_dias > 0:
+            limite_ts = to_epoch_ms(datetime.now(timezone.utc) - timedelta(days=retencion_dias))
+        ensayos = []
+        if archivar_finalizados:
+            with get_db_connection() as conn:
+                ensayos = _ids_ensayos_finalizados(conn.cursor())
+
+        while max_lecturas is None or resultado.lecturas_archivadas < max_lecturas:
+            tamano = tamano_lote if max_lecturas is None else min(tamano_lote, max_lecturas - resultado.lecturas_archivadas)
+            filas = _siguiente_lote(limite_ts, ensayos, tamano)
+            if not filas:
+                resultado.completo = True
+                break
+            for mes, cantidad in _mover_lote(filas, conexiones).items():
+                resultado.por_mes[mes] = resultado.por_mes.get(mes, 0) + cantidad
+            resultado.lecturas_archivadas += len(filas)
+            time.sleep(pausa)
+        return resultado
+    finally:
+        for conn in conexiones.values():
+            conn.close()
+        _archivando.release()
+
+if __name__ == "__main__":
+    # Uso: cd app && python archive.py [--dias 180] [--sin-finalizados] [--max 100000]
+    parser = argparse.ArgumentParser(description="Mueve las lecturas antiguas de sensores.db a archivos mensuales.")
+    parser.add_argument("--dias", type=int, default=RETENCION_DIAS, help="Archivar lecturas con más de estos días (0 desactiva la regla).")
+    parser.add_argument("--sin-finalizados", action="store_true", help="No archivar las lecturas de los ensayos Finalizados.")
+    parser.add_argument("--max", type=int, default=None, help="Máximo de lecturas a mover en esta ejecución.")
+    parser.add_argument("--lote", type=int, default=ARCHIVO_LOTE, help="Lecturas por transacción.")
+    args = parser.parse_args()
+
+    resultado = archivar_lecturas(args.dias, not args.sin_finalizados and ARCHIVAR_FINALIZADOS, args.max, args.lote)
+    for mes, cantidad in sorted(resultado.por_mes.items()):
+        print(f"{ruta_archivo(mes)}: {cantidad} lecturas")
+    print(f"Lecturas archivadas: {resultado.lecturas_archivadas}" + ("" if resultado.completo else " (quedan pendientes, vuelva a ejecutar)"))
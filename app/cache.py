@@ -0,0 +1,106 @@
+# cache.py
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Hashable, Iterable, Optional
+
+class Cache:
+    """
+    Caché en memoria del proceso, acotada y segura entre hilos.
+    - Cuando se supera `max_entradas` se descarta la entrada usada hace más tiempo (LRU).
+    - Si se indica `ttl` (segundos), las entradas expiran pasado ese tiempo.
+    - `generacion` aumenta con cada invalidación: quien lee de la base de datos la toma antes de
+      consultar y la pasa a `set`, que descarta el valor si hubo una invalidación entretanto
+      (así una escritura concurrente no deja un valor obsoleto en la caché).
+    La caché es local a cada proceso: con varios workers de uvicorn cada uno tiene la suya.
+    """
+
+    def __init__(self, max_entradas: int = 10000, ttl: Optional[float] = None):
+        self.max_entradas = max_entradas
+        self.ttl = ttl
+        self._datos: "OrderedDict[Hashable, tuple[Any, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.generacion = 0
+        self.aciertos = 0
+        self.fallos = 0
+
+    def get(self, clave: Hashable, default: Any = None) -> Any:
+        """Retorna el valor guardado para `clave` o `default` si no existe o expiró."""
+        with self._lock:
+            entrada = self._datos.get(clave)
+            if entrada is None or entrada[1] < time.monotonic():
+                if entrada is not None:
+                    del self._datos[clave]
+                self.fallos += 1
+                return default
+            self._datos.move_to_end(clave)
+            self.aciertos += 1
+            return entrada[0]
+
+    def set(self, clave: Hashable, valor: Any, generacion: Optional[int] = None, ttl: Optional[float] = None):
+        """
+        Guarda `valor` para `clave`. Si se indica `generacion` y la caché se invalidó desde entonces,
+        el valor no se guarda. `ttl` permite una expiración distinta a la de la caché para esta entrada.
+        """
+        ttl = ttl if ttl is not None else self.ttl
+        expira = time.monotonic() + ttl if ttl is not None else float("inf")
+        with self._lock:
+            if generacion is not None and generacion != self.generacion:
+                return
+            self._datos[clave] = (valor, expira)
+            self._datos.move_to_end(clave)
+            while len(self._datos) > self.max_entradas:
+                self._datos.popitem(last=False)
+
+    def invalidate(self, clave: Hashable):
+        """Elimina la entrada de `clave`, si existe."""
+        with self._lock:
+            self.generacion += 1
+            self._datos.pop(clave, None)
+
+    def invalidate_where(self, condicion: Callable[[Hashable, Any], bool]):
+        """Elimina las entradas cuya clave y valor cumplen `condicion(clave, valor)`."""
+        with self._lock:
+            self.generacion += 1
+            for clave in [c for c, (v, _) in self._datos.items() if condicion(c, v)]:
+                del self._datos[clave]
+
+    def clear(self):
+        """Elimina todas las entradas."""
+        with self._lock:
+            self.generacion += 1
+            self._datos.clear()
+
+    def __len__(self) -> int:
+        return len(self._datos)
+
+class Versiones:
+    """
+    Contadores de cambios por tabla y, opcionalmente, por clave (p. ej. por controlador), que suben
+    las escrituras del CRUD. Sirven para generar ETags sin consultar la base de datos: si la versión
+    no cambió, la respuesta tampoco. Incluyen la hora de arranque para que un reinicio no repita
+    versiones anteriores. Como la caché, son locales a cada proceso.
+    """
+
+    def __init__(self):
+        self.arranque = format(time.time_ns() // 1000, "x")
+        self._lock = threading.Lock()
+        self._tablas: dict = {}
+        self._completas: dict = {} # Cambios sin clave: afectan la versión de todas las claves
+        self._claves: dict = {}
+
+    def cambiar(self, tabla: str, claves: Optional[Iterable[Hashable]] = None):
+        """Registra un cambio en `tabla`; si se indican `claves`, solo en esas claves."""
+        with self._lock:
+            self._tablas[tabla] = self._tablas.get(tabla, 0) + 1
+            if claves is None:
+                self._completas[tabla] = self._completas.get(tabla, 0) + 1
+            else:
+                for clave in claves:
+                    self._claves[(tabla, clave)] = self._claves.get((tabla, clave), 0) + 1
+
+    def version(self, tabla: str, clave: Optional[Hashable] = None) -> str:
+        """Versión actual de `tabla` completa, o solo de `clave` dentro de ella."""
+        if clave is None:
+            return f"{self.arranque}.{self._tablas.get(tabla, 0)}"
+        return f"{self.arranque}.{self._completas.get(tabla, 0)}.{self._claves.get((tabla, clave), 0)}"
@@ -1,13 +1,23 @@
 # crud.py
+import base64
+import binascii
+import json
+import math
+import re
 import sqlite3
-from typing import List, Optional
-from datetime import datetime
+import threading
+from typing import Dict, Iterator, List, Optional, Tuple
+from datetime import datetime, timezone
 import uuid
 import pytz
 
-from database import get_db_connection
+import fastjson
+import metrics
+from cache import Cache, Versiones
+from database import get_db_connection, get_export_connection, get_archivos_lecturas, to_epoch_ms
 from models import (
-    LecturaSensorCreate, LecturaSensor,
+    LecturaSensorCreate, LecturaSensor, LecturaSensorAgregada,
+    ResumenLecturas, PeriodoResumen,
     ControladorCreate, Controlador, EstadoControlador,
     EnsayoCreate, Ensayo, EstadoEnsayo,
     UserCreate, User, UserInDB,
@@ -17,92 +27,826 @@ from models import (
 # Define la zona horaria de Colombia
 COLOMBIA_TIMEZONE = pytz.timezone('America/Bogota')
 
+# Colombia no tiene horario de verano: la hora local es siempre UTC-5
+DESFASE_COLOMBIA_S = 5 * 3600
+
 def get_colombia_timestamp():
     return datetime.now(COLOMBIA_TIMEZONE).isoformat()
 
+# Versiones de las tablas para los ETag de los endpoints de consulta. "lecturas" se lleva también
+# por controlador y por ensayo; "controladores" y "ensayos" cambian juntas (sus escrituras suelen tocar ambas);
+# "ultimos_valores" cubre las columnas de la última lectura en controladores (ver publicar_ultimos_valores).
+# "usuarios" se lleva por usuario y sirve para descartar los tokens verificados en caché.
+versiones = Versiones()
+
+def _cambiaron_controladores_y_ensayos():
+    versiones.cambiar("controladores")
+    versiones.cambiar("ensayos")
+
+# Batería, hora y valores de la última lectura en controladores (ver _actualizar_controladores) cambian
+# con cada lectura. Su versión propia, "ultimos_valores", no sube en cada inserción: la ingesta solo la
+# marca como pendiente y el monitor de actividad la publica una vez por intervalo (ver heartbeat.py).
+# Así el ETag del listado de controladores cambia como máximo una vez por intervalo, a cambio de que
+# una consulta dentro del intervalo pueda recibir 304 con esos valores atrasados.
+_ultimos_valores_pendientes = threading.Event()
+
+def publicar_ultimos_valores() -> bool:
+    """Sube la versión "ultimos_valores" si hubo lecturas desde la última vez. Retorna si la subió."""
+    if not _ultimos_valores_pendientes.is_set():
+        return False
+    _ultimos_valores_pendientes.clear()
+    versiones.cambiar("ultimos_valores")
+    return True
+
 ## Funciones para Lecturas de Sensores
 
-def create_lectura_sensor(lectura: LecturaSensorCreate, uuid_ensayo_asignado: uuid.UUID) -> LecturaSensor:
+# Inserta o acumula una lectura en el resumen de un periodo (hora o día).
+# Parámetros: ?1 periodo, ?2 inicio, ?3 uuid_controlador, ?4 uuid_ensayo, ?5 id_sensor,
+# ?6 temperatura, ?7 humedad, ?8 batería. Como la batería puede venir en NULL se usa COALESCE
+# para no perder lo acumulado.
+_UPSERT_RESUMEN = """
+    INSERT INTO resumen_lecturas VALUES (
+        ?1, ?2, ?3, ?4, ?5, 1,
+        ?6, ?6, ?6, ?6 * ?6,
+        ?7, ?7, ?7, ?7 * ?7,
+        ?8 IS NOT NULL, ?8, ?8, ?8, ?8 * ?8
+    )
+    ON CONFLICT (periodo, uuid_controlador, uuid_ensayo, id_sensor, inicio) DO UPDATE SET
+        cantidad = cantidad + 1,
+        temperatura_suma = temperatura_suma + excluded.temperatura_suma,
+        temperatura_min = MIN(temperatura_min, excluded.temperatura_min),
+        temperatura_max = MAX(temperatura_max, excluded.temperatura_max),
+        temperatura_suma_cuadrados = temperatura_suma_cuadrados + excluded.temperatura_suma_cuadrados,
+        humedad_suma = humedad_suma + excluded.humedad_suma,
+        humedad_min = MIN(humedad_min, excluded.humedad_min),
+        humedad_max = MAX(humedad_max, excluded.humedad_max),
+        humedad_suma_cuadrados = humedad_suma_cuadrados + excluded.humedad_suma_cuadrados,
+        bateria_cantidad = bateria_cantidad + excluded.bateria_cantidad,
+        bateria_suma = COALESCE(bateria_suma + excluded.bateria_suma, bateria_suma, excluded.bateria_suma),
+        bateria_min = COALESCE(MIN(bateria_min, excluded.bateria_min), bateria_min, excluded.bateria_min),
+        bateria_max = COALESCE(MAX(bateria_max, excluded.bateria_max), bateria_max, excluded.bateria_max),
+        bateria_suma_cuadrados = COALESCE(bateria_suma_cuadrados + excluded.bateria_suma_cuadrados, bateria_suma_cuadrados, excluded.bateria_suma_cuadrados)
+"""
+
+def _actualizar_resumenes(cursor: sqlite3.Cursor, lecturas: List[LecturaSensor]):
     """
-    Crea una nueva lectura de sensor, asignando el ensayo determinado por el backend.
+    Acumula las lecturas recién insertadas en los resúmenes por hora y por día.
+    Debe llamarse dentro de la misma transacción que la inserción de las lecturas.
+    """
+    filas = []
+    for lectura in lecturas:
+        timestamp = lectura.timestamp.isoformat()
+        inicio_hora = timestamp[:13] + ":00:00" + timestamp[-6:]
+        inicio_dia = timestamp[:10] + "T00:00:00" + timestamp[-6:]
+        for periodo, inicio in ((PeriodoResumen.hora.value, inicio_hora), (PeriodoResumen.dia.value, inicio_dia)):
+            filas.append((
+                periodo,
+                inicio,
+                str(lectura.uuid_controlador),
+                str(lectura.uuid_ensayo),
+                lectura.id_sensor,
+                lectura.lectura_temperatura,
+                lectura.lectura_humedad,
+                lectura.lectura_bateria,
+            ))
+    cursor.executemany(_UPSERT_RESUMEN, filas)
+
+# Cantidad de sensores por controlador: controladores guarda la última temperatura y humedad de cada uno
+SENSORES_POR_CONTROLADOR = 4
+
+# Última lectura de un controlador en su fila de controladores. Los valores NULL (batería no reportada
+# o sensor que no vino en el grupo) conservan el valor anterior.
+_UPDATE_ULTIMA_LECTURA_CONTROLADOR = f"""
+    UPDATE controladores SET
+        ultima_lectura_ts = MAX(COALESCE(ultima_lectura_ts, 0), ?),
+        bateria = COALESCE(?, bateria),
+        {", ".join(
+            f"temperatura_sensor_{n} = COALESCE(?, temperatura_sensor_{n}), humedad_sensor_{n} = COALESCE(?, humedad_sensor_{n})"
+            for n in range(1, SENSORES_POR_CONTROLADOR + 1)
+        )}
+    WHERE uuid_controlador = ?
+"""
+
+def _actualizar_controladores(cursor: sqlite3.Cursor, lecturas: List[LecturaSensor]):
+    """
+    Copia a controladores la hora, la batería y los valores por sensor de la lectura más reciente de
+    cada controlador del grupo (una sentencia por controlador, no por lectura), para que el listado de
+    controladores no tenga que consultar lecturas_sensor. Debe llamarse dentro de la misma transacción
+    que la inserción de las lecturas.
+    """
+    ultimas: Dict[uuid.UUID, Dict[int, LecturaSensor]] = {}
+    baterias: Dict[uuid.UUID, LecturaSensor] = {}
+    for lectura in lecturas:
+        por_sensor = ultimas.setdefault(lectura.uuid_controlador, {})
+        if lectura.id_sensor not in por_sensor or lectura.timestamp >= por_sensor[lectura.id_sensor].timestamp:
+            por_sensor[lectura.id_sensor] = lectura
+        anterior = baterias.get(lectura.uuid_controlador)
+        if lectura.lectura_bateria is not None and (anterior is None or lectura.timestamp >= anterior.timestamp):
+            baterias[lectura.uuid_controlador] = lectura
+    filas = []
+    for uuid_controlador, por_sensor in ultimas.items():
+        ultima = max(por_sensor.values(), key=lambda lectura: lectura.timestamp)
+        con_bateria = baterias.get(uuid_controlador)
+        valores = []
+        for n in range(1, SENSORES_POR_CONTROLADOR + 1):
+            lectura = por_sensor.get(n)
+            valores += [lectura.lectura_temperatura, lectura.lectura_humedad] if lectura else [None, None]
+        filas.append((
+            to_epoch_ms(ultima.timestamp),
+            con_bateria.lectura_bateria if con_bateria else None,
+            *valores,
+            str(uuid_controlador),
+        ))
+    cursor.executemany(_UPDATE_ULTIMA_LECTURA_CONTROLADOR, filas)
+
+def build_lecturas_sensor(
+    lecturas: List[LecturaSensorCreate],
+    ensayos_asignados: Dict[uuid.UUID, uuid.UUID]
+) -> List[LecturaSensor]:
+    """
+    Construye las lecturas completas (UUID, ensayo asignado y timestamp de recepción) sin guardarlas.
+    `ensayos_asignados` relaciona cada UUID de controlador con el ensayo al que se asignan sus lecturas.
+    """
+    timestamp = datetime.fromisoformat(get_colombia_timestamp())
+    timestamp = timestamp.replace(microsecond=timestamp.microsecond // 1000 * 1000) # Se guarda en milisegundos
+    return [
+        LecturaSensor(
+            uuid_lectura=uuid.uuid4(),
+            uuid_controlador=lectura.uuid_controlador,
+            uuid_ensayo=ensayos_asignados[lectura.uuid_controlador],
+            id_sensor=lectura.id_sensor,
+            timestamp=timestamp,
+            lectura_temperatura=lectura.lectura_temperatura,
+            lectura_humedad=lectura.lectura_humedad,
+            lectura_bateria=lectura.lectura_bateria,
+        )
+        for lectura in lecturas
+    ]
+
+# UUID de controlador o ensayo -> llave entera en la tabla identificadores. La relación nunca cambia
+# (la tabla no se borra), así que la caché no necesita invalidarse.
+identificadores_cache = Cache(max_entradas=10000)
+
+def _get_identificadores(cursor: sqlite3.Cursor, uuids: set) -> Tuple[Dict[str, int], Dict[str, int]]:
+    """
+    Obtiene la llave entera de cada UUID, registrándolo en identificadores si es nuevo.
+    Debe llamarse dentro de la transacción de la inserción; retorna (todos, nuevos): los nuevos solo
+    se guardan en la caché después del commit.
+    """
+    ids = {}
+    for valor in uuids:
+        id_cacheado = identificadores_cache.get(valor)
+        if id_cacheado is not None:
+            ids[valor] = id_cacheado
+    faltantes = [valor for valor in uuids if valor not in ids]
+    if not faltantes:
+        return ids, {}
+    cursor.executemany("INSERT OR IGNORE INTO identificadores (uuid) VALUES (?)", [(valor,) for valor in faltantes])
+    cursor.execute(
+        f"SELECT uuid, id FROM identificadores WHERE uuid IN ({', '.join('?' for _ in faltantes)})",
+        faltantes,
+    )
+    nuevos = dict(cursor.fetchall())
+    ids.update(nuevos)
+    return ids, nuevos
+
+def insert_lecturas_sensor(lecturas: List[LecturaSensor]):
+    """
+    Guarda lecturas ya construidas y actualiza sus resúmenes y la última lectura de sus controladores,
+    todo en una sola transacción (un solo commit para todo el grupo).
     """
     with get_db_connection() as conn:
         cursor = conn.cursor()
-        uuid_l = uuid.uuid4()
-        timestamp = get_colombia_timestamp()
-        
         try:
-            cursor.execute(
+            ids, nuevos = _get_identificadores(
+                cursor,
+                {str(lectura.uuid_controlador) for lectura in lecturas} | {str(lectura.uuid_ensayo) for lectura in lecturas},
+            )
+            cursor.executemany(
                 """
-                INSERT INTO lecturas_sensor (uuid_lectura, uuid_controlador, uuid_ensayo, id_sensor, timestamp, lectura_temperatura, lectura_humedad, lectura_bateria)
+                INSERT INTO lecturas_sensor (uuid_lectura, id_controlador, id_ensayo, id_sensor, ts, lectura_temperatura, lectura_humedad, lectura_bateria)
                 VALUES (?, ?, ?, ?, ?, ?, ?, ?)
                 """,
-                (
-                    str(uuid_l),
-                    str(lectura.uuid_controlador),
-                    str(uuid_ensayo_asignado),
-                    lectura.id_sensor,
-                    timestamp,
-                    lectura.lectura_temperatura,
-                    lectura.lectura_humedad,
-                    lectura.lectura_bateria,
-                ),
+                [
+                    (
+                        lectura.uuid_lectura.bytes,
+                        ids[str(lectura.uuid_controlador)],
+                        ids[str(lectura.uuid_ensayo)],
+                        lectura.id_sensor,
+                        to_epoch_ms(lectura.timestamp),
+                        lectura.lectura_temperatura,
+                        lectura.lectura_humedad,
+                        lectura.lectura_bateria,
+                    )
+                    for lectura in lecturas
+                ],
             )
+            _actualizar_resumenes(cursor, lecturas)
+            _actualizar_controladores(cursor, lecturas)
             conn.commit()
-            return LecturaSensor(
-                uuid_lectura=uuid_l,
-                uuid_controlador=lectura.uuid_controlador,
-                uuid_ensayo=uuid_ensayo_asignado,
-                id_sensor=lectura.id_sensor,
-                timestamp=datetime.fromisoformat(timestamp),
-                lectura_temperatura=lectura.lectura_temperatura,
-                lectura_humedad=lectura.lectura_humedad,
-                lectura_bateria=lectura.lectura_bateria,
-            )
         except sqlite3.Error as e:
-            print(f"Error al crear lectura de sensor: {e}")
+            conn.rollback()
+            print(f"Error al guardar lecturas de sensor: {e}")
             raise
+        for valor, id_nuevo in nuevos.items():
+            identificadores_cache.set(valor, id_nuevo)
+    versiones.cambiar("lecturas", {lectura.uuid_controlador for lectura in lecturas} | {lectura.uuid_ensayo for lectura in lecturas})
+    _ultimos_valores_pendientes.set() # Batería y últimos valores del listado de controladores
+    _registrar_ultimas_lecturas(lecturas)
+    metrics.lecturas_insertadas.inc(cantidad=len(lecturas))
+    for lectura in lecturas:
+        metrics.ultima_lectura_controlador.set_max(to_epoch_ms(lectura.timestamp) / 1000, str(lectura.uuid_controlador))
+
+def create_lectura_sensor(lectura: LecturaSensorCreate, uuid_ensayo_asignado: uuid.UUID) -> LecturaSensor:
+    """
+    Crea una nueva lectura de sensor, asignando el ensayo determinado por el backend.
+    """
+    creada = build_lecturas_sensor([lectura], {lectura.uuid_controlador: uuid_ensayo_asignado})[0]
+    insert_lecturas_sensor([creada])
+    return creada
+
+def create_lecturas_sensor_batch(
+    lecturas: List[LecturaSensorCreate],
+    ensayos_asignados: Dict[uuid.UUID, uuid.UUID]
+) -> List[LecturaSensor]:
+    """
+    Crea varias lecturas de sensor en una sola transacción.
+    `ensayos_asignados` relaciona cada UUID de controlador con el ensayo al que se asignan sus lecturas.
+    """
+    creadas = build_lecturas_sensor(lecturas, ensayos_asignados)
+    insert_lecturas_sensor(creadas)
+    return creadas
+
+def encode_cursor_lecturas(posicion: Tuple[int, int]) -> str:
+    """
+    Codifica la posición de una lectura (ts, id) como un cursor opaco de paginación.
+    """
+    return base64.urlsafe_b64encode(json.dumps(list(posicion)).encode("utf-8")).decode("ascii").rstrip("=")
+
+def decode_cursor_lecturas(cursor: str) -> Tuple[int, int]:
+    """
+    Decodifica un cursor generado por `encode_cursor_lecturas`. Lanza ValueError si no es válido.
+    """
+    try:
+        relleno = "=" * (-len(cursor) % 4)
+        ts, id_lectura = json.loads(base64.urlsafe_b64decode(cursor + relleno))
+    except (ValueError, TypeError, binascii.Error):
+        raise ValueError("Cursor de paginación inválido.")
+    if type(ts) is not int or type(id_lectura) is not int:
+        raise ValueError("Cursor de paginación inválido.")
+    return ts, id_lectura
+
+def to_colombia_isoformat(momento: datetime) -> str:
+    """
+    Convierte una fecha al mismo formato ISO8601 (hora de Colombia) con que se guardan los timestamps,
+    para poder compararlos directamente en SQL. Las fechas sin zona horaria se asumen en hora de Colombia.
+    """
+    if momento.tzinfo is None:
+        momento = COLOMBIA_TIMEZONE.localize(momento)
+    return momento.astimezone(COLOMBIA_TIMEZONE).isoformat()
+
+def _filtros_resumen(
+    uuid_controlador: Optional[uuid.UUID] = None,
+    id_sensor: Optional[int] = None,
+    uuid_ensayo: Optional[uuid.UUID] = None,
+    desde: Optional[datetime] = None,
+    hasta: Optional[datetime] = None
+) -> Tuple[str, list]:
+    """
+    Construye la cláusula WHERE (y sus parámetros) de las consultas sobre resumen_lecturas.
+    El rango de tiempo es [desde, hasta) sobre el inicio de cada periodo.
+    """
+    query = " WHERE 1=1"
+    params = []
+    if uuid_controlador:
+        query += " AND uuid_controlador = ?"
+        params.append(str(uuid_controlador))
+    if id_sensor:
+        query += " AND id_sensor = ?"
+        params.append(id_sensor)
+    if uuid_ensayo:
+        query += " AND uuid_ensayo = ?"
+        params.append(str(uuid_ensayo))
+    if desde:
+        query += " AND inicio >= ?"
+        params.append(to_colombia_isoformat(desde))
+    if hasta:
+        query += " AND inicio < ?"
+        params.append(to_colombia_isoformat(hasta))
+    return query, params
+
+def _filtros_lecturas(
+    uuid_controlador: Optional[uuid.UUID] = None,
+    id_sensor: Optional[int] = None,
+    uuid_ensayo: Optional[uuid.UUID] = None,
+    desde: Optional[datetime] = None,
+    hasta: Optional[datetime] = None
+) -> Tuple[str, list]:
+    """
+    Construye la cláusula WHERE (y sus parámetros) de las consultas sobre lecturas_sensor (alias l).
+    Los UUID se traducen a su llave entera con una subconsulta que SQLite evalúa una sola vez,
+    de modo que se siguen usando los índices. El rango de tiempo es [desde, hasta).
+    """
+    query = " WHERE 1=1"
+    params = []
+    if uuid_controlador:
+        query += " AND l.id_controlador = (SELECT id FROM identificadores WHERE uuid = ?)"
+        params.append(str(uuid_controlador))
+    if id_sensor:
+        query += " AND l.id_sensor = ?"
+        params.append(id_sensor)
+    if uuid_ensayo:
+        query += " AND l.id_ensayo = (SELECT id FROM identificadores WHERE uuid = ?)"
+        params.append(str(uuid_ensayo))
+    if desde:
+        query += " AND l.ts >= ?"
+        params.append(to_epoch_ms(desde))
+    if hasta:
+        query += " AND l.ts < ?"
+        params.append(to_epoch_ms(hasta))
+    return query, params
+
+def _sql_uuid(columna: str) -> str:
+    """Expresión SQL que presenta un UUID guardado en 16 bytes como texto con guiones."""
+    hexa = f"lower(hex({columna}))"
+    return " || '-' || ".join(f"substr({hexa}, {inicio}, {largo})" for inicio, largo in ((1, 8), (9, 4), (13, 4), (17, 4), (21, 12)))
+
+# Columnas de una lectura, en el orden en que se exportan
+COLUMNAS_LECTURA = (
+    "uuid_lectura", "uuid_controlador", "uuid_ensayo", "id_sensor", "timestamp",
+    "lectura_temperatura", "lectura_humedad", "lectura_bateria",
+)
+
+# Expresiones SQL de cada columna de una lectura en el formato de la API (UUID en texto y hora
+# ISO 8601 de Colombia). La hora se escribe con milisegundos, o como la escribe pydantic (microsegundos,
+# sin fracción si es cero) para la ruta rápida que va de las filas directo a JSON.
+_SQL_HORA_LOCAL = f"l.ts / 1000{{}}, 'unixepoch', '-{DESFASE_COLOMBIA_S} seconds'"
+_SQL_TIMESTAMP = f"strftime('%Y-%m-%dT%H:%M:%f', {_SQL_HORA_LOCAL.format('.0')}) || '-05:00'"
+
+def _sql_timestamp_pydantic(columna: str) -> str:
+    """Expresión SQL que escribe un epoch en milisegundos como pydantic escribe la hora de Colombia (NULL si es NULL)."""
+    return (
+        f"strftime('%Y-%m-%dT%H:%M:%S', {columna} / 1000, 'unixepoch', '-{DESFASE_COLOMBIA_S} seconds')"
+        f" || CASE WHEN {columna} % 1000 THEN printf('.%03d000', {columna} % 1000) ELSE '' END || '-05:00'"
+    )
+
+_SQL_TIMESTAMP_PYDANTIC = _sql_timestamp_pydantic("l.ts")
+_SQL_COLUMNAS_LECTURA = {
+    "uuid_lectura": _sql_uuid("l.uuid_lectura"),
+    "uuid_controlador": "c.uuid",
+    "uuid_ensayo": "e.uuid",
+    "id_sensor": "l.id_sensor",
+    "timestamp": _SQL_TIMESTAMP,
+    "lectura_temperatura": "l.lectura_temperatura",
+    "lectura_humedad": "l.lectura_humedad",
+    "lectura_bateria": "l.lectura_bateria",
+}
+
+def _select_lecturas(columnas: Tuple[str, ...], timestamp: str = _SQL_TIMESTAMP) -> str:
+    """
+    SELECT de lecturas con las `columnas` indicadas, más la posición (ts, id) usada en los cursores.
+    Los LEFT JOIN mantienen lecturas_sensor como tabla de partida.
+    """
+    expresiones = {**_SQL_COLUMNAS_LECTURA, "timestamp": timestamp}
+    seleccion = ",\n        ".join(f"{expresiones[columna]} AS {columna}" for columna in columnas)
+    return f"""
+    SELECT
+        {seleccion},
+        l.ts,
+        l.id
+    FROM lecturas_sensor l
+    LEFT JOIN identificadores c ON c.id = l.id_controlador
+    LEFT JOIN identificadores e ON e.id = l.id_ensayo
+"""
+
+_SELECT_LECTURAS = _select_lecturas(COLUMNAS_LECTURA)
+# Campos en el orden del modelo LecturaSensor, para que el JSON sea idéntico al de pydantic
+CAMPOS_LECTURA_API = tuple(LecturaSensor.model_fields)
+_SELECT_LECTURAS_API = _select_lecturas(CAMPOS_LECTURA_API, _SQL_TIMESTAMP_PYDANTIC)
+
+def _lectura_desde_fila(row: tuple) -> LecturaSensor:
+    return LecturaSensor(**dict(zip(COLUMNAS_LECTURA, row)))
+
+def _consultar_lecturas(
+    select: str,
+    uuid_controlador: Optional[uuid.UUID],
+    id_sensor: Optional[int],
+    uuid_ensayo: Optional[uuid.UUID],
+    skip: int,
+    limit: int,
+    cursor_posicion: Optional[Tuple[int, int]],
+    desde: Optional[datetime],
+    hasta: Optional[datetime]
+) -> Tuple[List[tuple], Optional[Tuple[int, int]]]:
+    with get_db_connection() as conn:
+        cursor = conn.cursor()
+        filtros, params = _filtros_lecturas(uuid_controlador, id_sensor, uuid_ensayo, desde, hasta)
+        query = select + filtros
+        if cursor_posicion:
+            query += " AND (l.ts, l.id) < (?, ?)"
+            params.extend(cursor_posicion)
+            skip = 0
+        query += " ORDER BY l.ts DESC, l.id DESC LIMIT ? OFFSET ?"
+        params.extend([limit, skip])
+        cursor.execute(query, params)
+        rows = cursor.fetchall()
+        posicion = (rows[-1][-2], rows[-1][-1]) if rows else None
+        return rows, posicion
 
 def get_lecturas_sensor(
     uuid_controlador: Optional[uuid.UUID] = None,
     id_sensor: Optional[int] = None,
     uuid_ensayo: Optional[uuid.UUID] = None,
     skip: int = 0,
-    limit: int = 100
-) -> List[LecturaSensor]:
+    limit: int = 100,
+    cursor_posicion: Optional[Tuple[int, int]] = None,
+    desde: Optional[datetime] = None,
+    hasta: Optional[datetime] = None
+) -> Tuple[List[LecturaSensor], Optional[Tuple[int, int]]]:
     """
     Recupera lecturas de sensores de la base de datos, con opciones de filtrado y paginación.
+    Si se indica `cursor_posicion` (ts, id) se pagina por cursor: se devuelven las lecturas
+    anteriores a esa posición y se ignora `skip`, de modo que cada página cuesta lo mismo
+    sin importar su profundidad.
+    Retorna las lecturas y la posición de la última, para construir el cursor de la página siguiente.
+    """
+    rows, posicion = _consultar_lecturas(_SELECT_LECTURAS, uuid_controlador, id_sensor, uuid_ensayo, skip, limit, cursor_posicion, desde, hasta)
+    return [_lectura_desde_fila(row) for row in rows], posicion
+
+def get_lecturas_sensor_json(
+    uuid_controlador: Optional[uuid.UUID] = None,
+    id_sensor: Optional[int] = None,
+    uuid_ensayo: Optional[uuid.UUID] = None,
+    skip: int = 0,
+    limit: int = 100,
+    cursor_posicion: Optional[Tuple[int, int]] = None,
+    desde: Optional[datetime] = None,
+    hasta: Optional[datetime] = None
+) -> Tuple[bytes, int, Optional[Tuple[int, int]]]:
+    """
+    Igual que get_lecturas_sensor, pero retorna el arreglo JSON ya serializado (idéntico al de
+    List[LecturaSensor]) sin construir modelos, junto con el número de lecturas y la posición de la última.
+    """
+    rows, posicion = _consultar_lecturas(_SELECT_LECTURAS_API, uuid_controlador, id_sensor, uuid_ensayo, skip, limit, cursor_posicion, desde, hasta)
+    return fastjson.filas_a_json(CAMPOS_LECTURA_API, rows), len(rows), posicion
+
+def iter_lecturas_ensayo(uuid_ensayo: uuid.UUID, tamano_lote: int = 5000) -> Iterator[List[tuple]]:
     """
+    Recorre todas las lecturas de un ensayo en orden cronológico, en lotes de `tamano_lote` tuplas
+    (columnas de COLUMNAS_LECTURA) leídos con fetchmany: nunca se carga el resultado completo
+    ni se construye un modelo por fila. Usa conexiones propias, fuera del pool.
+    Incluye las lecturas ya archivadas: se leen primero los archivos mensuales (que tienen el mismo
+    esquema) y al final la base de datos principal.
+    """
+    filtros, params = _filtros_lecturas(uuid_ensayo=uuid_ensayo)
+    columnas = len(COLUMNAS_LECTURA)
+    for ruta in [*get_archivos_lecturas(), None]:
+        with get_export_connection(ruta) as conn:
+            cursor = conn.execute(_SELECT_LECTURAS + filtros + " ORDER BY l.ts, l.id", params)
+            while True:
+                filas = cursor.fetchmany(tamano_lote)
+                if not filas:
+                    break
+                yield [fila[:columnas] for fila in filas]
+
+def iter_series_ensayo(uuid_ensayo: uuid.UUID, tamano_lote: int = 50000) -> Iterator[List[tuple]]:
+    """
+    Recorre las lecturas de un ensayo (incluidas las archivadas) en orden cronológico, en lotes de
+    tuplas (id_sensor, ts, lectura_temperatura, lectura_humedad): solo las columnas numéricas que
+    usan las estadísticas, sin formatear UUIDs ni fechas. Usa conexiones propias, fuera del pool.
+    """
+    filtros, params = _filtros_lecturas(uuid_ensayo=uuid_ensayo)
+    for ruta in [*get_archivos_lecturas(), None]:
+        with get_export_connection(ruta) as conn:
+            cursor = conn.execute(
+                "SELECT l.id_sensor, l.ts, l.lectura_temperatura, l.lectura_humedad FROM lecturas_sensor l" + filtros + " ORDER BY l.ts",
+                params,
+            )
+            while True:
+                filas = cursor.fetchmany(tamano_lote)
+                if not filas:
+                    break
+                yield filas
+
+# Unidades aceptadas en el parámetro `bucket` de la agregación por intervalos
+BUCKET_UNIDADES = {"m": 60, "h": 3600, "d": 86400}
+BUCKET_MINIMO_SEGUNDOS = 60
+
+def bucket_a_segundos(bucket: str) -> int:
+    """
+    Convierte un intervalo como '1m', '15m', '1h' o '1d' en segundos. Lanza ValueError si no es válido.
+    """
+    match = re.fullmatch(r"(\d+)([mhd])", bucket.strip())
+    if not match or int(match.group(1)) == 0:
+        raise ValueError("Intervalo inválido: use un número seguido de m, h o d (p. ej. 1m, 15m, 1h, 1d).")
+    segundos = int(match.group(1)) * BUCKET_UNIDADES[match.group(2)]
+    return max(segundos, BUCKET_MINIMO_SEGUNDOS)
+
+def get_lecturas_agregadas(
+    bucket_segundos: int,
+    uuid_controlador: Optional[uuid.UUID] = None,
+    id_sensor: Optional[int] = None,
+    uuid_ensayo: Optional[uuid.UUID] = None,
+    desde: Optional[datetime] = None,
+    hasta: Optional[datetime] = None
+) -> List[LecturaSensorAgregada]:
+    """
+    Agrupa las lecturas en intervalos de `bucket_segundos` por controlador y sensor, calculando en SQL
+    el mínimo, promedio y máximo de temperatura y humedad de cada intervalo.
+    Los intervalos se alinean a la hora local de Colombia (p. ej. los de 1d empiezan a medianoche).
+    Si el intervalo es un múltiplo de una hora (o de un día) y el rango no corta horas, se calcula
+    a partir de resumen_lecturas en lugar de recorrer las lecturas crudas.
+    """
+    periodo = _periodo_para_bucket(bucket_segundos, desde, hasta)
     with get_db_connection() as conn:
         conn.row_factory = sqlite3.Row
         cursor = conn.cursor()
-        query = "SELECT * FROM lecturas_sensor WHERE 1=1"
-        params = []
-        if uuid_controlador:
-            query += " AND uuid_controlador = ?"
-            params.append(str(uuid_controlador))
-        if id_sensor:
-            query += " AND id_sensor = ?"
-            params.append(id_sensor)
-        if uuid_ensayo:
-            query += " AND uuid_ensayo = ?"
-            params.append(str(uuid_ensayo))
-        query += " ORDER BY timestamp DESC LIMIT ? OFFSET ?"
-        params.extend([limit, skip])
-        cursor.execute(query, params)
-        rows = cursor.fetchall()
-        return [LecturaSensor(**row) for row in rows]
+        if periodo:
+            filtros, params = _filtros_resumen(uuid_controlador, id_sensor, uuid_ensayo, desde, hasta)
+            filtros += " AND periodo = ?"
+            params.append(periodo.value)
+            # substr(inicio, 1, 19) es la hora local sin zona horaria: al tratarla como UTC con
+            # strftime('%s') los intervalos quedan alineados a la hora de Colombia.
+            query = f"""
+                SELECT
+                    uuid_controlador,
+                    id_sensor,
+                    (CAST(strftime('%s', substr(inicio, 1, 19)) AS INTEGER) / ?) * ? AS inicio_local,
+                    SUM(cantidad) AS cantidad,
+                    MIN(temperatura_min) AS temperatura_min,
+                    SUM(temperatura_suma) / SUM(cantidad) AS temperatura_prom,
+                    MAX(temperatura_max) AS temperatura_max,
+                    MIN(humedad_min) AS humedad_min,
+                    SUM(humedad_suma) / SUM(cantidad) AS humedad_prom,
+                    MAX(humedad_max) AS humedad_max
+                FROM resumen_lecturas
+                {filtros}
+                GROUP BY uuid_controlador, id_sensor, inicio_local
+                ORDER BY inicio_local, uuid_controlador, id_sensor
+            """
+        else:
+            filtros, params = _filtros_lecturas(uuid_controlador, id_sensor, uuid_ensayo, desde, hasta)
+            # Segundos de la hora local de Colombia (tratada como UTC), igual que en los resúmenes
+            query = f"""
+                SELECT
+                    c.uuid AS uuid_controlador,
+                    l.id_sensor,
+                    ((l.ts / 1000 - {DESFASE_COLOMBIA_S}) / ?) * ? AS inicio_local,
+                    COUNT(*) AS cantidad,
+                    MIN(l.lectura_temperatura) AS temperatura_min,
+                    AVG(l.lectura_temperatura) AS temperatura_prom,
+                    MAX(l.lectura_temperatura) AS temperatura_max,
+                    MIN(l.lectura_humedad) AS humedad_min,
+                    AVG(l.lectura_humedad) AS humedad_prom,
+                    MAX(l.lectura_humedad) AS humedad_max
+                FROM lecturas_sensor l
+                LEFT JOIN identificadores c ON c.id = l.id_controlador
+                {filtros}
+                GROUP BY l.id_controlador, l.id_sensor, inicio_local
+                ORDER BY inicio_local, uuid_controlador, l.id_sensor
+            """
+        cursor.execute(query, [bucket_segundos, bucket_segundos, *params])
+        return [
+            LecturaSensorAgregada(
+                **{k: row[k] for k in row.keys() if k != "inicio_local"},
+                inicio=_inicio_local_a_datetime(row["inicio_local"]),
+            )
+            for row in cursor.fetchall()
+        ]
 
-def get_latest_lectura_sensor() -> Optional[LecturaSensor]:
+def _inicio_local_a_datetime(inicio_local: int) -> datetime:
+    """Convierte segundos de la hora local de Colombia (tratada como UTC) a un datetime con zona horaria."""
+    return COLOMBIA_TIMEZONE.localize(datetime.fromtimestamp(inicio_local, timezone.utc).replace(tzinfo=None))
+
+def _periodo_para_bucket(bucket_segundos: int, desde: Optional[datetime], hasta: Optional[datetime]) -> Optional[PeriodoResumen]:
     """
-    Obtiene la última lectura de sensor registrada en la base de datos.
+    Elige el periodo de resumen_lecturas con el que se puede responder exactamente una agregación,
+    o None si hay que usar las lecturas crudas.
+    """
+    def alineado(momento: Optional[datetime], segundos: int) -> bool:
+        if momento is None:
+            return True
+        local = datetime.fromisoformat(to_colombia_isoformat(momento)).replace(tzinfo=None)
+        return (local - datetime(1970, 1, 1)).total_seconds() % segundos == 0
+
+    for periodo, segundos in ((PeriodoResumen.dia, 86400), (PeriodoResumen.hora, 3600)):
+        if bucket_segundos % segundos == 0 and alineado(desde, segundos) and alineado(hasta, segundos):
+            return periodo
+    return None
+
+def get_resumen_lecturas(
+    periodo: PeriodoResumen,
+    uuid_controlador: Optional[uuid.UUID] = None,
+    id_sensor: Optional[int] = None,
+    uuid_ensayo: Optional[uuid.UUID] = None,
+    desde: Optional[datetime] = None,
+    hasta: Optional[datetime] = None,
+    skip: int = 0,
+    limit: int = 1000
+) -> List[ResumenLecturas]:
+    """
+    Recupera los resúmenes por hora o por día (por controlador, ensayo y sensor) sin leer las lecturas
+    crudas. El rango [desde, hasta) se aplica sobre el inicio de cada periodo.
     """
     with get_db_connection() as conn:
         conn.row_factory = sqlite3.Row
         cursor = conn.cursor()
-        cursor.execute("SELECT * FROM lecturas_sensor ORDER BY timestamp DESC LIMIT 1")
+        filtros, params = _filtros_resumen(uuid_controlador, id_sensor, uuid_ensayo, desde, hasta)
+        query = f"""
+            SELECT * FROM resumen_lecturas
+            {filtros} AND periodo = ?
+            ORDER BY inicio, uuid_controlador, uuid_ensayo, id_sensor
+            LIMIT ? OFFSET ?
+        """
+        cursor.execute(query, [*params, periodo.value, limit, skip])
+        return [_resumen_desde_fila(row) for row in cursor.fetchall()]
+
+_SELECT_EXTREMOS_RECIENTES = """
+    SELECT uuid_controlador, id_sensor,
+        MIN(temperatura_min), MAX(temperatura_max), MIN(humedad_min), MAX(humedad_max)
+    FROM resumen_lecturas
+    WHERE periodo = 'hora' AND inicio >= ?
+    GROUP BY uuid_controlador, id_sensor
+"""
+
+def get_extremos_recientes(desde: datetime) -> Dict[Tuple[str, int], Tuple[float, float, float, float]]:
+    """
+    Temperatura y humedad mínima y máxima de cada controlador y sensor desde `desde` (inicio de una
+    hora), en una sola consulta sobre los resúmenes por hora: (uuid_controlador, id_sensor) ->
+    (temperatura_min, temperatura_max, humedad_min, humedad_max).
+    """
+    with get_db_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute(_SELECT_EXTREMOS_RECIENTES, (to_colombia_isoformat(desde),))
+        return {(fila[0], fila[1]): fila[2:] for fila in cursor.fetchall()}
+
+def _estadisticas(cantidad: int, suma: Optional[float], suma_cuadrados: Optional[float]) -> Tuple[Optional[float], Optional[float]]:
+    """Promedio y desviación estándar (poblacional) a partir de conteo, suma y suma de cuadrados."""
+    if not cantidad or suma is None:
+        return None, None
+    promedio = suma / cantidad
+    varianza = max(suma_cuadrados / cantidad - promedio * promedio, 0.0)
+    return promedio, math.sqrt(varianza)
+
+def _resumen_desde_fila(row: sqlite3.Row) -> ResumenLecturas:
+    temperatura_prom, temperatura_desv = _estadisticas(row["cantidad"], row["temperatura_suma"], row["temperatura_suma_cuadrados"])
+    humedad_prom, humedad_desv = _estadisticas(row["cantidad"], row["humedad_suma"], row["humedad_suma_cuadrados"])
+    bateria_prom, _ = _estadisticas(row["bateria_cantidad"], row["bateria_suma"], row["bateria_suma_cuadrados"])
+    return ResumenLecturas(
+        periodo=PeriodoResumen(row["periodo"]),
+        inicio=datetime.fromisoformat(row["inicio"]),
+        uuid_controlador=row["uuid_controlador"],
+        uuid_ensayo=row["uuid_ensayo"],
+        id_sensor=row["id_sensor"],
+        cantidad=row["cantidad"],
+        temperatura_min=row["temperatura_min"],
+        temperatura_prom=temperatura_prom,
+        temperatura_max=row["temperatura_max"],
+        temperatura_desv=temperatura_desv,
+        humedad_min=row["humedad_min"],
+        humedad_prom=humedad_prom,
+        humedad_max=row["humedad_max"],
+        humedad_desv=humedad_desv,
+        bateria_min=row["bateria_min"],
+        bateria_prom=bateria_prom,
+        bateria_max=row["bateria_max"],
+    )
+
+# --- Últimas lecturas en memoria ---
+# uuid_controlador -> {id_sensor: última lectura}, más la última lectura global. Se actualizan tras
+# cada commit de insert_lecturas_sensor y se cargan de la base de datos al arrancar, así que
+# /sensor/latest y /controller/{uuid}/latest no consultan SQLite.
+_ultimas_lecturas: Dict[uuid.UUID, Dict[int, LecturaSensor]] = {}
+_ultima_lectura: Optional[LecturaSensor] = None
+_ultimas_cargadas = False
+_ultimas_lock = threading.Lock()
+
+def _registrar_ultimas_lecturas(lecturas: List[LecturaSensor]):
+    """Conserva cada lectura si es la más reciente de su controlador y sensor (a igual hora gana la última guardada)."""
+    global _ultima_lectura
+    with _ultimas_lock:
+        for lectura in lecturas:
+            por_sensor = _ultimas_lecturas.setdefault(lectura.uuid_controlador, {})
+            actual = por_sensor.get(lectura.id_sensor)
+            if actual is None or lectura.timestamp >= actual.timestamp:
+                por_sensor[lectura.id_sensor] = lectura
+            if _ultima_lectura is None or lectura.timestamp >= _ultima_lectura.timestamp:
+                _ultima_lectura = lectura
+
+_SELECT_ULTIMA_POR_SENSOR = _SELECT_LECTURAS + " WHERE l.id_controlador = ? AND l.id_sensor = ? ORDER BY l.ts DESC, l.id DESC LIMIT 1"
+
+def cargar_ultimas_lecturas():
+    """
+    Carga de la base de datos la última lectura de cada controlador y sensor, y la última global.
+    Cada una es una búsqueda en idx_lecturas_controlador_timestamp (o idx_lecturas_timestamp),
+    no un recorrido de la tabla. Las lecturas guardadas mientras tanto no se pierden: se combinan.
+    """
+    global _ultimas_cargadas
+    with get_db_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute(
+            "SELECT i.id FROM controladores c JOIN identificadores i ON i.uuid = c.uuid_controlador"
+        )
+        ids_controladores = [fila[0] for fila in cursor.fetchall()]
+        lecturas = []
+        for id_controlador in ids_controladores:
+            for id_sensor in range(1, 5):
+                cursor.execute(_SELECT_ULTIMA_POR_SENSOR, (id_controlador, id_sensor))
+                row = cursor.fetchone()
+                if row:
+                    lecturas.append(_lectura_desde_fila(row))
+        cursor.execute(_SELECT_LECTURAS + " ORDER BY l.ts DESC, l.id DESC LIMIT 1")
         row = cursor.fetchone()
-        return LecturaSensor(**row) if row else None
+        if row:
+            lecturas.append(_lectura_desde_fila(row))
+    _registrar_ultimas_lecturas(lecturas)
+    _ultimas_cargadas = True
+
+def get_latest_lectura_sensor() -> Optional[LecturaSensor]:
+    """
+    Obtiene la última lectura de sensor registrada (desde memoria).
+    """
+    if not _ultimas_cargadas:
+        cargar_ultimas_lecturas()
+    return _ultima_lectura
+
+def get_latest_lecturas_controlador(uuid_controlador: uuid.UUID) -> List[LecturaSensor]:
+    """
+    Obtiene la última lectura de cada sensor de un controlador (desde memoria), ordenadas por sensor.
+    """
+    if not _ultimas_cargadas:
+        cargar_ultimas_lecturas()
+    with _ultimas_lock:
+        por_sensor = _ultimas_lecturas.get(uuid_controlador, {})
+        return [por_sensor[id_sensor] for id_sensor in sorted(por_sensor)]
+
+def get_latest_lecturas_controladores() -> Dict[uuid.UUID, Dict[int, LecturaSensor]]:
+    """
+    Obtiene la última lectura de cada sensor de todos los controladores (desde memoria), en una copia
+    que se puede recorrer sin tomar el lock.
+    """
+    if not _ultimas_cargadas:
+        cargar_ultimas_lecturas()
+    with _ultimas_lock:
+        return {uuid_controlador: dict(por_sensor) for uuid_controlador, por_sensor in _ultimas_lecturas.items()}
+
+def get_ultima_lectura_controladores() -> Dict[str, int]:
+    """
+    Hora (epoch en milisegundos) de la última lectura de cada controlador registrado, tal como la
+    mantiene la ingesta en controladores.ultima_lectura_ts.
+    """
+    with get_db_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("SELECT uuid_controlador, ultima_lectura_ts FROM controladores WHERE ultima_lectura_ts IS NOT NULL")
+        return dict(cursor.fetchall())
+
+def update_actividad_controladores(inactivo_antes_ms: int) -> int:
+    """
+    En una sola transacción, a partir de la hora de la última lectura que mantiene la ingesta
+    (ultima_lectura_ts): marca Inactivo a los controladores sin lecturas desde `inactivo_antes_ms`
+    (o registrados antes, si nunca enviaron) y devuelve a Activo o En ensayo a los Inactivo que
+    volvieron a reportar. Retorna cuántos controladores cambiaron de estado.
+    """
+    with get_db_connection() as conn:
+        cursor = conn.cursor()
+        try:
+            cursor.execute(
+                """
+                UPDATE controladores SET estado = ?
+                WHERE estado != ?
+                  AND COALESCE(ultima_lectura_ts, CAST(strftime('%s', timestamp_registro) AS INTEGER) * 1000) < ?
+                """,
+                (EstadoControlador.inactivo.value, EstadoControlador.inactivo.value, inactivo_antes_ms),
+            )
+            cambios = cursor.rowcount
+            cursor.execute(
+                """
+                UPDATE controladores
+                SET estado = CASE WHEN uuid_ensayo_activo != uuid_ensayo_generico THEN ? ELSE ? END
+                WHERE estado = ? AND ultima_lectura_ts >= ?
+                """,
+                (EstadoControlador.en_ensayo.value, EstadoControlador.activo.value, EstadoControlador.inactivo.value, inactivo_antes_ms),
+            )
+            cambios += cursor.rowcount
+            conn.commit()
+        except sqlite3.Error as e:
+            conn.rollback()
+            print(f"Error al actualizar la actividad de los controladores: {e}")
+            raise
+    if cambios:
+        _cambiaron_controladores_y_ensayos()
+    return cambios
+
+def get_actividad_controladores() -> List[sqlite3.Row]:
+    """
+    Nombre, estado, batería y hora de la última lectura guardada (ultima_lectura_ts) de todos los
+    controladores: una sola lectura de la tabla controladores.
+    """
+    with get_db_connection() as conn:
+        conn.row_factory = sqlite3.Row
+        cursor = conn.cursor()
+        cursor.execute("SELECT uuid_controlador, nombre_controlador, estado, bateria, ultima_lectura_ts FROM controladores")
+        return cursor.fetchall()
 
 ## Funciones para Controladores
 
@@ -163,6 +907,7 @@ def create_controlador(controlador: ControladorCreate) -> tuple[Controlador, Ens
             )
 
             conn.commit()
+            _cambiaron_controladores_y_ensayos()
 
             # Recuperar y retornar los objetos completos
             created_controlador = get_controlador(uuid_c)
@@ -175,6 +920,15 @@ def create_controlador(controlador: ControladorCreate) -> tuple[Controlador, Ens
             print(f"Error al crear controlador o su ensayo genérico: {e}")
             raise
 
+CAMPOS_CONTROLADOR_API = tuple(Controlador.model_fields)
+
+# Columnas de controladores con el nombre y en el orden de los campos del modelo; la hora de la última
+# lectura se guarda en milisegundos y se presenta como la escribe pydantic
+_SELECT_CONTROLADORES = "SELECT " + ", ".join(
+    f"{_sql_timestamp_pydantic('ultima_lectura_ts')} AS ultima_lectura" if campo == "ultima_lectura" else campo
+    for campo in CAMPOS_CONTROLADOR_API
+) + " FROM controladores"
+
 def get_controladores(skip: int = 0, limit: int = 100) -> List[Controlador]:
     """
     Recupera controladores de la base de datos.
@@ -182,10 +936,43 @@ def get_controladores(skip: int = 0, limit: int = 100) -> List[Controlador]:
     with get_db_connection() as conn:
         conn.row_factory = sqlite3.Row
         cursor = conn.cursor()
-        cursor.execute("SELECT * FROM controladores LIMIT ? OFFSET ?", (limit, skip))
+        cursor.execute(_SELECT_CONTROLADORES + " LIMIT ? OFFSET ?", (limit, skip))
         rows = cursor.fetchall()
         return [Controlador(**{**row, 'estado': EstadoControlador(row['estado'])}) for row in rows]
 
+def get_controladores_json(skip: int = 0, limit: int = 100) -> bytes:
+    """
+    Igual que get_controladores, pero retorna el arreglo JSON ya serializado, sin construir modelos
+    (las columnas se llaman como los campos del modelo y se seleccionan en su orden).
+    """
+    with get_db_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute(_SELECT_CONTROLADORES + " LIMIT ? OFFSET ?", (limit, skip))
+        return fastjson.filas_a_json(CAMPOS_CONTROLADOR_API, cursor.fetchall())
+
+def get_controladores_con_ensayo() -> List[Tuple[Controlador, Optional[Ensayo]]]:
+    """
+    Recupera todos los controladores, por nombre, junto con su ensayo activo, en una sola consulta
+    (LEFT JOIN con ensayos) en lugar de una por controlador.
+    """
+    with get_db_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute(f"""
+            SELECT c.*, {", ".join(f"e.{campo}" for campo in CAMPOS_ENSAYO_API)}
+            FROM ({_SELECT_CONTROLADORES}) c
+            LEFT JOIN ensayos e ON e.uuid_ensayo = c.uuid_ensayo_activo
+            ORDER BY c.nombre_controlador
+        """)
+        resultado = []
+        for row in cursor.fetchall():
+            controlador = dict(zip(CAMPOS_CONTROLADOR_API, row))
+            ensayo = dict(zip(CAMPOS_ENSAYO_API, row[len(CAMPOS_CONTROLADOR_API):]))
+            resultado.append((
+                Controlador(**{**controlador, 'estado': EstadoControlador(controlador['estado'])}),
+                Ensayo(**{**ensayo, 'estado': EstadoEnsayo(ensayo['estado'])}) if ensayo['uuid_ensayo'] else None,
+            ))
+        return resultado
+
 def get_controlador(uuid_controlador: uuid.UUID) -> Optional[Controlador]:
     """
     Recupera un controlador específico por su UUID.
@@ -194,7 +981,7 @@ def get_controlador(uuid_controlador: uuid.UUID) -> Optional[Controlador]:
         conn.row_factory = sqlite3.Row
         cursor = conn.cursor()
         cursor.execute(
-            "SELECT * FROM controladores WHERE uuid_controlador = ?",
+            _SELECT_CONTROLADORES + " WHERE uuid_controlador = ?",
             (str(uuid_controlador),),
         )
         row = cursor.fetchone()
@@ -217,6 +1004,8 @@ def update_controlador_name(uuid_controlador: uuid.UUID, new_name: str) -> Optio
             (new_name, str(uuid_controlador)),
         )
         conn.commit()
+        _cambiaron_controladores_y_ensayos()
+        _invalidar_ensayos_controlador(uuid_controlador)
         if cursor.rowcount > 0:
             return get_controlador(uuid_controlador)
         return None
@@ -268,6 +1057,8 @@ def update_controlador_ensayo(uuid_controlador: uuid.UUID, uuid_ensayo_activo: u
         )
 
         conn.commit()
+        _cambiaron_controladores_y_ensayos()
+        _invalidar_ensayos_controlador(uuid_controlador)
 
         # Recuperar y retornar los objetos actualizados
         updated_controlador = get_controlador(uuid_controlador)
@@ -304,6 +1095,11 @@ def delete_controlador(uuid_controlador: uuid.UUID) -> Optional[Controlador]:
             )
             
             conn.commit()
+            _cambiaron_controladores_y_ensayos()
+            _invalidar_ensayos_controlador(uuid_controlador)
+            metrics.ultima_lectura_controlador.remove(str(uuid_controlador))
+            with _ultimas_lock:
+                _ultimas_lecturas.pop(uuid_controlador, None)
             
             if cursor.rowcount > 0:
                 # Retornar el objeto que se eliminó
@@ -345,6 +1141,7 @@ def create_ensayo(ensayo: EnsayoCreate) -> Ensayo:
             ),
         )
         conn.commit()
+        _cambiaron_controladores_y_ensayos()
         return Ensayo(
             uuid_ensayo=uuid_e,
             nombre_ensayo=ensayo.nombre_ensayo,
@@ -360,17 +1157,32 @@ def get_ensayos(uuid_controlador: Optional[uuid.UUID] = None, skip: int = 0, lim
     with get_db_connection() as conn:
         conn.row_factory = sqlite3.Row
         cursor = conn.cursor()
-        query = "SELECT * FROM ensayos WHERE 1=1"
-        params = []
-        if uuid_controlador:
-            query += " AND uuid_controlador = ?"
-            params.append(str(uuid_controlador))
-        query += " LIMIT ? OFFSET ?"
-        params.extend([limit, skip])
+        query, params = _consulta_ensayos("*", uuid_controlador, skip, limit)
         cursor.execute(query, params)
         rows = cursor.fetchall()
         return [Ensayo(**{**row, 'estado': EstadoEnsayo(row['estado'])}) for row in rows]
 
+def _consulta_ensayos(columnas: str, uuid_controlador: Optional[uuid.UUID], skip: int, limit: int) -> Tuple[str, list]:
+    query = f"SELECT {columnas} FROM ensayos WHERE 1=1"
+    params = []
+    if uuid_controlador:
+        query += " AND uuid_controlador = ?"
+        params.append(str(uuid_controlador))
+    query += " LIMIT ? OFFSET ?"
+    params.extend([limit, skip])
+    return query, params
+
+CAMPOS_ENSAYO_API = tuple(Ensayo.model_fields)
+
+def get_ensayos_json(uuid_controlador: Optional[uuid.UUID] = None, skip: int = 0, limit: int = 100) -> bytes:
+    """
+    Igual que get_ensayos, pero retorna el arreglo JSON ya serializado, sin construir modelos.
+    """
+    with get_db_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute(*_consulta_ensayos(", ".join(CAMPOS_ENSAYO_API), uuid_controlador, skip, limit))
+        return fastjson.filas_a_json(CAMPOS_ENSAYO_API, cursor.fetchall())
+
 def get_ensayo(uuid_ensayo: uuid.UUID) -> Optional[Ensayo]:
     """
     Recupera un ensayo específico por su UUID.
@@ -407,6 +1219,8 @@ def update_ensayo(uuid_ensayo: uuid.UUID, ensayo: EnsayoCreate) -> Optional[Ensa
             ),
         )
         conn.commit()
+        _cambiaron_controladores_y_ensayos()
+        _invalidar_ensayos_de_ensayo(uuid_ensayo)
         if cursor.rowcount > 0:
             return get_ensayo(uuid_ensayo)
         return None
@@ -433,6 +1247,8 @@ def delete_ensayo(uuid_ensayo: uuid.UUID) -> bool:
                 (str(uuid_ensayo),),
             )
             conn.commit()
+            _cambiaron_controladores_y_ensayos()
+            _invalidar_ensayos_de_ensayo(uuid_ensayo)
             return cursor.rowcount > 0
         except sqlite3.IntegrityError as e:
             # Esto podría ocurrir si hay lecturas aún referenciando este ensayo
@@ -462,6 +1278,59 @@ def get_controller_generic_ensayo(uuid_controlador: uuid.UUID) -> Optional[Ensay
             return Ensayo(**{**row, 'estado': EstadoEnsayo(row['estado'])})
         return None
 
+# Caché de resolución de ensayos para la ruta de ingesta:
+# uuid_controlador -> (uuid_ensayo_activo, uuid_ensayo_generico).
+# Se invalida en toda escritura que pueda cambiar esa relación.
+ensayos_controlador_cache = Cache(max_entradas=10000)
+
+def _invalidar_ensayos_controlador(uuid_controlador: uuid.UUID):
+    ensayos_controlador_cache.invalidate(uuid_controlador)
+
+def _invalidar_ensayos_de_ensayo(uuid_ensayo: uuid.UUID):
+    """Invalida los controladores cuyo ensayo activo o genérico es `uuid_ensayo`."""
+    ensayos_controlador_cache.invalidate_where(lambda _, ensayos: uuid_ensayo in ensayos)
+
+def get_ensayos_asignados(uuids_controlador: List[uuid.UUID]) -> Dict[uuid.UUID, uuid.UUID]:
+    """
+    Resuelve el ensayo al que se deben asignar las lecturas de cada controlador: el ensayo activo o,
+    si no tiene, su ensayo genérico. Los controladores que no están en caché se consultan en una
+    sola consulta. Los controladores inexistentes no aparecen en el resultado.
+    """
+    asignados = {}
+    faltantes = []
+    for uuid_controlador in set(uuids_controlador):
+        ensayos = ensayos_controlador_cache.get(uuid_controlador)
+        if ensayos is None:
+            faltantes.append(str(uuid_controlador))
+        else:
+            asignados[uuid_controlador] = ensayos[0] or ensayos[1]
+    if not faltantes:
+        return asignados
+
+    generacion = ensayos_controlador_cache.generacion
+    with get_db_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute(
+            f"""
+            SELECT uuid_controlador, uuid_ensayo_activo, uuid_ensayo_generico
+            FROM controladores
+            WHERE uuid_controlador IN ({", ".join("?" * len(faltantes))})
+            """,
+            faltantes,
+        )
+        for row in cursor.fetchall():
+            uuid_controlador = uuid.UUID(row[0])
+            ensayos = (uuid.UUID(row[1]) if row[1] else None, uuid.UUID(row[2]))
+            ensayos_controlador_cache.set(uuid_controlador, ensayos, generacion)
+            asignados[uuid_controlador] = ensayos[0] or ensayos[1]
+    return asignados
+
+def get_ensayo_asignado(uuid_controlador: uuid.UUID) -> Optional[uuid.UUID]:
+    """
+    Ensayo al que se asignan las lecturas de un controlador, o None si el controlador no existe.
+    """
+    return get_ensayos_asignados([uuid_controlador]).get(uuid_controlador)
+
 def get_running_ensayo_for_controlador(uuid_controlador: uuid.UUID) -> Optional[Ensayo]:
     """
     Recupera el ensayo que se encuentra en estado 'Corriendo' para un controlador específico.
@@ -504,6 +1373,42 @@ def create_user(user: UserCreate, hashed_password: str) -> User:
                 raise ValueError("El correo electrónico ya está registrado.")
             raise e
 
+def update_user_password(uuid_usuario: uuid.UUID, hashed_password: str) -> bool:
+    """
+    Reemplaza la contraseña hasheada de un usuario. Sube la versión del usuario, con lo que
+    los tokens verificados en caché dejan de servir y se vuelven a validar contra la base de datos.
+    """
+    with get_db_connection() as conn:
+        cursor = conn.cursor()
+        try:
+            cursor.execute(
+                "UPDATE users SET hashed_password = ? WHERE uuid_usuario = ?",
+                (hashed_password, str(uuid_usuario)),
+            )
+            conn.commit()
+        except sqlite3.Error as e:
+            conn.rollback()
+            print(f"Error al actualizar la contraseña del usuario: {e}")
+            raise
+    versiones.cambiar("usuarios", {uuid_usuario})
+    return cursor.rowcount > 0
+
+def delete_user(uuid_usuario: uuid.UUID) -> bool:
+    """
+    Elimina un usuario. Sube la versión del usuario para que sus tokens en caché dejen de ser válidos.
+    """
+    with get_db_connection() as conn:
+        cursor = conn.cursor()
+        try:
+            cursor.execute("DELETE FROM users WHERE uuid_usuario = ?", (str(uuid_usuario),))
+            conn.commit()
+        except sqlite3.Error as e:
+            conn.rollback()
+            print(f"Error al eliminar usuario: {e}")
+            raise
+    versiones.cambiar("usuarios", {uuid_usuario})
+    return cursor.rowcount > 0
+
 def get_user_by_username(nombre_usuario: str) -> Optional[UserInDB]:
     """
     Recupera un usuario por su nombre de usuario.
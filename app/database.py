@@ -1,10 +1,20 @@
 # database.py
+import asyncio
+import os
+import queue
 import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 from contextlib import contextmanager
-from datetime import datetime
+from datetime import datetime, timedelta, timezone
 import pytz
 import uuid
 from pathlib import Path # Importar Path
+from typing import List, Optional
+
+import metrics
+import profiling
 
 # Define la zona horaria de Colombia
 COLOMBIA_TIMEZONE = pytz.timezone('America/Bogota')
@@ -23,18 +33,138 @@ BASE_DIR = Path(__file__).resolve().parent
 DATABASE_DIR = BASE_DIR / "data"
 # Asegurarse de que el directorio 'data' exista
 DATABASE_DIR.mkdir(parents=True, exist_ok=True)
-# Ruta completa al archivo de la base de datos
-DATABASE_URL = DATABASE_DIR / "sensores.db"
+# Ruta completa al archivo de la base de datos (se puede cambiar con SENSORES_DB_PATH, p. ej. en pruebas)
+DATABASE_URL = Path(os.getenv("SENSORES_DB_PATH", DATABASE_DIR / "sensores.db"))
+# Directorio de las bases de datos de archivo de lecturas antiguas, una por mes (ver archive.py)
+ARCHIVO_DIR = Path(os.getenv("ARCHIVO_DIR", DATABASE_URL.parent / "archivo"))
+
+# --- Configuración del pool de conexiones ---
+# Número máximo de conexiones abiertas simultáneamente contra el archivo SQLite
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))
+# Segundos que se espera por una conexión libre antes de fallar
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "10"))
+# Tamaño de la caché de páginas por conexión (KiB)
+DB_CACHE_SIZE_KIB = int(os.getenv("DB_CACHE_SIZE_KIB", "8192"))
+# Bytes del archivo que se leen mediante memoria mapeada
+DB_MMAP_SIZE = int(os.getenv("DB_MMAP_SIZE", str(64 * 1024 * 1024)))
+# Milisegundos que una conexión espera por un bloqueo antes de devolver SQLITE_BUSY
+DB_BUSY_TIMEOUT_MS = int(os.getenv("DB_BUSY_TIMEOUT_MS", "5000"))
+# Hilos dedicados a ejecutar las operaciones del CRUD fuera del event loop de uvicorn.
+# Por defecto uno por conexión del pool, para que ningún hilo espere por una conexión.
+DB_THREADS = int(os.getenv("DB_THREADS", str(DB_POOL_SIZE)))
 
 def get_colombia_timestamp():
     return datetime.now(COLOMBIA_TIMEZONE).isoformat()
 
+def _configure_connection(conn: sqlite3.Connection):
+    """
+    Aplica una sola vez, al abrir la conexión, los PRAGMA de rendimiento.
+    WAL permite que los lectores no bloqueen las inserciones de los sensores (y viceversa);
+    synchronous=NORMAL es seguro en modo WAL y evita un fsync por cada commit.
+    """
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute(f"PRAGMA cache_size=-{DB_CACHE_SIZE_KIB}")
+    conn.execute(f"PRAGMA mmap_size={DB_MMAP_SIZE}")
+    conn.execute(f"PRAGMA busy_timeout={DB_BUSY_TIMEOUT_MS}")
+    conn.execute("PRAGMA temp_store=MEMORY")
+
+class ConnectionPool:
+    """
+    Pool acotado y seguro entre hilos de conexiones SQLite de larga duración.
+    Las conexiones se crean bajo demanda hasta `size` y se reutilizan en lugar de abrirse
+    y cerrarse en cada operación del CRUD.
+    """
+
+    def __init__(self, database, size: int = DB_POOL_SIZE, timeout: float = DB_POOL_TIMEOUT):
+        self.database = database
+        self.size = size
+        self.timeout = timeout
+        self._idle = queue.LifoQueue(maxsize=size) # LIFO: reutiliza la conexión con la caché más caliente
+        self._lock = threading.Lock()
+        self._created = 0
+
+    def _connect(self) -> sqlite3.Connection:
+        # check_same_thread=False: la conexión puede pasar de un hilo a otro, pero el pool
+        # garantiza que solo un hilo la use a la vez.
+        conn = sqlite3.connect(
+            self.database, timeout=DB_BUSY_TIMEOUT_MS / 1000, check_same_thread=False,
+            factory=profiling.fabrica_conexion(), # Registra las consultas lentas (ver profiling.py)
+        )
+        _configure_connection(conn)
+        return conn
+
+    def acquire(self) -> sqlite3.Connection:
+        """Obtiene una conexión libre, creando una nueva si aún no se alcanza el tamaño del pool."""
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+        with self._lock:
+            if self._created < self.size:
+                self._created += 1
+                try:
+                    return self._connect()
+                except Exception:
+                    self._created -= 1
+                    raise
+        try:
+            return self._idle.get(timeout=self.timeout)
+        except queue.Empty:
+            raise sqlite3.OperationalError(f"No hay conexiones libres en el pool tras {self.timeout} s de espera.")
+
+    def release(self, conn: sqlite3.Connection):
+        """Devuelve una conexión al pool dejándola sin transacción abierta y con la configuración por defecto."""
+        if conn.in_transaction:
+            conn.rollback()
+        conn.row_factory = None
+        self._idle.put_nowait(conn)
+
+    def close(self):
+        """
+        Cierra las conexiones libres (p. ej. al apagar el servidor). Si el pool se vuelve a usar,
+        abre conexiones nuevas bajo demanda.
+        """
+        with self._lock:
+            while True:
+                try:
+                    self._idle.get_nowait().close()
+                except queue.Empty:
+                    break
+                self._created -= 1
+
+# Pool global usado por el CRUD
+pool = ConnectionPool(DATABASE_URL)
+# Conexión tomada por el hilo actual, para que las llamadas anidadas del CRUD la reutilicen
+_local = threading.local()
+
+# Pool de hilos para las operaciones de base de datos (sqlite3 es bloqueante)
+db_executor = ThreadPoolExecutor(max_workers=DB_THREADS, thread_name_prefix="sqlite")
+
+async def run_db(func, *args, **kwargs):
+    """
+    Ejecuta una función síncrona del CRUD en el pool de hilos de base de datos y espera su resultado
+    sin bloquear el event loop, de modo que otras peticiones se sigan atendiendo mientras tanto.
+    """
+    loop = asyncio.get_running_loop()
+    encolada = time.perf_counter()
+
+    def medida():
+        inicio = time.perf_counter()
+        metrics.espera_hilo_db.observe(inicio - encolada)
+        try:
+            return func(*args, **kwargs)
+        finally:
+            metrics.duracion_crud.observe(time.perf_counter() - inicio, getattr(func, "__name__", "otra"))
+
+    return await loop.run_in_executor(db_executor, medida)
+
 def init_db():
     """
     Inicializa la base de datos creando las tablas si no existen.
     La creación de ensayos genéricos específicos por controlador se manejará en el CRUD.
     """
-    with sqlite3.connect(DATABASE_URL) as conn: # Usar DATABASE_URL como Path o string
+    with get_db_connection() as conn:
         cursor = conn.cursor()
 
         # Tabla para los usuarios (la creamos primero por si se necesita para otras tablas)
@@ -76,7 +206,8 @@ def init_db():
             )
         """)
 
-        # Tabla para las lecturas de los sensores
+        # Tabla para las lecturas de los sensores (esquema original: la migración 004 la convierte
+        # al formato compacto con llaves enteras y timestamps en milisegundos)
         cursor.execute("""
             CREATE TABLE IF NOT EXISTS lecturas_sensor (
                 uuid_lectura TEXT PRIMARY KEY,        -- Llave primaria única para identificar la lectura
@@ -93,18 +224,336 @@ def init_db():
         """)
         conn.commit() # Guarda los cambios en la base de datos
 
+        apply_migrations(conn)
+
+# --- Migraciones de esquema ---
+# Cada migración se aplica una sola vez y en orden. La versión aplicada se guarda en
+# PRAGMA user_version, por lo que se pueden ejecutar sin riesgo sobre un sensores.db existente.
+
+def _migracion_001_indices_lecturas(cursor: sqlite3.Cursor):
+    """
+    Índices compuestos para las consultas del dashboard: filtrar por controlador o por ensayo
+    y ordenar por timestamp sin recorrer toda la tabla ni ordenar en memoria.
+    """
+    cursor.execute("""
+        CREATE INDEX IF NOT EXISTS idx_lecturas_controlador_timestamp
+        ON lecturas_sensor (uuid_controlador, timestamp)
+    """)
+    cursor.execute("""
+        CREATE INDEX IF NOT EXISTS idx_lecturas_ensayo_timestamp
+        ON lecturas_sensor (uuid_ensayo, timestamp)
+    """)
+    # Última lectura global y listados sin filtro
+    cursor.execute("""
+        CREATE INDEX IF NOT EXISTS idx_lecturas_timestamp
+        ON lecturas_sensor (timestamp)
+    """)
+
+def _migracion_002_indices_keyset(cursor: sqlite3.Cursor):
+    """
+    Agrega uuid_lectura como desempate al final de los índices de timestamp, para que la
+    paginación por cursor (timestamp, uuid_lectura) sea un solo recorrido del índice.
+    """
+    for nombre, columnas in (
+        ("idx_lecturas_controlador_timestamp", "uuid_controlador, timestamp, uuid_lectura"),
+        ("idx_lecturas_ensayo_timestamp", "uuid_ensayo, timestamp, uuid_lectura"),
+        ("idx_lecturas_timestamp", "timestamp, uuid_lectura"),
+    ):
+        cursor.execute(f"DROP INDEX IF EXISTS {nombre}")
+        cursor.execute(f"CREATE INDEX {nombre} ON lecturas_sensor ({columnas})")
+
+def _migracion_003_resumen_lecturas(cursor: sqlite3.Cursor):
+    """
+    Tabla de resúmenes por hora y por día (por controlador, ensayo y sensor), mantenida en la misma
+    transacción que cada inserción de lecturas. Guarda conteo, suma, mínimo, máximo y suma de
+    cuadrados para poder calcular promedio y desviación estándar sin leer las lecturas crudas.
+    Se llena a partir de las lecturas ya existentes.
+    """
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS resumen_lecturas (
+            periodo TEXT NOT NULL,                -- 'hora' o 'dia'
+            inicio TEXT NOT NULL,                 -- Inicio del periodo en ISO8601 huso horario de Colombia UTC-5
+            uuid_controlador TEXT NOT NULL,
+            uuid_ensayo TEXT NOT NULL,
+            id_sensor INTEGER NOT NULL,
+            cantidad INTEGER NOT NULL,
+            temperatura_suma REAL NOT NULL,
+            temperatura_min REAL NOT NULL,
+            temperatura_max REAL NOT NULL,
+            temperatura_suma_cuadrados REAL NOT NULL,
+            humedad_suma REAL NOT NULL,
+            humedad_min REAL NOT NULL,
+            humedad_max REAL NOT NULL,
+            humedad_suma_cuadrados REAL NOT NULL,
+            bateria_cantidad INTEGER NOT NULL,    -- Lecturas que reportaron batería (puede ser NULL)
+            bateria_suma REAL,
+            bateria_min REAL,
+            bateria_max REAL,
+            bateria_suma_cuadrados REAL,
+            PRIMARY KEY (periodo, uuid_controlador, uuid_ensayo, id_sensor, inicio)
+        )
+    """)
+    cursor.execute("""
+        CREATE INDEX IF NOT EXISTS idx_resumen_ensayo
+        ON resumen_lecturas (periodo, uuid_ensayo, inicio)
+    """)
+    for periodo, inicio in (
+        ("hora", "substr(timestamp, 1, 13) || ':00:00' || substr(timestamp, -6)"),
+        ("dia", "substr(timestamp, 1, 10) || 'T00:00:00' || substr(timestamp, -6)"),
+    ):
+        cursor.execute(f"""
+            INSERT OR REPLACE INTO resumen_lecturas
+            SELECT
+                '{periodo}', {inicio}, uuid_controlador, uuid_ensayo, id_sensor,
+                COUNT(*),
+                SUM(lectura_temperatura), MIN(lectura_temperatura), MAX(lectura_temperatura),
+                SUM(lectura_temperatura * lectura_temperatura),
+                SUM(lectura_humedad), MIN(lectura_humedad), MAX(lectura_humedad),
+                SUM(lectura_humedad * lectura_humedad),
+                COUNT(lectura_bateria),
+                SUM(lectura_bateria), MIN(lectura_bateria), MAX(lectura_bateria),
+                SUM(lectura_bateria * lectura_bateria)
+            FROM lecturas_sensor
+            WHERE uuid_ensayo IS NOT NULL
+            GROUP BY 2, uuid_controlador, uuid_ensayo, id_sensor
+        """)
+
+EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+def to_epoch_ms(momento: datetime) -> int:
+    """
+    Convierte una fecha a milisegundos desde 1970-01-01 UTC (formato de lecturas_sensor.ts).
+    Las fechas sin zona horaria se asumen en hora de Colombia.
+    """
+    if momento.tzinfo is None:
+        momento = COLOMBIA_TIMEZONE.localize(momento)
+    return (momento - EPOCH) // timedelta(milliseconds=1)
+
+def _uuid_a_bytes(valor: str) -> bytes:
+    """UUID de texto a sus 16 bytes. Valores que no son UUID (datos antiguos) se convierten con uuid5."""
+    try:
+        return uuid.UUID(valor).bytes
+    except ValueError:
+        return uuid.uuid5(uuid.NAMESPACE_OID, valor).bytes
+
+# Esquema compacto de lecturas_sensor. AUTOINCREMENT impide que SQLite reutilice el id más alto
+# después de borrarlo: las lecturas archivadas (archive.py) conservan su id en el archivo mensual
+# y una lectura nueva no puede recibir la misma llave.
+_CREAR_LECTURAS_COMPACTAS = """
+    CREATE TABLE {tabla} (
+        id INTEGER PRIMARY KEY AUTOINCREMENT, -- Alias del rowid, nunca se reutiliza
+        uuid_lectura BLOB NOT NULL,           -- UUID de la lectura (16 bytes)
+        id_controlador INTEGER NOT NULL,      -- identificadores.id del controlador
+        id_ensayo INTEGER,                    -- identificadores.id del ensayo
+        id_sensor INTEGER NOT NULL,           -- Número del 1-4 para identificar el sensor
+        ts INTEGER NOT NULL,                  -- Milisegundos desde 1970-01-01 UTC
+        lectura_temperatura REAL NOT NULL,    -- Lectura de temperatura en °C
+        lectura_humedad REAL NOT NULL,        -- Porcentaje de humedad relativa del aire
+        lectura_bateria REAL                  -- Voltaje de batería reportado
+    )
+"""
+
+def _reemplazar_lecturas_sensor(cursor: sqlite3.Cursor, tabla: str):
+    """Reemplaza lecturas_sensor por `tabla`, ya llena, y crea sus índices."""
+    cursor.execute("DROP TABLE lecturas_sensor")
+    cursor.execute(f"ALTER TABLE {tabla} RENAME TO lecturas_sensor")
+    # Cada índice incluye el rowid al final, que sirve de desempate para la paginación por cursor
+    cursor.execute("CREATE INDEX idx_lecturas_controlador_timestamp ON lecturas_sensor (id_controlador, ts)")
+    cursor.execute("CREATE INDEX idx_lecturas_ensayo_timestamp ON lecturas_sensor (id_ensayo, ts)")
+    cursor.execute("CREATE INDEX idx_lecturas_timestamp ON lecturas_sensor (ts)")
+
+def _migracion_004_lecturas_compactas(cursor: sqlite3.Cursor):
+    """
+    Formato compacto para lecturas_sensor: llave INTEGER (rowid, las inserciones siempre van al final
+    del B-tree), uuid_lectura en 16 bytes, controlador y ensayo como enteros de la tabla identificadores
+    y el timestamp en milisegundos desde 1970 (UTC). La API sigue presentando UUID y hora ISO 8601
+    de Colombia. identificadores no se borra nunca, así las lecturas de un controlador o ensayo
+    eliminado conservan su UUID.
+    """
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS identificadores (
+            id INTEGER PRIMARY KEY,               -- Llave corta usada en lecturas_sensor
+            uuid TEXT NOT NULL UNIQUE             -- UUID del controlador o del ensayo
+        )
+    """)
+    cursor.execute("""
+        INSERT OR IGNORE INTO identificadores (uuid)
+        SELECT uuid_controlador FROM lecturas_sensor
+        UNION SELECT uuid_ensayo FROM lecturas_sensor WHERE uuid_ensayo IS NOT NULL
+    """)
+    cursor.execute(_CREAR_LECTURAS_COMPACTAS.format(tabla="lecturas_sensor_compacta"))
+    ids = dict(cursor.execute("SELECT uuid, id FROM identificadores").fetchall())
+    # Se copian en orden cronológico para que el rowid siga el orden de llegada
+    origen = cursor.connection.execute("""
+        SELECT uuid_lectura, uuid_controlador, uuid_ensayo, id_sensor, timestamp,
+               lectura_temperatura, lectura_humedad, lectura_bateria
+        FROM lecturas_sensor ORDER BY timestamp, uuid_lectura
+    """)
+    while True:
+        filas = origen.fetchmany(10000)
+        if not filas:
+            break
+        cursor.executemany(
+            "INSERT INTO lecturas_sensor_compacta VALUES (NULL, ?, ?, ?, ?, ?, ?, ?, ?)",
+            [
+                (
+                    _uuid_a_bytes(uuid_lectura),
+                    ids[uuid_controlador],
+                    ids.get(uuid_ensayo),
+                    id_sensor,
+                    to_epoch_ms(datetime.fromisoformat(timestamp)),
+                    temperatura,
+                    humedad,
+                    bateria,
+                )
+                for uuid_lectura, uuid_controlador, uuid_ensayo, id_sensor, timestamp, temperatura, humedad, bateria in filas
+            ],
+        )
+    _reemplazar_lecturas_sensor(cursor, "lecturas_sensor_compacta")
+
+def _migracion_005_ultima_lectura_controlador(cursor: sqlite3.Cursor):
+    """
+    Hora (epoch en milisegundos) de la última lectura recibida de cada controlador, que mantiene la
+    ingesta y usa el monitor de actividad (heartbeat.py) para marcarlos Inactivo sin recorrer lecturas_sensor.
+    Se llena con la última lectura existente de cada controlador.
+    """
+    cursor.execute("ALTER TABLE controladores ADD COLUMN ultima_lectura_ts INTEGER")
+    cursor.execute("""
+        UPDATE controladores SET ultima_lectura_ts = (
+            SELECT MAX(l.ts) FROM lecturas_sensor l
+            JOIN identificadores i ON i.id = l.id_controlador
+            WHERE i.uuid = controladores.uuid_controlador
+        )
+    """)
+
+def _migracion_006_ultimos_valores_controlador(cursor: sqlite3.Cursor):
+    """
+    Última temperatura y humedad de cada sensor en controladores, que la ingesta mantiene junto con
+    la batería y ultima_lectura_ts en la misma transacción que las lecturas: el listado de controladores
+    muestra el estado de la flota con una sola lectura de esa tabla. Se llena con las últimas lecturas
+    existentes (una búsqueda en idx_lecturas_controlador_timestamp por controlador y sensor).
+    """
+    sensores = range(1, 5)
+    for n in sensores:
+        cursor.execute(f"ALTER TABLE controladores ADD COLUMN temperatura_sensor_{n} REAL")
+        cursor.execute(f"ALTER TABLE controladores ADD COLUMN humedad_sensor_{n} REAL")
+    ultima = """(
+        SELECT l.{columna} FROM lecturas_sensor l
+        WHERE l.id_controlador = (SELECT id FROM identificadores WHERE uuid = controladores.uuid_controlador)
+          AND {condicion}
+        ORDER BY l.ts DESC LIMIT 1
+    )"""
+    asignaciones = [
+        f"{campo}_sensor_{n} = " + ultima.format(columna=f"lectura_{campo}", condicion=f"l.id_sensor = {n}")
+        for n in sensores for campo in ("temperatura", "humedad")
+    ]
+    asignaciones.append("bateria = COALESCE(" + ultima.format(columna="lectura_bateria", condicion="l.lectura_bateria IS NOT NULL") + ", bateria)")
+    cursor.execute("UPDATE controladores SET " + ", ".join(asignaciones))
+
+def _migracion_007_indice_resumen_inicio(cursor: sqlite3.Cursor):
+    """
+    Índice de los resúmenes por periodo e inicio, para leer las últimas horas de todos los
+    controladores (el panel general) sin recorrer el historial completo de resúmenes.
+    """
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_resumen_inicio ON resumen_lecturas (periodo, inicio)")
+
+def _migracion_008_llaves_lecturas_sin_reutilizar(cursor: sqlite3.Cursor):
+    """
+    Reconstruye lecturas_sensor con AUTOINCREMENT si se creó sin él (la migración 004 original): tras
+    archivar las lecturas más recientes, SQLite entregaba sus ids a las lecturas nuevas y el archivo
+    mensual, que ya tenía esas llaves, las descartaba. La secuencia arranca después del id más alto
+    de sensores.db y de los archivos mensuales existentes.
+    """
+    esquema = cursor.execute("SELECT sql FROM sqlite_master WHERE type = 'table' AND name = 'lecturas_sensor'").fetchone()[0]
+    if "AUTOINCREMENT" not in esquema.upper():
+        cursor.execute(_CREAR_LECTURAS_COMPACTAS.format(tabla="lecturas_sensor_autoincremento"))
+        cursor.execute("INSERT INTO lecturas_sensor_autoincremento SELECT * FROM lecturas_sensor")
+        _reemplazar_lecturas_sensor(cursor, "lecturas_sensor_autoincremento")
+    ultimo_id = cursor.execute("SELECT COALESCE(MAX(id), 0) FROM lecturas_sensor").fetchone()[0]
+    for ruta in get_archivos_lecturas():
+        archivo = sqlite3.connect(ruta)
+        try:
+            ultimo_id = max(ultimo_id, archivo.execute("SELECT COALESCE(MAX(id), 0) FROM lecturas_sensor").fetchone()[0])
+        finally:
+            archivo.close()
+    cursor.execute("DELETE FROM sqlite_sequence WHERE name = 'lecturas_sensor'")
+    cursor.execute("INSERT INTO sqlite_sequence (name, seq) VALUES ('lecturas_sensor', ?)", (ultimo_id,))
+
+# La versión de cada migración es su posición en la lista (empezando en 1)
+MIGRATIONS = [
+    _migracion_001_indices_lecturas,
+    _migracion_002_indices_keyset,
+    _migracion_003_resumen_lecturas,
+    _migracion_004_lecturas_compactas,
+    _migracion_005_ultima_lectura_controlador,
+    _migracion_006_ultimos_valores_controlador,
+    _migracion_007_indice_resumen_inicio,
+    _migracion_008_llaves_lecturas_sin_reutilizar,
+]
+
+def apply_migrations(conn: sqlite3.Connection):
+    """
+    Aplica, cada una en su propia transacción, las migraciones pendientes según PRAGMA user_version.
+    """
+    cursor = conn.cursor()
+    for version, migracion in enumerate(MIGRATIONS, start=1):
+        # BEGIN IMMEDIATE toma el bloqueo de escritura antes de leer la versión, así dos procesos
+        # que arrancan a la vez no aplican la misma migración dos veces.
+        cursor.execute("BEGIN IMMEDIATE")
+        try:
+            if cursor.execute("PRAGMA user_version").fetchone()[0] >= version:
+                conn.rollback()
+                continue
+            migracion(cursor)
+            cursor.execute(f"PRAGMA user_version = {version}")
+            conn.commit()
+        except sqlite3.Error:
+            conn.rollback()
+            raise
+
 @contextmanager
 def get_db_connection():
     """
-    Proporciona una conexión a la base de datos SQLite.
-    Utiliza un context manager para asegurar que la conexión se cierre automáticamente.
-    Esto ayuda a mantener la estabilidad y gestionar el pool de conexiones de forma implícita.
+    Proporciona una conexión del pool de conexiones SQLite.
+    Utiliza un context manager para asegurar que la conexión vuelva al pool al salir del bloque.
+    Si el hilo actual ya tiene una conexión (llamadas anidadas del CRUD), se reutiliza la misma
+    en lugar de tomar una segunda del pool.
     """
-    conn = sqlite3.connect(DATABASE_URL) # Usar DATABASE_URL como Path o string
+    conn = getattr(_local, "conn", None)
+    if conn is not None:
+        yield conn
+        return
+
+    inicio = time.perf_counter()
+    conn = pool.acquire()
+    metrics.espera_conexion.observe(time.perf_counter() - inicio)
+    _local.conn = conn
     try:
         yield conn # Retorna la conexión para ser usada
     finally:
-        conn.close() # Asegura que la conexión se cierre al salir del bloque 'with'
+        _local.conn = None
+        pool.release(conn) # Devuelve la conexión al pool al salir del bloque 'with'
+
+def get_archivos_lecturas() -> List[Path]:
+    """Bases de datos de archivo existentes, de la más antigua a la más reciente."""
+    if not ARCHIVO_DIR.is_dir():
+        return []
+    return sorted(ARCHIVO_DIR.glob("lecturas_*.db"))
+
+@contextmanager
+def get_export_connection(ruta: Optional[Path] = None):
+    """
+    Proporciona una conexión propia, fuera del pool, para lecturas largas como las exportaciones:
+    así un cliente descargando un ensayo completo no ocupa una de las conexiones del CRUD.
+    La conexión puede avanzar desde distintos hilos (una iteración a la vez).
+    `ruta` permite abrir una base de datos de archivo en lugar de la principal.
+    """
+    conn = sqlite3.connect(ruta or DATABASE_URL, timeout=DB_BUSY_TIMEOUT_MS / 1000, check_same_thread=False)
+    try:
+        _configure_connection(conn)
+        yield conn
+    finally:
+        conn.close()
 
 # Inicializa la base de datos al importar este módulo
 init_db()
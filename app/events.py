@@ -0,0 +1,116 @@
+# events.py
+import asyncio
+import os
+import time
+from collections import deque
+from typing import AsyncIterator, List, Optional
+import uuid
+
+from models import LecturaSensor
+
+# --- Configuración del stream de lecturas (Server-Sent Events) ---
+# Eventos pendientes por suscriptor; si un cliente lento llena su buffer se descartan los más antiguos
+# (el cliente puede recuperarlos reconectándose con Last-Event-ID mientras sigan en el historial).
+STREAM_BUFFER_SUSCRIPTOR = int(os.getenv("STREAM_BUFFER_SUSCRIPTOR", "256"))
+# Eventos recientes que se conservan para reanudar desde Last-Event-ID
+STREAM_HISTORIAL = int(os.getenv("STREAM_HISTORIAL", "2000"))
+# Máximo de suscriptores simultáneos
+STREAM_MAX_SUSCRIPTORES = int(os.getenv("STREAM_MAX_SUSCRIPTORES", "200"))
+# Segundos entre comentarios de keep-alive (evitan que los proxies cierren la conexión)
+STREAM_KEEPALIVE_S = float(os.getenv("STREAM_KEEPALIVE_S", "15"))
+
+class Suscriptor:
+    """
+    Cliente conectado al stream, con su filtro y su buffer acotado de eventos pendientes.
+    """
+
+    def __init__(self, uuid_controlador: Optional[uuid.UUID], tamano_buffer: int):
+        self.uuid_controlador = uuid_controlador
+        self.pendientes: "deque[tuple[int, str]]" = deque(maxlen=tamano_buffer)
+        self.descartados = 0
+        self._evento = asyncio.Event()
+
+    def acepta(self, lectura: LecturaSensor) -> bool:
+        return self.uuid_controlador is None or lectura.uuid_controlador == self.uuid_controlador
+
+    def agregar(self, id_evento: int, datos: str):
+        if len(self.pendientes) == self.pendientes.maxlen:
+            self.descartados += 1
+        self.pendientes.append((id_evento, datos))
+        self._evento.set()
+
+    async def esperar(self, timeout: float) -> bool:
+        """Espera nuevos eventos; retorna False si pasó `timeout` sin ninguno."""
+        try:
+            await asyncio.wait_for(self._evento.wait(), timeout)
+        except asyncio.TimeoutError:
+            return False
+        self._evento.clear()
+        return True
+
+class DifusorLecturas:
+    """
+    Difunde a los clientes suscritos cada lectura aceptada por la API.
+    Los identificadores de evento parten del tiempo de arranque en milisegundos, así siguen siendo
+    crecientes después de reiniciar el servidor y un Last-Event-ID antiguo no repite eventos.
+    Debe usarse únicamente desde el event loop.
+    """
+
+    def __init__(self, historial: int = STREAM_HISTORIAL, tamano_buffer: int = STREAM_BUFFER_SUSCRIPTOR, max_suscriptores: int = STREAM_MAX_SUSCRIPTORES):
+        self.tamano_buffer = tamano_buffer
+        self.max_suscriptores = max_suscriptores
+        self._ultimo_id = int(time.time() * 1000)
+        self._historial: "deque[tuple[int, LecturaSensor, str]]" = deque(maxlen=historial)
+        self._suscriptores: List[Suscriptor] = []
+
+    def publicar(self, lecturas: List[LecturaSensor]):
+        """Publica lecturas recién aceptadas a los suscriptores interesados."""
+        for lectura in lecturas:
+            self._ultimo_id += 1
+            datos = lectura.model_dump_json()
+            self._historial.append((self._ultimo_id, lectura, datos))
+            for suscriptor in self._suscriptores:
+                if suscriptor.acepta(lectura):
+                    suscriptor.agregar(self._ultimo_id, datos)
+
+    def suscribir(self, uuid_controlador: Optional[uuid.UUID], ultimo_id: Optional[int] = None) -> Optional[Suscriptor]:
+        """
+        Registra un suscriptor. Si se indica `ultimo_id`, se le entregan primero los eventos
+        posteriores que sigan en el historial. Retorna None si se alcanzó el máximo de suscriptores.
+        """
+        if len(self._suscriptores) >= self.max_suscriptores:
+            return None
+        suscriptor = Suscriptor(uuid_controlador, self.tamano_buffer)
+        if ultimo_id is not None:
+            for id_evento, lectura, datos in self._historial:
+                if id_evento > ultimo_id and suscriptor.acepta(lectura):
+                    suscriptor.agregar(id_evento, datos)
+        self._suscriptores.append(suscriptor)
+        return suscriptor
+
+    def desuscribir(self, suscriptor: Suscriptor):
+        if suscriptor in self._suscriptores:
+            self._suscriptores.remove(suscriptor)
+
+    @property
+    def suscriptores(self) -> int:
+        return len(self._suscriptores)
+
+async def stream_sse(difusor: DifusorLecturas, suscriptor: Suscriptor, desconectado) -> AsyncIterator[str]:
+    """
+    Genera el stream en formato text/event-stream para un suscriptor hasta que el cliente se desconecta.
+    `desconectado` es una corrutina sin argumentos que indica si el cliente cerró la conexión.
+    """
+    try:
+        yield "retry: 3000\n\n"
+        while not await desconectado():
+            while suscriptor.pendientes:
+                id_evento, datos = suscriptor.pendientes.popleft()
+                yield f"id: {id_evento}\nevent: lectura\ndata: {datos}\n\n"
+            if not await suscriptor.esperar(STREAM_KEEPALIVE_S):
+                yield ": keep-alive\n\n"
+    finally:
+        difusor.desuscribir(suscriptor)
+
+# Difusor global de lecturas
+difusor = DifusorLecturas()
@@ -0,0 +1,112 @@
+# export.py
+import csv
+import io
+import json
+import os
+from typing import Iterable, Iterator, List
+import uuid
+
+import crud
+from models import FormatoExportacion
+
+# pyarrow (requirements.txt) solo se usa para exportar en Parquet; si falta, ese formato responde 501
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+    pq = None
+
+# Filas leídas de SQLite por lote (y por grupo de filas en Parquet); la memoria usada por una
+# exportación depende de este valor y no del tamaño del ensayo.
+EXPORT_LOTE_FILAS = int(os.getenv("EXPORT_LOTE_FILAS", "5000"))
+
+TIPOS_CONTENIDO = {
+    FormatoExportacion.csv: "text/csv; charset=utf-8",
+    FormatoExportacion.ndjson: "application/x-ndjson",
+    FormatoExportacion.parquet: "application/vnd.apache.parquet",
+}
+
+def parquet_disponible() -> bool:
+    return pa is not None
+
+def _exportar_csv(lotes: Iterable[List[tuple]]) -> Iterator[bytes]:
+    buffer = io.StringIO()
+    escritor = csv.writer(buffer)
+    escritor.writerow(crud.COLUMNAS_LECTURA)
+    for filas in lotes:
+        escritor.writerows(filas)
+        yield buffer.getvalue().encode("utf-8")
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue().encode("utf-8") # Solo el encabezado si el ensayo no tiene lecturas
+
+def _exportar_ndjson(lotes: Iterable[List[tuple]]) -> Iterator[bytes]:
+    for filas in lotes:
+        yield "".join(
+            json.dumps(dict(zip(crud.COLUMNAS_LECTURA, fila)), ensure_ascii=False) + "\n" for fila in filas
+        ).encode("utf-8")
+
+class _SalidaPorPartes(io.RawIOBase):
+    """
+    Archivo de solo escritura que acumula lo escrito hasta que se toma con `tomar()`.
+    Lleva la posición total para que el pie del Parquet tenga los desplazamientos correctos.
+    """
+
+    def __init__(self):
+        self._partes: List[bytes] = []
+        self._posicion = 0
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, datos) -> int:
+        datos = bytes(datos)
+        self._partes.append(datos)
+        self._posicion += len(datos)
+        return len(datos)
+
+    def tell(self) -> int:
+        return self._posicion
+
+    def tomar(self) -> bytes:
+        datos = b"".join(self._partes)
+        self._partes = []
+        return datos
+
+def _exportar_parquet(lotes: Iterable[List[tuple]]) -> Iterator[bytes]:
+    esquema = pa.schema([
+        ("uuid_lectura", pa.string()),
+        ("uuid_controlador", pa.string()),
+        ("uuid_ensayo", pa.string()),
+        ("id_sensor", pa.int16()),
+        ("timestamp", pa.timestamp("us", tz="America/Bogota")),
+        ("lectura_temperatura", pa.float64()),
+        ("lectura_humedad", pa.float64()),
+        ("lectura_bateria", pa.float64()),
+    ])
+    salida = _SalidaPorPartes()
+    escritor = pq.ParquetWriter(salida, esquema, compression="zstd")
+    for filas in lotes:
+        arreglos = [
+            pa.array(columna, type=campo.type) if campo.name != "timestamp"
+            else pa.array(columna, type=pa.string()).cast(campo.type) # ISO 8601 con desfase -05:00
+            for columna, campo in zip(zip(*filas), esquema)
+        ]
+        escritor.write_table(pa.Table.from_arrays(arreglos, schema=esquema)) # Un grupo de filas por lote
+        yield salida.tomar()
+    escritor.close()
+    yield salida.tomar()
+
+def exportar_lecturas_ensayo(uuid_ensayo: uuid.UUID, formato: FormatoExportacion) -> Iterator[bytes]:
+    """
+    Genera el archivo de exportación de las lecturas de un ensayo por partes, a medida que se leen
+    de la base de datos. Para Parquet se debe comprobar antes `parquet_disponible()`.
+    """
+    lotes = crud.iter_lecturas_ensayo(uuid_ensayo, EXPORT_LOTE_FILAS)
+    if formato == FormatoExportacion.csv:
+        return _exportar_csv(lotes)
+    if formato == FormatoExportacion.ndjson:
+        return _exportar_ndjson(lotes)
+    return _exportar_parquet(lotes)
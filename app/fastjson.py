@@ -0,0 +1,33 @@
+# fastjson.py
+import json
+from typing import Any, Iterable, Sequence
+
+from fastapi.responses import Response
+
+# orjson es opcional: serializa varias veces más rápido que json; sin él se usa la librería estándar
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# Ruta rápida de los endpoints de listas: las filas de SQLite ya vienen en el formato de la API
+# (UUID en texto, fechas ISO 8601 como las escribe pydantic), así que se pasan directo a JSON sin
+# construir ni validar un modelo por fila. El esquema de OpenAPI no cambia porque los endpoints
+# conservan su response_model; FastAPI no lo aplica cuando se retorna una Response.
+
+def dumps(valor: Any) -> bytes:
+    """Serializa a JSON compacto en UTF-8, igual que la respuesta por defecto de FastAPI."""
+    if orjson is not None:
+        return orjson.dumps(valor)
+    return json.dumps(valor, ensure_ascii=False, allow_nan=False, separators=(",", ":")).encode("utf-8")
+
+def filas_a_json(campos: Sequence[str], filas: Iterable[Sequence]) -> bytes:
+    """Arreglo JSON de objetos con los `campos` (en el orden de los del modelo) de cada fila."""
+    return dumps([dict(zip(campos, fila)) for fila in filas])
+
+class RespuestaJSON(Response):
+    """Respuesta con un cuerpo JSON ya serializado (bytes) o que se serializa con `dumps`."""
+    media_type = "application/json"
+
+    def render(self, content: Any) -> bytes:
+        return content if isinstance(content, bytes) else dumps(content)
@@ -0,0 +1,86 @@
+# heartbeat.py
+import os
+import threading
+import time
+from datetime import datetime
+from typing import List
+
+import crud
+from models import EstadoControlador, SaludControlador
+
+# --- Configuración del monitor de actividad de los controladores ---
+# Cada cuántos segundos se revisan los estados y se publica la versión de los últimos valores
+ACTIVIDAD_INTERVALO_S = float(os.getenv("ACTIVIDAD_INTERVALO_S", "30"))
+# Horas sin lecturas tras las cuales un controlador pasa a Inactivo
+CONTROLADOR_INACTIVO_HORAS = float(os.getenv("CONTROLADOR_INACTIVO_HORAS", "72"))
+
+class MonitorActividad:
+    """
+    Un hilo que cada `intervalo_s` revisa, en una sola transacción, la hora de la última lectura que
+    la ingesta guarda en controladores.ultima_lectura_ts: pasa a Inactivo a los controladores que
+    llevan `inactivo_horas` sin reportar y reactiva a los que volvieron. En cada revisión publica
+    también la versión de los últimos valores de los controladores (crud.publicar_ultimos_valores).
+    """
+
+    def __init__(self, intervalo_s: float = ACTIVIDAD_INTERVALO_S, inactivo_horas: float = CONTROLADOR_INACTIVO_HORAS):
+        self.intervalo = intervalo_s
+        self.inactivo_ms = int(inactivo_horas * 3600 * 1000)
+        self._detener = threading.Event()
+        self._hilo = None
+        self.cambios_estado = 0
+
+    def revisar(self) -> int:
+        """
+        Actualiza los estados y publica la versión de los últimos valores de los controladores, que la
+        ingesta solo marca como pendiente. Retorna cuántos controladores cambiaron de estado.
+        """
+        crud.publicar_ultimos_valores()
+        try:
+            cambios = crud.update_actividad_controladores(time.time_ns() // 1_000_000 - self.inactivo_ms)
+        except Exception as e:
+            print(f"Error al revisar la actividad de los controladores: {e}")
+            return 0
+        self.cambios_estado += cambios
+        return cambios
+
+    def start(self):
+        """Inicia el hilo que revisa la actividad periódicamente."""
+        self._detener.clear()
+        self._hilo = threading.Thread(target=self._run, name="monitor-actividad", daemon=True)
+        self._hilo.start()
+
+    def stop(self, timeout: float = 30):
+        """Detiene el hilo."""
+        self._detener.set()
+        if self._hilo:
+            self._hilo.join(timeout)
+            self._hilo = None
+
+    def _run(self):
+        self.revisar() # Revisa los estados al arrancar, tras un apagado largo
+        while not self._detener.wait(self.intervalo):
+            self.revisar()
+
+    def get_salud(self) -> List[SaludControlador]:
+        """
+        Estado, batería y última lectura de todos los controladores, los que llevan más tiempo sin
+        reportar primero. Una lectura de la tabla controladores (batería y hora de la última lectura
+        las mantiene la ingesta): el costo depende del número de controladores, no del de lecturas.
+        """
+        ahora_ms = time.time_ns() // 1_000_000
+        salud = []
+        for fila in crud.get_actividad_controladores():
+            ultima_ms = fila["ultima_lectura_ts"]
+            salud.append(SaludControlador(
+                uuid_controlador=fila["uuid_controlador"],
+                nombre_controlador=fila["nombre_controlador"],
+                estado=EstadoControlador(fila["estado"]),
+                bateria=fila["bateria"],
+                ultima_lectura=datetime.fromtimestamp(ultima_ms / 1000, crud.COLOMBIA_TIMEZONE) if ultima_ms else None,
+                segundos_sin_reportar=(ahora_ms - ultima_ms) / 1000 if ultima_ms else None,
+            ))
+        salud.sort(key=lambda controlador: -controlador.segundos_sin_reportar if controlador.segundos_sin_reportar is not None else float("-inf"))
+        return salud
+
+# Monitor global; el hilo se inicia con la aplicación
+monitor = MonitorActividad()
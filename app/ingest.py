@@ -0,0 +1,129 @@
+# ingest.py
+import os
+import threading
+import time
+from collections import deque
+from typing import List
+
+import crud
+from models import LecturaSensor, MetricasIngesta
+
+# --- Configuración de la ingesta diferida (write-behind) ---
+# Si está activa, POST /api/sensor/ y /api/sensor/batch solo validan y encolan las lecturas;
+# un hilo en segundo plano las guarda en grupos con un solo commit por grupo.
+INGESTA_DIFERIDA = os.getenv("INGESTA_DIFERIDA", "0").lower() in ("1", "true", "si", "sí")
+# Máximo de lecturas pendientes en memoria antes de rechazar nuevas (contrapresión)
+INGESTA_COLA_MAX = int(os.getenv("INGESTA_COLA_MAX", "10000"))
+# Se guarda un grupo al juntar este número de lecturas...
+INGESTA_LOTE_MAX = int(os.getenv("INGESTA_LOTE_MAX", "500"))
+# ...o al pasar este tiempo desde la primera lectura pendiente
+INGESTA_INTERVALO_MS = int(os.getenv("INGESTA_INTERVALO_MS", "200"))
+
+class EscritorDiferido:
+    """
+    Cola acotada en memoria más un hilo escritor que la vacía con commits agrupados.
+    Absorbe el pico de peticiones cuando todos los controladores reportan en el mismo minuto:
+    cientos de lecturas pagan un solo fsync en lugar de uno cada una.
+    """
+
+    def __init__(self, cola_max: int = INGESTA_COLA_MAX, lote_max: int = INGESTA_LOTE_MAX, intervalo_ms: int = INGESTA_INTERVALO_MS):
+        self.cola_max = cola_max
+        self.lote_max = lote_max
+        self.intervalo = intervalo_ms / 1000
+        self._pendientes: "deque[LecturaSensor]" = deque()
+        self._condicion = threading.Condition()
+        self._detener = False
+        self._hilo = None
+        # Métricas
+        self.lecturas_guardadas = 0
+        self.lecturas_rechazadas = 0
+        self.lecturas_perdidas = 0
+        self.commits = 0
+        self.commit_ms_ultimo = 0.0
+        self.commit_ms_max = 0.0
+        self._commit_ms_total = 0.0
+
+    def start(self):
+        """Inicia el hilo escritor."""
+        self._detener = False
+        self._hilo = threading.Thread(target=self._run, name="escritor-lecturas", daemon=True)
+        self._hilo.start()
+
+    def stop(self, timeout: float = 30):
+        """Detiene el hilo escritor después de guardar todas las lecturas pendientes."""
+        with self._condicion:
+            self._detener = True
+            self._condicion.notify_all()
+        if self._hilo:
+            self._hilo.join(timeout)
+            self._hilo = None
+
+    def encolar(self, lecturas: List[LecturaSensor]) -> bool:
+        """
+        Encola lecturas ya construidas para guardarlas en segundo plano.
+        Retorna False (sin encolar ninguna) si no caben en la cola.
+        """
+        with self._condicion:
+            if self._detener or len(self._pendientes) + len(lecturas) > self.cola_max:
+                self.lecturas_rechazadas += len(lecturas)
+                return False
+            self._pendientes.extend(lecturas)
+            self._condicion.notify()
+            return True
+
+    def _tomar_lote(self) -> List[LecturaSensor]:
+        """Espera hasta juntar `lote_max` lecturas o hasta que pase `intervalo` desde la primera."""
+        with self._condicion:
+            while not self._pendientes and not self._detener:
+                self._condicion.wait()
+            limite = time.monotonic() + self.intervalo
+            while len(self._pendientes) < self.lote_max and not self._detener:
+                restante = limite - time.monotonic()
+                if restante <= 0:
+                    break
+                self._condicion.wait(restante)
+            cantidad = min(self.lote_max, len(self._pendientes))
+            return [self._pendientes.popleft() for _ in range(cantidad)]
+
+    def _run(self):
+        while True:
+            lote = self._tomar_lote()
+            if not lote:
+                return # Solo ocurre al detenerse con la cola vacía
+            self._guardar(lote)
+
+    def _guardar(self, lote: List[LecturaSensor]):
+        inicio = time.perf_counter()
+        for intento in range(2):
+            try:
+                crud.insert_lecturas_sensor(lote)
+                break
+            except Exception as e:
+                print(f"Error al guardar grupo de {len(lote)} lecturas (intento {intento + 1}): {e}")
+                time.sleep(0.5)
+        else:
+            self.lecturas_perdidas += len(lote)
+            return
+        duracion_ms = (time.perf_counter() - inicio) * 1000
+        self.commits += 1
+        self.lecturas_guardadas += len(lote)
+        self.commit_ms_ultimo = duracion_ms
+        self.commit_ms_max = max(self.commit_ms_max, duracion_ms)
+        self._commit_ms_total += duracion_ms
+
+    def metricas(self) -> MetricasIngesta:
+        return MetricasIngesta(
+            diferida=True,
+            pendientes=len(self._pendientes),
+            capacidad=self.cola_max,
+            lecturas_guardadas=self.lecturas_guardadas,
+            lecturas_rechazadas=self.lecturas_rechazadas,
+            lecturas_perdidas=self.lecturas_perdidas,
+            commits=self.commits,
+            commit_ms_ultimo=self.commit_ms_ultimo,
+            commit_ms_promedio=self._commit_ms_total / self.commits if self.commits else 0.0,
+            commit_ms_max=self.commit_ms_max,
+        )
+
+# Escritor global, solo si la ingesta diferida está activa
+escritor = EscritorDiferido() if INGESTA_DIFERIDA else None
@@ -1,17 +1,38 @@
 # main.py
-from fastapi import FastAPI, HTTPException, status, Query, Path, Request, Form, Depends
-from fastapi.responses import HTMLResponse, RedirectResponse
+from fastapi import FastAPI, HTTPException, status, Query, Path, Request, Form, Depends, Response, Header
+from fastapi.responses import HTMLResponse, RedirectResponse, StreamingResponse, PlainTextResponse
 from fastapi.templating import Jinja2Templates
 from fastapi.staticfiles import StaticFiles
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
+from starlette.concurrency import run_in_threadpool
 from typing import List, Optional
+from contextlib import asynccontextmanager
+from concurrent.futures import ThreadPoolExecutor
+import asyncio
+import hashlib
+import os
 import uuid
 from datetime import datetime, timedelta, timezone
 
 import crud
+import database
+from database import run_db
+from cache import Cache
+import ingest
+import events
+import export
+import archive
+import metrics
+import profiling
+import fastjson
+import stats
+import heartbeat
+import overview
 from models import (
-    LecturaSensorCreate, LecturaSensor,
+    LecturaSensorCreate, LecturaSensor, LecturaSensorAgregada,
+    ResumenLecturas, PeriodoResumen, MetricasIngesta, FormatoExportacion, ResultadoArchivo, ConsultaLenta,
+    EstadisticasEnsayo, SaludControlador, ControladorPanel,
     ControladorCreate, Controlador,
     EnsayoCreate, Ensayo,
     UserCreate, User, UserInDB,
@@ -22,8 +43,26 @@ from models import (
 from jose import JWTError, jwt
 import bcrypt
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """
+    Ciclo de vida de la aplicación: carga en memoria las últimas lecturas, inicia el escritor de la
+    ingesta diferida (si está activa) y el monitor de actividad de los controladores y, al apagar el
+    servidor, guarda las lecturas y la actividad pendientes y cierra las conexiones del pool.
+    """
+    await run_db(crud.cargar_ultimas_lecturas)
+    if ingest.escritor:
+        ingest.escritor.start()
+    heartbeat.monitor.start()
+    yield
+    if ingest.escritor:
+        ingest.escritor.stop()
+    heartbeat.monitor.stop()
+    database.pool.close()
+
 # Inicializa la aplicación FastAPI
 app = FastAPI(
+    lifespan=lifespan,
     title="API de Sensores de Humedad y Temperatura",
     description="API CRUD para registrar lecturas de 4 sensores de humedad y temperatura en una base de datos SQLite, optimizada para un VPS económico, con autenticación JWT.",
     version="1.0.0",
@@ -46,8 +85,12 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor", "X-Profile-Status"],
 )
 
+if metrics.METRICAS_ACTIVAS:
+    app.add_middleware(metrics.MetricasHTTP)
+
 # --- Configuración de Autenticación JWT ---
 SECRET_KEY = "tu-super-secreto-jwt-que-deberias-cambiar-en-produccion"
 ALGORITHM = "HS256"
@@ -55,13 +98,52 @@ ACCESS_TOKEN_EXPIRE_MINUTES = 30
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/api/token")
 
+# Tokens ya verificados -> (usuario, versión del usuario al verificarlo). Evita decodificar el JWT y
+# consultar la tabla users en cada petición autenticada. Una entrada dura hasta que el token expira,
+# como máximo TOKENS_CACHE_TTL_S segundos (lo que tarda en notarse un cambio hecho fuera de la API),
+# y deja de servir en cuanto crud sube la versión del usuario (contraseña cambiada o usuario eliminado).
+TOKENS_CACHE_TTL_S = float(os.getenv("TOKENS_CACHE_TTL_S", "60"))
+TOKENS_CACHE_MAX = int(os.getenv("TOKENS_CACHE_MAX", "1000"))
+tokens_cache = Cache(max_entradas=TOKENS_CACHE_MAX, ttl=TOKENS_CACHE_TTL_S)
+
+# --- Configuración de bcrypt ---
+# Factor de costo de los hashes nuevos (cada punto duplica el tiempo de hasheo). Al iniciar sesión,
+# las contraseñas guardadas con otro costo se vuelven a hashear con este.
+BCRYPT_COSTO = int(os.getenv("BCRYPT_COSTO", "12"))
+# Hilos dedicados a bcrypt: acotan la CPU que pueden tomar los inicios de sesión y registros
+# sin ocupar el event loop, los hilos de la base de datos ni el threadpool de FastAPI
+BCRYPT_HILOS = int(os.getenv("BCRYPT_HILOS", "2"))
+# Inicios de sesión y registros en curso (hasheando o esperando un hilo); los demás reciben 503
+LOGINS_CONCURRENTES_MAX = int(os.getenv("LOGINS_CONCURRENTES_MAX", "16"))
+
+bcrypt_executor = ThreadPoolExecutor(max_workers=BCRYPT_HILOS, thread_name_prefix="bcrypt")
+logins_en_curso = asyncio.Semaphore(LOGINS_CONCURRENTES_MAX)
+
 def verify_password(plain_password: str, hashed_password: str) -> bool:
     """Verifica si una contraseña en texto plano coincide con una contraseña hasheada usando bcrypt."""
     return bcrypt.checkpw(plain_password.encode("utf-8"), hashed_password.encode("utf-8"))
 
 def get_password_hash(password: str) -> str:
-    """Hashea una contraseña en texto plano usando bcrypt."""
-    return bcrypt.hashpw(password.encode("utf-8"), bcrypt.gensalt()).decode("utf-8")
+    """Hashea una contraseña en texto plano usando bcrypt con el costo BCRYPT_COSTO."""
+    return bcrypt.hashpw(password.encode("utf-8"), bcrypt.gensalt(rounds=BCRYPT_COSTO)).decode("utf-8")
+
+def requiere_rehash(hashed_password: str) -> bool:
+    """Indica si el hash guardado ($2b$<costo>$...) se generó con un costo distinto a BCRYPT_COSTO."""
+    return hashed_password.split("$")[2] != f"{BCRYPT_COSTO:02d}"
+
+async def run_bcrypt(func, *args):
+    """
+    Ejecuta una operación de bcrypt en su pool de hilos. Si ya hay LOGINS_CONCURRENTES_MAX en curso
+    responde 503 de inmediato, para que una ráfaga de inicios de sesión no acumule trabajo.
+    """
+    if logins_en_curso.locked():
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Demasiados inicios de sesión simultáneos, intente de nuevo en unos segundos.",
+            headers={"Retry-After": "1"},
+        )
+    async with logins_en_curso:
+        return await asyncio.get_running_loop().run_in_executor(bcrypt_executor, func, *args)
 
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     """Crea un token de acceso JWT."""
@@ -76,11 +158,13 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
 
 async def authenticate_user(nombre_usuario: str, password: str) -> Optional[UserInDB]:
     """Autentica un usuario por nombre de usuario y contraseña."""
-    user = crud.get_user_by_username(nombre_usuario)
+    user = await run_db(crud.get_user_by_username, nombre_usuario)
     if not user:
         return None
-    if not verify_password(password, user.hashed_password):
+    if not await run_bcrypt(verify_password, password, user.hashed_password):
         return None
+    if requiere_rehash(user.hashed_password):
+        await run_db(crud.update_user_password, user.uuid_usuario, await run_bcrypt(get_password_hash, password))
     return user
 
 async def get_current_user(token: str = Depends(oauth2_scheme)) -> User:
@@ -93,6 +177,9 @@ async def get_current_user(token: str = Depends(oauth2_scheme)) -> User:
         detail="No se pudieron validar las credenciales",
         headers={"WWW-Authenticate": "Bearer"},
     )
+    verificado = tokens_cache.get(token)
+    if verificado is not None and verificado[1] == crud.versiones.version("usuarios", verificado[0].uuid_usuario):
+        return verificado[0]
     try:
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
         username: str = payload.get("sub")
@@ -102,13 +189,33 @@ async def get_current_user(token: str = Depends(oauth2_scheme)) -> User:
         if user_uuid is None:
             raise credentials_exception
         
-        user = crud.get_user_by_uuid(uuid.UUID(user_uuid))
+        # La versión se toma antes de consultar: un cambio concurrente deja la entrada ya vencida
+        version = crud.versiones.version("usuarios", uuid.UUID(user_uuid))
+        user = await run_db(crud.get_user_by_uuid, uuid.UUID(user_uuid))
         if user is None:
             raise credentials_exception
-        return User(uuid_usuario=user.uuid_usuario, nombre_usuario=user.nombre_usuario, correo=user.correo)
-    except JWTError:
+        current_user = User(uuid_usuario=user.uuid_usuario, nombre_usuario=user.nombre_usuario, correo=user.correo)
+        restante = payload.get("exp", 0) - datetime.now(timezone.utc).timestamp()
+        if restante > 0:
+            tokens_cache.set(token, (current_user, version), ttl=min(restante, TOKENS_CACHE_TTL_S))
+        return current_user
+    except (JWTError, ValueError):
         raise credentials_exception
 
+def token_valido(scope) -> bool:
+    """Indica si la petición ASGI trae un token JWT válido (para habilitar el perfilado desde un middleware)."""
+    autorizacion = dict(scope.get("headers", [])).get(b"authorization", b"").decode("latin-1")
+    esquema, _, token = autorizacion.partition(" ")
+    if esquema.lower() != "bearer" or not token:
+        return False
+    try:
+        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+    except JWTError:
+        return False
+    return payload.get("user_uuid") is not None
+
+app.add_middleware(profiling.PerfiladoPeticiones, autorizado=token_valido)
+
 # --- Endpoints de Autenticación ---
 
 @app.post(
@@ -121,17 +228,17 @@ async def register_user(user_create: UserCreate):
     """
     Registra un nuevo usuario en el sistema.
     """
-    db_user = crud.get_user_by_username(user_create.nombre_usuario)
+    db_user = await run_db(crud.get_user_by_username, user_create.nombre_usuario)
     if db_user:
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="El nombre de usuario ya existe.")
     
-    db_user_by_email = crud.get_user_by_email(user_create.correo)
+    db_user_by_email = await run_db(crud.get_user_by_email, user_create.correo)
     if db_user_by_email:
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="El correo electrónico ya está registrado.")
 
-    hashed_password = get_password_hash(user_create.password)
+    hashed_password = await run_bcrypt(get_password_hash, user_create.password)
     try:
-        user = crud.create_user(user_create, hashed_password)
+        user = await run_db(crud.create_user, user_create, hashed_password)
         return user
     except ValueError as e:
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
@@ -159,34 +266,135 @@ async def login_for_access_token(form_data: OAuth2PasswordRequestForm = Depends(
     )
     return {"access_token": access_token, "token_type": "bearer"}
 
+@app.delete(
+    "/api/users/me",
+    summary="Eliminar la cuenta del usuario autenticado"
+)
+async def delete_current_user_api(current_user: User = Depends(get_current_user)):
+    """
+    Elimina la cuenta del usuario autenticado. Sus tokens dejan de ser válidos de inmediato,
+    aunque estén en la caché de tokens verificados.
+    """
+    if not await run_db(crud.delete_user, current_user.uuid_usuario):
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Usuario no encontrado")
+    return {"message": "Usuario eliminado exitosamente"}
+
+# --- Peticiones condicionales (ETag) ---
+
+def respuesta_no_modificada(request: Request, response: Response, *versiones: str) -> Optional[Response]:
+    """
+    Pone en la respuesta un ETag débil formado con las versiones de crud.versiones de las que depende
+    y un hash de los parámetros de la consulta (filtros, paginación), que también cambian la
+    respuesta. Si el cliente ya tiene esa versión (If-None-Match) retorna una respuesta 304 vacía, que
+    el endpoint devuelve sin consultar la base de datos ni serializar. Las versiones se toman antes de
+    consultar: si una escritura ocurre entretanto, el ETag queda atrasado y la siguiente petición recibe todo.
+    """
+    parametros = sorted(request.query_params.multi_items())
+    if parametros:
+        versiones = (*versiones, hashlib.blake2b(repr(parametros).encode(), digest_size=6).hexdigest())
+    etag = 'W/"' + "-".join(versiones) + '"'
+    cabeceras = {"ETag": etag, "Cache-Control": "no-cache"}
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match:
+        recibidos = {valor.strip().removeprefix("W/") for valor in if_none_match.split(",")}
+        if "*" in recibidos or etag.removeprefix("W/") in recibidos:
+            return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=cabeceras)
+    response.headers.update(cabeceras)
+    return None
+
+def respuesta_json(cuerpo: bytes, response: Response) -> fastjson.RespuestaJSON:
+    """
+    Respuesta con un JSON ya serializado por el CRUD. Al retornar una Response, FastAPI no valida ni
+    serializa con el response_model (que se mantiene para el esquema de OpenAPI) ni copia las cabeceras
+    puestas en `response`, así que se pasan aquí.
+    """
+    cabeceras = {nombre: valor for nombre, valor in response.headers.items() if nombre in ("etag", "cache-control", "x-next-cursor")}
+    return fastjson.RespuestaJSON(cuerpo, headers=cabeceras)
+
 # --- Endpoints para Lecturas de Sensores ---
 
+MAX_LECTURAS_POR_LOTE = 1000 # Tamaño máximo aceptado en /api/sensor/batch
+
+async def guardar_lecturas(lecturas: List[LecturaSensorCreate], ensayos_asignados: dict, response: Response) -> List[LecturaSensor]:
+    """
+    Guarda las lecturas en la base de datos o, con la ingesta diferida activa, las encola y
+    responde 202 Accepted. Si la cola está llena responde 503 para que el controlador reintente.
+    Las lecturas aceptadas se publican en /api/sensor/stream.
+    """
+    if not ingest.escritor:
+        creadas = await run_db(crud.create_lecturas_sensor_batch, lecturas, ensayos_asignados)
+        events.difusor.publicar(creadas)
+        return creadas
+
+    creadas = crud.build_lecturas_sensor(lecturas, ensayos_asignados)
+    if not ingest.escritor.encolar(creadas):
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="La cola de ingesta está llena, intente de nuevo en unos segundos.",
+            headers={"Retry-After": "1"},
+        )
+    events.difusor.publicar(creadas)
+    response.status_code = status.HTTP_202_ACCEPTED
+    return creadas
+
 @app.post(
     "/api/sensor/",
     response_model=LecturaSensor,
     status_code=status.HTTP_201_CREATED,
     summary="Registrar una nueva lectura de sensor"
 )
-async def create_new_lectura_sensor_api(lectura: LecturaSensorCreate):
+async def create_new_lectura_sensor_api(lectura: LecturaSensorCreate, response: Response):
     """
     Registra una nueva lectura de un sensor específico.
     El ensayo asociado se determina automáticamente: si el controlador tiene un ensayo
     'Corriendo', se usa ese; de lo contrario, se asigna al ensayo genérico del controlador.
+    La resolución se guarda en caché por controlador y se invalida cuando cambia su ensayo activo.
     """
-    controlador = crud.get_controlador(lectura.uuid_controlador)
-    if not controlador:
+    ensayo_uuid_to_use = await run_db(crud.get_ensayo_asignado, lectura.uuid_controlador)
+    if not ensayo_uuid_to_use:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Controlador no encontrado")
 
-    ensayo_uuid_to_use = controlador.uuid_ensayo_activo
+    return (await guardar_lecturas([lectura], {lectura.uuid_controlador: ensayo_uuid_to_use}, response))[0]
 
-    if not ensayo_uuid_to_use:
-        generic_ensayo = crud.get_controller_generic_ensayo(controlador.uuid_controlador)
-        if generic_ensayo:
-            ensayo_uuid_to_use = generic_ensayo.uuid_ensayo
-        else:
-            raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="No se pudo determinar el ensayo activo o genérico para el controlador.")
 
-    return crud.create_lectura_sensor(lectura, ensayo_uuid_to_use)
+@app.post(
+    "/api/sensor/batch",
+    response_model=List[LecturaSensor],
+    status_code=status.HTTP_201_CREATED,
+    summary="Registrar un lote de lecturas de sensores (uno o varios controladores)"
+)
+async def create_lecturas_sensor_batch_api(lecturas: List[LecturaSensorCreate], response: Response):
+    """
+    Registra varias lecturas en una sola petición y en una sola transacción.
+    El ensayo de cada controlador se resuelve una única vez por lote, con la misma regla que
+    el registro individual: el ensayo activo o, en su defecto, el ensayo genérico del controlador.
+    """
+    if not lecturas:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="El lote de lecturas está vacío.")
+    if len(lecturas) > MAX_LECTURAS_POR_LOTE:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"El lote no puede tener más de {MAX_LECTURAS_POR_LOTE} lecturas.")
+
+    ensayos_asignados = await run_db(crud.get_ensayos_asignados, [lectura.uuid_controlador for lectura in lecturas])
+    faltantes = {str(lectura.uuid_controlador) for lectura in lecturas if lectura.uuid_controlador not in ensayos_asignados}
+    if faltantes:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"Controlador no encontrado: {', '.join(sorted(faltantes))}")
+
+    return await guardar_lecturas(lecturas, ensayos_asignados, response)
+
+
+@app.get(
+    "/api/sensor/ingest/metrics",
+    response_model=MetricasIngesta,
+    summary="Obtener el estado de la cola de ingesta diferida (profundidad y latencia de commits)"
+)
+async def read_metricas_ingesta_api():
+    """
+    Obtiene la profundidad de la cola de ingesta y la latencia de los commits agrupados.
+    Si la ingesta diferida no está activa solo se indica `diferida: false`.
+    """
+    if not ingest.escritor:
+        return MetricasIngesta(diferida=False)
+    return ingest.escritor.metricas()
 
 
 @app.get(
@@ -195,16 +403,82 @@ async def create_new_lectura_sensor_api(lectura: LecturaSensorCreate):
     summary="Obtener todas las lecturas de sensores o filtrar por controlador, sensor o ensayo"
 )
 async def read_lecturas_sensor_api(
+    request: Request,
+    response: Response,
+    uuid_controlador: Optional[uuid.UUID] = Query(None, description="UUID del controlador para filtrar lecturas."),
+    id_sensor: Optional[int] = Query(None, ge=1, le=4, description="ID del sensor (1-4) para filtrar lecturas."),
+    uuid_ensayo: Optional[uuid.UUID] = Query(None, description="UUID del ensayo para filtrar lecturas."),
+    skip: int = Query(0, ge=0, description="Número de registros a saltar (paginación por desplazamiento)."),
+    limit: int = Query(100, ge=1, le=1000, description="Número máximo de registros a devolver (paginación)."),
+    cursor: Optional[str] = Query(None, description="Cursor devuelto en la cabecera X-Next-Cursor de la página anterior (paginación por cursor). Si se envía, se ignora 'skip'."),
+    desde: Optional[datetime] = Query(None, description="Fecha y hora inicial (incluida) en ISO8601. Sin zona horaria se asume hora de Colombia."),
+    hasta: Optional[datetime] = Query(None, description="Fecha y hora final (excluida) en ISO8601. Sin zona horaria se asume hora de Colombia.")
+):
+    """
+    Obtiene una lista de lecturas de sensores, de la más reciente a la más antigua.
+    Si la página está completa, la cabecera X-Next-Cursor trae el cursor para pedir la siguiente.
+    Responde 304 si no hubo lecturas nuevas (del controlador filtrado) desde el ETag enviado en If-None-Match.
+    """
+    no_modificada = respuesta_no_modificada(request, response, crud.versiones.version("lecturas", uuid_controlador))
+    if no_modificada:
+        return no_modificada
+
+    cursor_posicion = None
+    if cursor:
+        try:
+            cursor_posicion = crud.decode_cursor_lecturas(cursor)
+        except ValueError as e:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+
+    # Ruta rápida: el JSON sale directo de las filas (ver fastjson.py); response_model solo documenta
+    cuerpo, cantidad, ultima_posicion = await run_db(crud.get_lecturas_sensor_json, uuid_controlador, id_sensor, uuid_ensayo, skip, limit, cursor_posicion, desde, hasta)
+    if cantidad == limit:
+        response.headers["X-Next-Cursor"] = crud.encode_cursor_lecturas(ultima_posicion)
+    return respuesta_json(cuerpo, response)
+
+@app.get(
+    "/api/sensor/history",
+    response_model=List[LecturaSensorAgregada],
+    summary="Obtener el historial de lecturas agregado por intervalos de tiempo (min/prom/max por sensor)"
+)
+async def read_lecturas_agregadas_api(
+    bucket: str = Query(..., description="Tamaño de cada intervalo: número seguido de m, h o d (p. ej. 1m, 15m, 1h, 1d)."),
     uuid_controlador: Optional[uuid.UUID] = Query(None, description="UUID del controlador para filtrar lecturas."),
     id_sensor: Optional[int] = Query(None, ge=1, le=4, description="ID del sensor (1-4) para filtrar lecturas."),
     uuid_ensayo: Optional[uuid.UUID] = Query(None, description="UUID del ensayo para filtrar lecturas."),
+    desde: Optional[datetime] = Query(None, description="Fecha y hora inicial (incluida) en ISO8601. Sin zona horaria se asume hora de Colombia."),
+    hasta: Optional[datetime] = Query(None, description="Fecha y hora final (excluida) en ISO8601. Sin zona horaria se asume hora de Colombia.")
+):
+    """
+    Obtiene, por controlador y sensor, el mínimo, promedio y máximo de temperatura y humedad de cada
+    intervalo de tiempo. Permite graficar el historial completo de un ensayo con pocos puntos.
+    """
+    try:
+        bucket_segundos = crud.bucket_a_segundos(bucket)
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    return await run_db(crud.get_lecturas_agregadas, bucket_segundos, uuid_controlador, id_sensor, uuid_ensayo, desde, hasta)
+
+@app.get(
+    "/api/sensor/summary",
+    response_model=List[ResumenLecturas],
+    summary="Obtener los resúmenes precalculados por hora o por día (por controlador, ensayo y sensor)"
+)
+async def read_resumen_lecturas_api(
+    periodo: PeriodoResumen = Query(PeriodoResumen.hora, description="Periodo de los resúmenes: hora o dia."),
+    uuid_controlador: Optional[uuid.UUID] = Query(None, description="UUID del controlador para filtrar resúmenes."),
+    id_sensor: Optional[int] = Query(None, ge=1, le=4, description="ID del sensor (1-4) para filtrar resúmenes."),
+    uuid_ensayo: Optional[uuid.UUID] = Query(None, description="UUID del ensayo para filtrar resúmenes."),
+    desde: Optional[datetime] = Query(None, description="Inicio mínimo (incluido) del periodo en ISO8601. Sin zona horaria se asume hora de Colombia."),
+    hasta: Optional[datetime] = Query(None, description="Inicio máximo (excluido) del periodo en ISO8601. Sin zona horaria se asume hora de Colombia."),
     skip: int = Query(0, ge=0, description="Número de registros a saltar (paginación)."),
-    limit: int = Query(100, ge=1, le=1000, description="Número máximo de registros a devolver (paginación).")
+    limit: int = Query(1000, ge=1, le=10000, description="Número máximo de registros a devolver (paginación).")
 ):
     """
-    Obtiene una lista de lecturas de sensores.
+    Obtiene conteo, mínimo, promedio, máximo y desviación estándar de temperatura y humedad (y batería)
+    por periodo. Se lee de resúmenes que se actualizan con cada lectura, sin recorrer las lecturas crudas.
     """
-    return crud.get_lecturas_sensor(uuid_controlador, id_sensor, uuid_ensayo, skip, limit)
+    return await run_db(crud.get_resumen_lecturas, periodo, uuid_controlador, id_sensor, uuid_ensayo, desde, hasta, skip, limit)
 
 @app.get(
     "/api/sensor/latest",
@@ -213,10 +487,129 @@ async def read_lecturas_sensor_api(
 )
 async def read_latest_lectura_sensor_api():
     """
-    Obtiene la lectura de sensor más reciente de la base de datos.
+    Obtiene la lectura de sensor más reciente. Se responde desde memoria, sin consultar la base de datos.
     """
     return crud.get_latest_lectura_sensor()
 
+@app.get(
+    "/api/sensor/stream",
+    summary="Recibir las nuevas lecturas en tiempo real (Server-Sent Events)",
+    response_class=StreamingResponse,
+)
+async def stream_lecturas_sensor_api(
+    request: Request,
+    uuid_controlador: Optional[uuid.UUID] = Query(None, description="Solo lecturas de este controlador (todas si se omite)"),
+    last_event_id: Optional[str] = Header(None, description="Id del último evento recibido, para reanudar tras una reconexión"),
+):
+    """
+    Abre un stream `text/event-stream` que envía un evento `lectura` por cada lectura aceptada,
+    en lugar de consultar /api/sensor/ periódicamente. Al reconectarse, EventSource envía
+    Last-Event-ID y se reenvían los eventos perdidos que aún estén en el historial reciente.
+    """
+    ultimo_id = None
+    if last_event_id:
+        try:
+            ultimo_id = int(last_event_id)
+        except ValueError:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Last-Event-ID inválido.")
+    suscriptor = events.difusor.suscribir(uuid_controlador, ultimo_id)
+    if suscriptor is None:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Se alcanzó el máximo de clientes conectados al stream.",
+            headers={"Retry-After": "10"},
+        )
+    return StreamingResponse(
+        events.stream_sse(events.difusor, suscriptor, request.is_disconnected),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+@app.post(
+    "/api/admin/archive",
+    response_model=ResultadoArchivo,
+    summary="Archivar lecturas antiguas y de ensayos finalizados en archivos mensuales",
+    dependencies=[Depends(get_current_user)]
+)
+async def archive_lecturas_api(
+    dias: int = Query(archive.RETENCION_DIAS, ge=0, description="Archivar lecturas con más de estos días (0 desactiva la regla)."),
+    finalizados: bool = Query(archive.ARCHIVAR_FINALIZADOS, description="Archivar también las lecturas de los ensayos Finalizados."),
+    max_lecturas: int = Query(100000, ge=1, description="Máximo de lecturas a mover en esta llamada; se puede volver a llamar para continuar.")
+):
+    """
+    Mueve lecturas crudas de sensores.db a archivos SQLite por mes, en lotes cortos que no bloquean
+    la ingesta. Los resúmenes por hora y día se conservan, y la exportación de ensayos incluye lo archivado.
+    """
+    # Se ejecuta en el pool de hilos general y no en el de base de datos, para no ocupar uno de sus hilos
+    # durante todo el proceso (cada lote toma una conexión del pool solo mientras se mueve).
+    resultado = await run_in_threadpool(archive.archivar_lecturas, dias, finalizados, max_lecturas)
+    if resultado is None:
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail="Ya hay un archivado de lecturas en curso.")
+    return resultado
+
+@app.get(
+    "/api/admin/slow-queries",
+    response_model=List[ConsultaLenta],
+    summary="Obtener las consultas SQL lentas recientes con su plan de ejecución",
+    dependencies=[Depends(get_current_user)]
+)
+async def read_consultas_lentas_api(limpiar: bool = Query(False, description="Vaciar el registro después de leerlo.")):
+    """
+    Sentencias que tardaron más de CONSULTA_LENTA_MS, la más reciente primero, con sus parámetros
+    (textos y blobs ocultos), la función que las ejecutó y su EXPLAIN QUERY PLAN.
+    Para perfilar una petición completa se le agrega ?profile=1 o la cabecera X-Profile: 1 junto con el token.
+    """
+    consultas = profiling.get_consultas_lentas()
+    if limpiar:
+        profiling.clear_consultas_lentas()
+    return consultas
+
+# --- Métricas (Prometheus) ---
+
+_ultima_lectura_cargada = False
+
+def _actualizar_metricas_al_consultar():
+    """Valores que se leen en el momento del scrape en lugar de en cada petición."""
+    global _ultima_lectura_cargada
+    if not _ultima_lectura_cargada:
+        # Tras un reinicio, la última lectura de cada controlador se toma una vez de la base de datos;
+        # después la actualiza cada inserción.
+        for uuid_controlador, ts in crud.get_ultima_lectura_controladores().items():
+            metrics.ultima_lectura_controlador.set_max(ts / 1000, uuid_controlador)
+        _ultima_lectura_cargada = True
+    for sufijo in ("", "-wal"):
+        ruta = database.DATABASE_URL.with_name(database.DATABASE_URL.name + sufijo)
+        if ruta.exists():
+            metrics.tamano_base_datos.set(ruta.stat().st_size, ruta.name)
+    metrics.cola_ingesta.set(ingest.escritor.metricas().pendientes if ingest.escritor else 0)
+
+@app.get("/metrics", response_class=PlainTextResponse, include_in_schema=False)
+async def metrics_api():
+    """
+    Métricas del proceso en el formato de texto de Prometheus: peticiones y latencia por ruta, duración
+    de cada función del CRUD, espera por conexiones, lecturas insertadas y última lectura por controlador.
+    """
+    if not metrics.METRICAS_ACTIVAS:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Métricas desactivadas.")
+    await run_db(_actualizar_metricas_al_consultar)
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+# --- Panel general ---
+
+@app.get(
+    "/api/overview",
+    response_model=List[ControladorPanel],
+    summary="Obtener todos los controladores con su ensayo activo, últimas lecturas y extremos de 24 horas"
+)
+async def read_panel_api(response: Response):
+    """
+    Todo lo que necesita el panel en una sola petición: cada controlador con su ensayo activo y, por
+    sensor, la última lectura y la temperatura y humedad mínima y máxima de las últimas 24 horas.
+    Se arma con pocas consultas para toda la flota y se reutiliza durante PANEL_CACHE_TTL_S segundos.
+    """
+    response.headers["Cache-Control"] = f"private, max-age={int(overview.PANEL_CACHE_TTL_S)}"
+    return respuesta_json(await run_db(overview.get_panel_json), response)
+
 # --- Endpoints para Controladores ---
 
 @app.post(
@@ -228,7 +621,7 @@ async def create_new_controlador_api(controlador: ControladorCreate):
     """
     Registra un nuevo controlador y le asigna un ensayo genérico único.
     """
-    created_controlador, generic_ensayo = crud.create_controlador(controlador)
+    created_controlador, generic_ensayo = await run_db(crud.create_controlador, controlador)
     return {"controlador": created_controlador, "ensayo_generico": generic_ensayo}
 
 
@@ -238,13 +631,34 @@ async def create_new_controlador_api(controlador: ControladorCreate):
     summary="Obtener todos los controladores registrados"
 )
 async def read_controladores_api(
+    request: Request,
+    response: Response,
     skip: int = Query(0, ge=0, description="Número de registros a saltar (paginación)."),
     limit: int = Query(100, ge=1, le=1000, description="Número máximo de registros a devolver (paginación).")
 ):
     """
-    Obtiene una lista de todos los controladores registrados.
+    Obtiene una lista de todos los controladores registrados (304 si no cambiaron desde el ETag enviado).
+    La batería y los valores de la última lectura se reflejan en el ETag una vez por ACTIVIDAD_INTERVALO_S.
     """
-    return crud.get_controladores(skip, limit)
+    no_modificada = respuesta_no_modificada(
+        request, response, crud.versiones.version("controladores"), crud.versiones.version("ultimos_valores")
+    )
+    if no_modificada:
+        return no_modificada
+    return respuesta_json(await run_db(crud.get_controladores_json, skip, limit), response)
+
+@app.get(
+    "/api/controller/health",
+    response_model=List[SaludControlador],
+    summary="Obtener el estado, la batería y la última lectura de todos los controladores"
+)
+async def read_salud_controladores_api():
+    """
+    Salud de la flota: para cada controlador su estado, el último voltaje de batería reportado, la hora
+    de su última lectura y los segundos sin reportar, los más atrasados primero. Los controladores que
+    llevan CONTROLADOR_INACTIVO_HORAS sin lecturas pasan a Inactivo automáticamente.
+    """
+    return await run_db(heartbeat.monitor.get_salud)
 
 @app.get(
     "/api/controller/{uuid_controlador}",
@@ -255,11 +669,26 @@ async def read_controlador_api(uuid_controlador: uuid.UUID):
     """
     Obtiene los detalles de un controlador específico.
     """
-    db_controlador = crud.get_controlador(uuid_controlador)
+    db_controlador = await run_db(crud.get_controlador, uuid_controlador)
     if db_controlador is None:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Controlador no encontrado")
     return db_controlador
 
+@app.get(
+    "/api/controller/{uuid_controlador}/latest",
+    response_model=List[LecturaSensor],
+    summary="Obtener la última lectura de cada sensor de un controlador"
+)
+async def read_latest_lecturas_controlador_api(uuid_controlador: uuid.UUID):
+    """
+    Obtiene la última lectura de cada uno de los sensores de un controlador, ordenadas por sensor.
+    Se responde desde memoria; la lista está vacía si el controlador aún no ha enviado lecturas.
+    """
+    lecturas = crud.get_latest_lecturas_controlador(uuid_controlador)
+    if not lecturas and await run_db(crud.get_ensayo_asignado, uuid_controlador) is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Controlador no encontrado")
+    return lecturas
+
 @app.put(
     "/api/controller/name-update/{uuid_controlador}",
     response_model=Controlador,
@@ -270,7 +699,7 @@ async def update_existing_controlador_name_api(uuid_controlador: uuid.UUID, new_
     """
     Actualiza el nombre de un controlador existente.
     """
-    db_controlador = crud.update_controlador_name(uuid_controlador, new_name.nombre_controlador)
+    db_controlador = await run_db(crud.update_controlador_name, uuid_controlador, new_name.nombre_controlador)
     if db_controlador is None:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Controlador no encontrado")
     return db_controlador
@@ -284,7 +713,7 @@ async def update_controller_ensayo_api(uuid_controlador: uuid.UUID, ensayo_data:
     """
     Actualiza el ensayo activo de un controlador, actualizando los estados del controlador y del ensayo.
     """
-    controlador_actualizado, ensayo_actualizado = crud.update_controlador_ensayo(uuid_controlador, ensayo_data.uuid_ensayo_activo)
+    controlador_actualizado, ensayo_actualizado = await run_db(crud.update_controlador_ensayo, uuid_controlador, ensayo_data.uuid_ensayo_activo)
     if not controlador_actualizado:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Controlador o ensayo no encontrado")
     
@@ -299,7 +728,7 @@ async def delete_existing_controlador_api(uuid_controlador: uuid.UUID):
     """
     Elimina un controlador existente. No se puede eliminar si su ensayo genérico tiene lecturas asociadas.
     """
-    deleted_controlador = crud.delete_controlador(uuid_controlador)
+    deleted_controlador = await run_db(crud.delete_controlador, uuid_controlador)
     if deleted_controlador is None:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Controlador no encontrado o no se puede eliminar (podría tener lecturas asociadas a su ensayo genérico).")
     
@@ -318,7 +747,7 @@ async def create_new_ensayo_api(ensayo: EnsayoCreate):
     """
     Registra un nuevo ensayo.
     """
-    return crud.create_ensayo(ensayo)
+    return await run_db(crud.create_ensayo, ensayo)
 
 @app.get(
     "/api/ensayos/",
@@ -326,14 +755,19 @@ async def create_new_ensayo_api(ensayo: EnsayoCreate):
     summary="Obtener todos los ensayos registrados (filtrar por controlador opcional)"
 )
 async def read_ensayos_api(
+    request: Request,
+    response: Response,
     uuid_controlador: Optional[uuid.UUID] = Query(None, description="UUID del controlador para filtrar ensayos."),
     skip: int = Query(0, ge=0, description="Número de registros a saltar (paginación)."),
     limit: int = Query(100, ge=1, le=1000, description="Número máximo de registros a devolver (paginación).")
 ):
     """
-    Obtiene una lista de todos los ensayos registrados.
+    Obtiene una lista de todos los ensayos registrados (304 si no cambiaron desde el ETag enviado).
     """
-    return crud.get_ensayos(uuid_controlador, skip, limit)
+    no_modificada = respuesta_no_modificada(request, response, crud.versiones.version("ensayos"))
+    if no_modificada:
+        return no_modificada
+    return respuesta_json(await run_db(crud.get_ensayos_json, uuid_controlador, skip, limit), response)
 
 @app.get(
     "/api/ensayos/{uuid_ensayo}",
@@ -344,11 +778,62 @@ async def read_ensayo_api(uuid_ensayo: uuid.UUID):
     """
     Obtiene los detalles de un ensayo específico.
     """
-    db_ensayo = crud.get_ensayo(uuid_ensayo)
+    db_ensayo = await run_db(crud.get_ensayo, uuid_ensayo)
     if db_ensayo is None:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Ensayo no encontrado")
     return db_ensayo
 
+@app.get(
+    "/api/ensayos/{uuid_ensayo}/export",
+    summary="Descargar todas las lecturas de un ensayo (CSV, NDJSON o Parquet)",
+    response_class=StreamingResponse,
+)
+async def export_lecturas_ensayo_api(
+    uuid_ensayo: uuid.UUID,
+    formato: FormatoExportacion = Query(FormatoExportacion.csv, alias="format", description="Formato del archivo: csv, ndjson o parquet."),
+):
+    """
+    Descarga en una sola petición todas las lecturas de un ensayo, en orden cronológico.
+    El archivo se genera por partes mientras se lee la base de datos, por lo que la memoria usada
+    no depende del tamaño del ensayo. Parquet requiere tener instalado pyarrow en el servidor.
+    """
+    if await run_db(crud.get_ensayo, uuid_ensayo) is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Ensayo no encontrado")
+    if formato == FormatoExportacion.parquet and not export.parquet_disponible():
+        raise HTTPException(status_code=status.HTTP_501_NOT_IMPLEMENTED, detail="La exportación a Parquet requiere instalar pyarrow en el servidor.")
+    return StreamingResponse(
+        export.exportar_lecturas_ensayo(uuid_ensayo, formato),
+        media_type=export.TIPOS_CONTENIDO[formato],
+        headers={"Content-Disposition": f'attachment; filename="ensayo_{uuid_ensayo}.{formato.value}"'},
+    )
+
+@app.get(
+    "/api/ensayos/{uuid_ensayo}/stats",
+    response_model=EstadisticasEnsayo,
+    summary="Obtener el resumen estadístico de las lecturas de un ensayo por sensor",
+)
+async def read_estadisticas_ensayo_api(
+    uuid_ensayo: uuid.UUID,
+    request: Request,
+    response: Response,
+    umbral_temperatura: float = Query(stats.ESTADISTICAS_UMBRAL_TEMPERATURA, description="Umbral de temperatura en °C para el tiempo sobre umbral."),
+    umbral_humedad: float = Query(stats.ESTADISTICAS_UMBRAL_HUMEDAD, description="Umbral de humedad relativa (%) para el tiempo sobre umbral."),
+):
+    """
+    Para cada sensor del ensayo: cantidad, promedio, desviación, mínimo, máximo y percentiles de
+    temperatura y humedad, tiempo sobre los umbrales, tasa de secado (pendiente de la humedad) y
+    diferencia con los demás sensores. Incluye las lecturas archivadas. Requiere numpy en el servidor.
+    """
+    if not stats.numpy_disponible():
+        raise HTTPException(status_code=status.HTTP_501_NOT_IMPLEMENTED, detail="Las estadísticas de ensayos requieren instalar numpy en el servidor.")
+    if await run_db(crud.get_ensayo, uuid_ensayo) is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Ensayo no encontrado")
+    no_modificada = respuesta_no_modificada(request, response, crud.versiones.version("lecturas", uuid_ensayo))
+    if no_modificada:
+        return no_modificada
+    # Usa conexiones propias (como la exportación): no ocupa los hilos ni las conexiones del CRUD
+    return await run_in_threadpool(stats.get_estadisticas_ensayo, uuid_ensayo, umbral_temperatura, umbral_humedad)
+
 @app.put(
     "/api/ensayos/{uuid_ensayo}",
     response_model=Ensayo,
@@ -359,7 +844,7 @@ async def update_existing_ensayo_api(uuid_ensayo: uuid.UUID, ensayo: EnsayoCreat
     """
     Actualiza un ensayo existente.
     """
-    db_ensayo = crud.update_ensayo(uuid_ensayo, ensayo)
+    db_ensayo = await run_db(crud.update_ensayo, uuid_ensayo, ensayo)
     if db_ensayo is None:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Ensayo no encontrado")
     return db_ensayo
@@ -374,6 +859,6 @@ async def delete_existing_ensayo_api(uuid_ensayo: uuid.UUID):
     """
     Elimina un ensayo existente. No se permite eliminar si es un ensayo genérico de algún controlador.
     """
-    if not crud.delete_ensayo(uuid_ensayo):
+    if not await run_db(crud.delete_ensayo, uuid_ensayo):
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Ensayo no encontrado o no se puede eliminar (es un ensayo genérico de un controlador).")
     return {"message": "Ensayo eliminado exitosamente"}
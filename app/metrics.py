@@ -0,0 +1,158 @@
+# metrics.py
+import bisect
+import threading
+import os
+import time
+from typing import Dict, List, Sequence, Tuple
+
+# Métricas en memoria del proceso, expuestas en formato de texto de Prometheus en GET /metrics.
+# Registrar un valor cuesta un bisect y un lock (microsegundos), por lo que pueden quedar activas
+# en producción. Con varios workers de uvicorn cada proceso tiene las suyas.
+
+# Con METRICAS_ACTIVAS=0 no se mide nada por petición HTTP y GET /metrics responde 404
+METRICAS_ACTIVAS = os.getenv("METRICAS_ACTIVAS", "1").lower() in ("1", "true", "si", "sí")
+
+# Límites (segundos) de los histogramas de latencia
+LIMITES_LATENCIA = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+def _etiquetas(nombres: Sequence[str], valores: Sequence[str], extra: str = "") -> str:
+    pares = [f'{nombre}="{_escapar(valor)}"' for nombre, valor in zip(nombres, valores)]
+    if extra:
+        pares.append(extra)
+    return "{" + ",".join(pares) + "}" if pares else ""
+
+def _escapar(valor) -> str:
+    return str(valor).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+def _numero(valor: float) -> str:
+    return repr(float(valor)) if valor != int(valor) else str(int(valor))
+
+class _Metrica:
+    tipo = ""
+
+    def __init__(self, nombre: str, ayuda: str, etiquetas: Sequence[str] = ()):
+        self.nombre = nombre
+        self.ayuda = ayuda
+        self.etiquetas = tuple(etiquetas)
+        self._lock = threading.Lock()
+        self._valores: Dict[Tuple[str, ...], object] = {}
+        REGISTRO.append(self)
+
+    def _cabecera(self) -> List[str]:
+        return [f"# HELP {self.nombre} {self.ayuda}", f"# TYPE {self.nombre} {self.tipo}"]
+
+class Contador(_Metrica):
+    """Valor que solo aumenta (p. ej. peticiones atendidas)."""
+    tipo = "counter"
+
+    def inc(self, *etiquetas: str, cantidad: float = 1):
+        with self._lock:
+            self._valores[etiquetas] = self._valores.get(etiquetas, 0) + cantidad
+
+    def render(self) -> List[str]:
+        with self._lock:
+            valores = list(self._valores.items())
+        return self._cabecera() + [f"{self.nombre}{_etiquetas(self.etiquetas, k)} {_numero(v)}" for k, v in valores]
+
+class Medidor(_Metrica):
+    """Valor que sube y baja (p. ej. tamaño del archivo de la base de datos)."""
+    tipo = "gauge"
+
+    def set(self, valor: float, *etiquetas: str):
+        with self._lock:
+            self._valores[etiquetas] = valor
+
+    def set_max(self, valor: float, *etiquetas: str):
+        """Actualiza el valor solo si es mayor que el actual."""
+        with self._lock:
+            if valor > self._valores.get(etiquetas, float("-inf")):
+                self._valores[etiquetas] = valor
+
+    def remove(self, *etiquetas: str):
+        with self._lock:
+            self._valores.pop(etiquetas, None)
+
+    def get(self, *etiquetas: str, default=None):
+        return self._valores.get(etiquetas, default)
+
+    def render(self) -> List[str]:
+        with self._lock:
+            valores = list(self._valores.items())
+        return self._cabecera() + [f"{self.nombre}{_etiquetas(self.etiquetas, k)} {_numero(v)}" for k, v in valores]
+
+class Histograma(_Metrica):
+    """Distribución de duraciones en intervalos fijos, más su suma y conteo."""
+    tipo = "histogram"
+
+    def __init__(self, nombre: str, ayuda: str, etiquetas: Sequence[str] = (), limites: Sequence[float] = LIMITES_LATENCIA):
+        super().__init__(nombre, ayuda, etiquetas)
+        self.limites = tuple(limites)
+
+    def observe(self, valor: float, *etiquetas: str):
+        indice = bisect.bisect_left(self.limites, valor)
+        with self._lock:
+            datos = self._valores.get(etiquetas)
+            if datos is None:
+                datos = self._valores[etiquetas] = [[0] * (len(self.limites) + 1), 0.0, 0]
+            datos[0][indice] += 1
+            datos[1] += valor
+            datos[2] += 1
+
+    def render(self) -> List[str]:
+        with self._lock:
+            valores = [(k, (list(v[0]), v[1], v[2])) for k, v in self._valores.items()]
+        lineas = self._cabecera()
+        for k, (cubetas, suma, cantidad) in valores:
+            acumulado = 0
+            for limite, n in zip(self.limites, cubetas):
+                acumulado += n
+                le = 'le="%s"' % limite
+                lineas.append(f"{self.nombre}_bucket{_etiquetas(self.etiquetas, k, le)} {acumulado}")
+            le = 'le="+Inf"'
+            lineas.append(f"{self.nombre}_bucket{_etiquetas(self.etiquetas, k, le)} {cantidad}")
+            lineas.append(f"{self.nombre}_sum{_etiquetas(self.etiquetas, k)} {suma!r}")
+            lineas.append(f"{self.nombre}_count{_etiquetas(self.etiquetas, k)} {cantidad}")
+        return lineas
+
+REGISTRO: List[_Metrica] = []
+
+def render() -> str:
+    """Todas las métricas en el formato de texto de Prometheus."""
+    return "\n".join(linea for metrica in REGISTRO for linea in metrica.render()) + "\n"
+
+# --- Métricas de la aplicación ---
+
+peticiones_http = Contador("http_requests_total", "Peticiones HTTP atendidas.", ("method", "route", "status"))
+duracion_http = Histograma("http_request_duration_seconds", "Tiempo hasta el inicio de la respuesta HTTP.", ("method", "route"))
+duracion_crud = Histograma("crud_duration_seconds", "Duración de cada función del CRUD (consultas SQLite), sin la espera por un hilo.", ("funcion",))
+espera_hilo_db = Histograma("db_executor_wait_seconds", "Espera de una función del CRUD por un hilo libre del pool de base de datos.")
+espera_conexion = Histograma("db_pool_acquire_seconds", "Espera por una conexión libre del pool de SQLite.")
+lecturas_insertadas = Contador("lecturas_insertadas_total", "Lecturas de sensores guardadas (rate() da las lecturas por segundo).")
+ultima_lectura_controlador = Medidor("controlador_ultima_lectura_timestamp_seconds", "Hora (epoch) de la última lectura guardada de cada controlador.", ("uuid_controlador",))
+tamano_base_datos = Medidor("sqlite_file_size_bytes", "Tamaño en disco de los archivos de la base de datos.", ("archivo",))
+cola_ingesta = Medidor("ingesta_cola_pendientes", "Lecturas en la cola de la ingesta diferida.")
+
+class MetricasHTTP:
+    """
+    Middleware ASGI que cuenta las peticiones y mide su latencia por ruta (la plantilla, p. ej.
+    /api/controller/{uuid_controlador}, para no crear una serie por cada UUID). Se mide hasta el inicio
+    de la respuesta, así los streams (SSE, exportaciones) no quedan abiertos en la medición.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        inicio = time.perf_counter()
+
+        async def send_medido(mensaje):
+            if mensaje["type"] == "http.response.start":
+                ruta = getattr(scope.get("route"), "path", "sin_ruta")
+                duracion_http.observe(time.perf_counter() - inicio, scope["method"], ruta)
+                peticiones_http.inc(scope["method"], ruta, str(mensaje["status"]))
+            await send(mensaje)
+
+        await self.app(scope, receive, send_medido)
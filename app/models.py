@@ -1,7 +1,7 @@
 # models.py
 from pydantic import BaseModel, Field, ConfigDict
 from datetime import datetime
-from typing import Optional
+from typing import Dict, List, Optional
 import uuid
 from enum import Enum
 
@@ -61,9 +61,30 @@ class Controlador(ControladorBase):
     uuid_controlador: uuid.UUID = Field(..., description="Llave primaria única por cada controlador")
     uuid_ensayo_generico: uuid.UUID = Field(..., description="Llave foránea de un ensayo genérico asignado")
     timestamp_registro: datetime = Field(..., description="Fecha y hora de creación formateada en ISO8601 para el huso horario de Colombia UTC-5")
+    # Valores de la última lectura, que la ingesta mantiene en la tabla controladores
+    ultima_lectura: Optional[datetime] = Field(None, description="Hora de la última lectura recibida en formato ISO8601 huso horario de Colombia UTC-5")
+    temperatura_sensor_1: Optional[float] = Field(None, description="Última temperatura del sensor 1 en °C")
+    humedad_sensor_1: Optional[float] = Field(None, description="Última humedad relativa del sensor 1 (%)")
+    temperatura_sensor_2: Optional[float] = Field(None, description="Última temperatura del sensor 2 en °C")
+    humedad_sensor_2: Optional[float] = Field(None, description="Última humedad relativa del sensor 2 (%)")
+    temperatura_sensor_3: Optional[float] = Field(None, description="Última temperatura del sensor 3 en °C")
+    humedad_sensor_3: Optional[float] = Field(None, description="Última humedad relativa del sensor 3 (%)")
+    temperatura_sensor_4: Optional[float] = Field(None, description="Última temperatura del sensor 4 en °C")
+    humedad_sensor_4: Optional[float] = Field(None, description="Última humedad relativa del sensor 4 (%)")
 
     model_config = ConfigDict(from_attributes=True)
 
+class SaludControlador(BaseModel):
+    """
+    Estado de actividad de un controlador para el panel de salud de la flota.
+    """
+    uuid_controlador: uuid.UUID = Field(..., description="Llave primaria única por cada controlador")
+    nombre_controlador: str = Field(..., description="Nombre para identificar el controlador")
+    estado: EstadoControlador = Field(..., description="Estado actual del controlador")
+    bateria: Optional[float] = Field(None, description="Voltaje de la batería del último valor reportado")
+    ultima_lectura: Optional[datetime] = Field(None, description="Hora de la última lectura recibida en formato ISO8601 huso horario de Colombia UTC-5")
+    segundos_sin_reportar: Optional[float] = Field(None, description="Segundos desde la última lectura recibida (nulo si nunca ha reportado)")
+
 # --- Modelos para Ensayos ---
 
 class EnsayoBase(BaseModel):
@@ -117,6 +138,161 @@ class LecturaSensor(LecturaSensorBase):
 
     model_config = ConfigDict(from_attributes=True)
 
+class LecturaSensorAgregada(BaseModel):
+    """
+    Resumen de las lecturas de un sensor dentro de un intervalo de tiempo (bucket).
+    """
+    uuid_controlador: uuid.UUID = Field(..., description="Controlador desde el cual se realizaron las lecturas")
+    id_sensor: int = Field(..., ge=1, le=4, description="Número del 1-4 para identificar el sensor")
+    inicio: datetime = Field(..., description="Inicio del intervalo en formato ISO8601 huso horario de Colombia UTC-5")
+    cantidad: int = Field(..., description="Número de lecturas en el intervalo")
+    temperatura_min: float = Field(..., description="Temperatura mínima del intervalo en °C")
+    temperatura_prom: float = Field(..., description="Temperatura promedio del intervalo en °C")
+    temperatura_max: float = Field(..., description="Temperatura máxima del intervalo en °C")
+    humedad_min: float = Field(..., description="Humedad relativa mínima del intervalo (%)")
+    humedad_prom: float = Field(..., description="Humedad relativa promedio del intervalo (%)")
+    humedad_max: float = Field(..., description="Humedad relativa máxima del intervalo (%)")
+
+class PeriodoResumen(str, Enum):
+    """
+    Periodos para los que se mantienen resúmenes de lecturas.
+    """
+    hora = "hora"
+    dia = "dia"
+
+class FormatoExportacion(str, Enum):
+    """
+    Formatos de exportación de las lecturas de un ensayo.
+    """
+    csv = "csv"
+    ndjson = "ndjson"
+    parquet = "parquet"
+
+class ResumenLecturas(BaseModel):
+    """
+    Resumen precalculado de las lecturas de un sensor, dentro de un ensayo, durante una hora o un día.
+    """
+    periodo: PeriodoResumen = Field(..., description="Periodo del resumen (hora o dia)")
+    inicio: datetime = Field(..., description="Inicio del periodo en formato ISO8601 huso horario de Colombia UTC-5")
+    uuid_controlador: uuid.UUID = Field(..., description="Controlador desde el cual se realizaron las lecturas")
+    uuid_ensayo: uuid.UUID = Field(..., description="Ensayo al que pertenecen las lecturas")
+    id_sensor: int = Field(..., ge=1, le=4, description="Número del 1-4 para identificar el sensor")
+    cantidad: int = Field(..., description="Número de lecturas en el periodo")
+    temperatura_min: float = Field(..., description="Temperatura mínima en °C")
+    temperatura_prom: float = Field(..., description="Temperatura promedio en °C")
+    temperatura_max: float = Field(..., description="Temperatura máxima en °C")
+    temperatura_desv: float = Field(..., description="Desviación estándar de la temperatura en °C")
+    humedad_min: float = Field(..., description="Humedad relativa mínima (%)")
+    humedad_prom: float = Field(..., description="Humedad relativa promedio (%)")
+    humedad_max: float = Field(..., description="Humedad relativa máxima (%)")
+    humedad_desv: float = Field(..., description="Desviación estándar de la humedad relativa (%)")
+    bateria_min: Optional[float] = Field(None, description="Voltaje mínimo de batería reportado")
+    bateria_prom: Optional[float] = Field(None, description="Voltaje promedio de batería reportado")
+    bateria_max: Optional[float] = Field(None, description="Voltaje máximo de batería reportado")
+
+class EstadisticasVariable(BaseModel):
+    """
+    Estadísticas de una variable (temperatura o humedad) de un sensor durante todo un ensayo.
+    """
+    promedio: float = Field(..., description="Promedio de las lecturas")
+    desviacion: float = Field(..., description="Desviación estándar (poblacional) de las lecturas")
+    minimo: float = Field(..., description="Lectura mínima")
+    maximo: float = Field(..., description="Lectura máxima")
+    percentiles: Dict[str, float] = Field(..., description="Percentiles 5, 25, 50, 75 y 95 (claves p5, p25, p50, p75 y p95)")
+    segundos_sobre_umbral: float = Field(..., description="Tiempo con la lectura por encima del umbral, en segundos")
+    fraccion_sobre_umbral: float = Field(..., description="Fracción (0 a 1) del tiempo medido con la lectura por encima del umbral")
+
+class EstadisticasSensor(BaseModel):
+    """
+    Estadísticas de un sensor dentro de un ensayo.
+    """
+    id_sensor: int = Field(..., ge=1, le=4, description="Número del 1-4 para identificar el sensor")
+    cantidad: int = Field(..., description="Número de lecturas del sensor")
+    inicio: datetime = Field(..., description="Primera lectura en formato ISO8601 huso horario de Colombia UTC-5")
+    fin: datetime = Field(..., description="Última lectura en formato ISO8601 huso horario de Colombia UTC-5")
+    temperatura: EstadisticasVariable = Field(..., description="Estadísticas de la temperatura en °C")
+    humedad: EstadisticasVariable = Field(..., description="Estadísticas de la humedad relativa (%)")
+    tasa_secado: Optional[float] = Field(None, description="Pendiente de la humedad en el tiempo por mínimos cuadrados, en % por hora (negativa mientras se seca)")
+    diferencia_temperatura: Optional[float] = Field(None, description="Diferencia promedio con el promedio de los sensores en la misma ventana de tiempo, en °C")
+    diferencia_humedad: Optional[float] = Field(None, description="Diferencia promedio con el promedio de los sensores en la misma ventana de tiempo, en %")
+
+class DivergenciaSensores(BaseModel):
+    """
+    Diferencia entre los sensores de un ensayo: rango (máximo menos mínimo) entre sus promedios
+    en cada ventana de tiempo en la que reportaron al menos dos sensores.
+    """
+    ventanas: int = Field(..., description="Ventanas de tiempo con lecturas de al menos dos sensores")
+    temperatura_prom: Optional[float] = Field(None, description="Rango promedio de temperatura entre sensores en °C")
+    temperatura_max: Optional[float] = Field(None, description="Rango máximo de temperatura entre sensores en °C")
+    humedad_prom: Optional[float] = Field(None, description="Rango promedio de humedad entre sensores (%)")
+    humedad_max: Optional[float] = Field(None, description="Rango máximo de humedad entre sensores (%)")
+
+class EstadisticasEnsayo(BaseModel):
+    """
+    Resumen estadístico de todas las lecturas de un ensayo, por sensor.
+    """
+    uuid_ensayo: uuid.UUID = Field(..., description="Ensayo al que pertenecen las lecturas")
+    cantidad: int = Field(..., description="Número total de lecturas del ensayo (incluidas las archivadas)")
+    umbral_temperatura: float = Field(..., description="Umbral de temperatura usado en °C")
+    umbral_humedad: float = Field(..., description="Umbral de humedad usado (%)")
+    ventana_s: int = Field(..., description="Tamaño en segundos de las ventanas usadas para comparar sensores")
+    sensores: List[EstadisticasSensor] = Field(..., description="Estadísticas por sensor, ordenadas por id_sensor")
+    divergencia: DivergenciaSensores = Field(..., description="Diferencia entre los sensores del ensayo")
+
+class SensorPanel(BaseModel):
+    """
+    Última lectura de un sensor y sus extremos de las últimas 24 horas, para el panel general.
+    """
+    id_sensor: int = Field(..., ge=1, le=4, description="Número del 1-4 para identificar el sensor")
+    ultima_lectura: Optional[LecturaSensor] = Field(None, description="Última lectura del sensor (nula si nunca ha reportado)")
+    temperatura_min_24h: Optional[float] = Field(None, description="Temperatura mínima de las últimas 24 horas en °C")
+    temperatura_max_24h: Optional[float] = Field(None, description="Temperatura máxima de las últimas 24 horas en °C")
+    humedad_min_24h: Optional[float] = Field(None, description="Humedad relativa mínima de las últimas 24 horas (%)")
+    humedad_max_24h: Optional[float] = Field(None, description="Humedad relativa máxima de las últimas 24 horas (%)")
+
+class ControladorPanel(BaseModel):
+    """
+    Un controlador con su ensayo activo y el estado de sus sensores, para el panel general.
+    """
+    controlador: Controlador = Field(..., description="Datos del controlador")
+    ensayo_activo: Optional[Ensayo] = Field(None, description="Ensayo al que se asignan sus lecturas")
+    sensores: List[SensorPanel] = Field(..., description="Los 4 sensores del controlador, ordenados por id_sensor")
+
+class MetricasIngesta(BaseModel):
+    """
+    Estado de la ingesta de lecturas (cola en memoria y commits agrupados).
+    """
+    diferida: bool = Field(..., description="Indica si la ingesta diferida (write-behind) está activa")
+    pendientes: int = Field(0, description="Lecturas en cola esperando ser guardadas")
+    capacidad: int = Field(0, description="Máximo de lecturas que admite la cola")
+    lecturas_guardadas: int = Field(0, description="Lecturas guardadas por el escritor desde el arranque")
+    lecturas_rechazadas: int = Field(0, description="Lecturas rechazadas por cola llena")
+    lecturas_perdidas: int = Field(0, description="Lecturas descartadas tras fallar su guardado")
+    commits: int = Field(0, description="Commits realizados por el escritor")
+    commit_ms_ultimo: float = Field(0.0, description="Duración del último commit en milisegundos")
+    commit_ms_promedio: float = Field(0.0, description="Duración promedio de los commits en milisegundos")
+    commit_ms_max: float = Field(0.0, description="Duración máxima de un commit en milisegundos")
+
+class ResultadoArchivo(BaseModel):
+    """
+    Resultado de una ejecución del archivado de lecturas antiguas.
+    """
+    lecturas_archivadas: int = Field(..., description="Lecturas movidas de sensores.db a los archivos mensuales")
+    por_mes: Dict[str, int] = Field(..., description="Lecturas archivadas por mes (AAAA-MM, hora de Colombia)")
+    completo: bool = Field(..., description="False si se alcanzó el máximo y quedan lecturas por archivar")
+
+class ConsultaLenta(BaseModel):
+    """
+    Sentencia SQL que superó el umbral de duración del registro de consultas lentas.
+    """
+    momento: datetime = Field(..., description="Hora en que se ejecutó la sentencia (zona horaria Colombia)")
+    duracion_ms: float = Field(..., description="Duración de la ejecución más la lectura de sus filas, en milisegundos")
+    sql: str = Field(..., description="Texto de la sentencia")
+    parametros: List[str] = Field(..., description="Parámetros con los textos y blobs ocultos (solo su tamaño)")
+    filas_lote: int = Field(1, description="Conjuntos de parámetros enviados con executemany (1 para execute)")
+    origen: str = Field(..., description="Función que ejecutó la sentencia")
+    plan: List[str] = Field(..., description="Salida de EXPLAIN QUERY PLAN")
+
 # --- Modelos para Usuarios (Autenticación) ---
 
 class UserBase(BaseModel):
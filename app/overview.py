@@ -0,0 +1,68 @@
+# overview.py
+import os
+import threading
+from datetime import datetime, timedelta
+from typing import List, Optional
+
+from pydantic import TypeAdapter
+
+import crud
+from cache import Cache
+from models import ControladorPanel, SensorPanel
+
+# --- Configuración del panel general ---
+# Segundos durante los que se reutiliza el panel ya armado: con muchas pestañas abiertas la base de
+# datos recibe a lo sumo una consulta del panel por periodo, no una por petición
+PANEL_CACHE_TTL_S = float(os.getenv("PANEL_CACHE_TTL_S", "5"))
+
+# Una sola entrada: el JSON del panel ya serializado
+panel_cache = Cache(max_entradas=1, ttl=PANEL_CACHE_TTL_S)
+# Evita que varias peticiones que llegan justo al expirar la entrada armen el panel a la vez
+_panel_lock = threading.Lock()
+
+_adaptador_panel = TypeAdapter(List[ControladorPanel])
+
+def armar_panel(ahora: Optional[datetime] = None) -> List[ControladorPanel]:
+    """
+    Todos los controladores con su ensayo activo y, por sensor, la última lectura y los extremos de
+    las últimas 24 horas. Son dos consultas sin importar cuántos controladores haya (controladores con
+    su ensayo, y los resúmenes por hora de todos a la vez); las últimas lecturas salen de memoria.
+    Las 24 horas se cuentan por horas completas: la hora en curso y las 23 anteriores.
+    """
+    ahora = ahora or datetime.now(crud.COLOMBIA_TIMEZONE)
+    desde = ahora.replace(minute=0, second=0, microsecond=0) - timedelta(hours=23)
+    controladores = crud.get_controladores_con_ensayo()
+    extremos = crud.get_extremos_recientes(desde)
+    ultimas = crud.get_latest_lecturas_controladores()
+    panel = []
+    for controlador, ensayo in controladores:
+        clave = str(controlador.uuid_controlador)
+        por_sensor = ultimas.get(controlador.uuid_controlador, {})
+        sensores = []
+        for id_sensor in range(1, crud.SENSORES_POR_CONTROLADOR + 1):
+            temperatura_min, temperatura_max, humedad_min, humedad_max = extremos.get((clave, id_sensor), (None,) * 4)
+            sensores.append(SensorPanel(
+                id_sensor=id_sensor,
+                ultima_lectura=por_sensor.get(id_sensor),
+                temperatura_min_24h=temperatura_min,
+                temperatura_max_24h=temperatura_max,
+                humedad_min_24h=humedad_min,
+                humedad_max_24h=humedad_max,
+            ))
+        panel.append(ControladorPanel(controlador=controlador, ensayo_activo=ensayo, sensores=sensores))
+    return panel
+
+def get_panel_json() -> bytes:
+    """
+    Panel general ya serializado a JSON, desde la caché si se armó hace menos de PANEL_CACHE_TTL_S
+    segundos. Los cambios (lecturas nuevas, controladores o ensayos) se ven al expirar la entrada.
+    """
+    cuerpo = panel_cache.get("panel")
+    if cuerpo is not None:
+        return cuerpo
+    with _panel_lock:
+        cuerpo = panel_cache.get("panel") # Otra petición pudo armarlo mientras se esperaba el lock
+        if cuerpo is None:
+            cuerpo = _adaptador_panel.dump_json(armar_panel())
+            panel_cache.set("panel", cuerpo)
+    return cuerpo
@@ -0,0 +1,330 @@
+# profiling.py
+import os
+import sqlite3
+import sys
+import threading
+import time
+from collections import Counter, deque
+from datetime import datetime
+from typing import Callable, List, Optional
+
+import pytz
+
+# --- Configuración del registro de consultas lentas ---
+# Las sentencias que tardan más de estos milisegundos (ejecución más lectura de sus filas) se guardan
+# con su EXPLAIN QUERY PLAN en un buffer circular que se consulta en GET /api/admin/slow-queries (0 lo desactiva)
+CONSULTA_LENTA_MS = float(os.getenv("CONSULTA_LENTA_MS", "100"))
+# Consultas lentas que se conservan (las más antiguas se descartan)
+CONSULTAS_LENTAS_MAX = int(os.getenv("CONSULTAS_LENTAS_MAX", "200"))
+
+# --- Configuración del perfilado por petición ---
+# Permite perfilar una petición con ?profile=1 o la cabecera X-Profile: 1 (requiere un token válido)
+PERFILADO_ACTIVO = os.getenv("PERFILADO_ACTIVO", "1").lower() in ("1", "true", "si", "sí")
+# Milisegundos entre muestras de las pilas de los hilos
+PERFILADO_INTERVALO_MS = float(os.getenv("PERFILADO_INTERVALO_MS", "2"))
+# Duración máxima del muestreo de una petición, en segundos
+PERFILADO_MAX_S = float(os.getenv("PERFILADO_MAX_S", "30"))
+
+COLOMBIA_TIMEZONE = pytz.timezone('America/Bogota')
+
+_consultas_lentas: "deque[dict]" = deque(maxlen=CONSULTAS_LENTAS_MAX)
+_consultas_lock = threading.Lock()
+
+def _ocultar(valor) -> str:
+    """Representa un parámetro sin revelar textos ni blobs (contraseñas, correos, UUIDs)."""
+    if valor is None:
+        return "NULL"
+    if isinstance(valor, (int, float)):
+        return str(valor)
+    if isinstance(valor, (bytes, bytearray, memoryview)):
+        return f"<{len(valor)} bytes>"
+    return f"<texto de {len(str(valor))} caracteres>"
+
+def _origen() -> str:
+    """Primera función fuera de este módulo en la pila: la que ejecutó la sentencia."""
+    frame = sys._getframe(1)
+    while frame is not None and frame.f_code.co_filename == __file__:
+        frame = frame.f_back
+    if frame is None:
+        return "desconocido"
+    return f"{frame.f_code.co_name} ({os.path.basename(frame.f_code.co_filename)}:{frame.f_lineno})"
+
+def _registrar(cursor: sqlite3.Cursor, duracion: float) -> dict:
+    plan = []
+    try:
+        # Cursor base: el EXPLAIN no se mide ni se registra
+        explicacion = sqlite3.Cursor(cursor.connection)
+        explicacion.execute("EXPLAIN QUERY PLAN " + cursor._sql, cursor._parametros)
+        plan = [fila[3] for fila in explicacion.fetchall()]
+        explicacion.close()
+    except sqlite3.Error as e:
+        plan = [f"No se pudo obtener el plan: {e}"]
+    parametros = cursor._parametros.values() if isinstance(cursor._parametros, dict) else cursor._parametros
+    registro = {
+        "momento": datetime.now(COLOMBIA_TIMEZONE),
+        "duracion_ms": duracion * 1000,
+        "sql": " ".join(cursor._sql.split()),
+        "parametros": [_ocultar(valor) for valor in parametros],
+        "filas_lote": cursor._filas_lote,
+        "origen": _origen(),
+        "plan": plan,
+    }
+    with _consultas_lock:
+        _consultas_lentas.append(registro)
+    return registro
+
+class CursorMedido(sqlite3.Cursor):
+    """
+    Cursor que mide cada sentencia, sumando la ejecución y las llamadas a fetch* de sus filas,
+    y la registra cuando supera CONSULTA_LENTA_MS.
+    """
+    _registro = None
+
+    def _medir(self, inicio: float):
+        self._duracion += time.perf_counter() - inicio
+        if self._duracion * 1000 < CONSULTA_LENTA_MS:
+            return
+        if self._registro is None:
+            self._registro = _registrar(self, self._duracion)
+        else:
+            self._registro["duracion_ms"] = self._duracion * 1000
+
+    def execute(self, sql, parametros=()):
+        self._sql, self._parametros, self._filas_lote = sql, parametros, 1
+        self._duracion, self._registro = 0.0, None
+        inicio = time.perf_counter()
+        try:
+            return super().execute(sql, parametros)
+        finally:
+            self._medir(inicio)
+
+    def executemany(self, sql, lista_parametros):
+        lista_parametros = list(lista_parametros)
+        self._sql, self._parametros, self._filas_lote = sql, lista_parametros[0] if lista_parametros else (), len(lista_parametros)
+        self._duracion, self._registro = 0.0, None
+        inicio = time.perf_counter()
+        try:
+            return super().executemany(sql, lista_parametros)
+        finally:
+            self._medir(inicio)
+
+    def fetchone(self):
+        inicio = time.perf_counter()
+        try:
+            return super().fetchone()
+        finally:
+            self._medir(inicio)
+
+    def fetchmany(self, *args, **kwargs):
+        inicio = time.perf_counter()
+        try:
+            return super().fetchmany(*args, **kwargs)
+        finally:
+            self._medir(inicio)
+
+    def fetchall(self):
+        inicio = time.perf_counter()
+        try:
+            return super().fetchall()
+        finally:
+            self._medir(inicio)
+
+class ConexionMedida(sqlite3.Connection):
+    """Conexión cuyos cursores (también los de conn.execute) registran las consultas lentas."""
+
+    def cursor(self, factory=CursorMedido):
+        return super().cursor(factory)
+
+    def execute(self, sql, parametros=()):
+        return self.cursor().execute(sql, parametros)
+
+    def executemany(self, sql, lista_parametros):
+        return self.cursor().executemany(sql, lista_parametros)
+
+def fabrica_conexion():
+    """Clase de conexión para sqlite3.connect(factory=...): sin medición si el registro está desactivado."""
+    return ConexionMedida if CONSULTA_LENTA_MS > 0 else sqlite3.Connection
+
+def get_consultas_lentas() -> List[dict]:
+    """Consultas lentas registradas, la más reciente primero."""
+    with _consultas_lock:
+        return [dict(registro) for registro in reversed(_consultas_lentas)]
+
+def clear_consultas_lentas():
+    with _consultas_lock:
+        _consultas_lentas.clear()
+
+# --- Perfilado por muestreo ---
+
+# Marcos en los que un hilo solo está esperando trabajo (no cuentan como tiempo de la petición)
+_ESPERAS = {
+    ("selectors.py", "select"),
+    ("threading.py", "wait"),
+    ("queue.py", "get"),
+    ("thread.py", "_worker"),
+}
+
+class Muestreador(threading.Thread):
+    """
+    Toma cada `intervalo` segundos la pila de los hilos que atienden peticiones (event loop, hilos de
+    base de datos y del threadpool) y cuenta cuántas veces aparece cada una. Al ser por muestreo,
+    el costo no depende de cuántas funciones se llamen.
+    """
+
+    def __init__(
+        self, hilo_loop: int, intervalo: float = PERFILADO_INTERVALO_MS / 1000, duracion_max: float = PERFILADO_MAX_S,
+        al_terminar: Optional[Callable[[], None]] = None,
+    ):
+        super().__init__(name="perfilador", daemon=True)
+        self.hilo_loop = hilo_loop
+        self.intervalo = intervalo
+        self.duracion_max = duracion_max
+        self.al_terminar = al_terminar # Se llama al dejar de muestrear (detenido o al llegar a duracion_max)
+        self.pilas: Counter = Counter()
+        self.propias: Counter = Counter()
+        self.muestras = 0
+        self.inactivas = 0
+        self._detener = threading.Event()
+        self._inicio = time.perf_counter()
+        self.duracion = 0.0
+
+    def _nombre_hilo(self, ident: int, nombres: dict) -> str:
+        if ident == self.hilo_loop:
+            return "event-loop"
+        nombre = nombres.get(ident, "")
+        if nombre.startswith("sqlite") or nombre.startswith("AnyIO worker") or nombre.startswith("escritor-lecturas"):
+            return nombre
+        return ""
+
+    def run(self):
+        try:
+            self._muestrear()
+        finally:
+            if self.al_terminar:
+                self.al_terminar()
+
+    def _muestrear(self):
+        while not self._detener.wait(self.intervalo):
+            if time.perf_counter() - self._inicio > self.duracion_max:
+                break
+            nombres = {hilo.ident: hilo.name for hilo in threading.enumerate()}
+            self.muestras += 1
+            for ident, frame in sys._current_frames().items():
+                hilo = self._nombre_hilo(ident, nombres)
+                if not hilo:
+                    continue
+                codigo = frame.f_code
+                if (os.path.basename(codigo.co_filename), codigo.co_name) in _ESPERAS:
+                    self.inactivas += 1
+                    continue
+                pila = []
+                while frame is not None:
+                    codigo = frame.f_code
+                    pila.append(f"{codigo.co_name} ({os.path.basename(codigo.co_filename)}:{codigo.co_firstlineno})")
+                    frame = frame.f_back
+                self.propias[pila[0]] += 1
+                self.pilas[";".join([hilo] + pila[::-1])] += 1
+        self.duracion = time.perf_counter() - self._inicio
+
+    def detener(self):
+        self._detener.set()
+        self.join()
+
+    def reporte(self, titulo: str) -> str:
+        """Pilas en formato "collapsed" (se abre en speedscope.app o con flamegraph.pl), precedidas de un resumen."""
+        lineas = [
+            f"# {titulo}",
+            f"# {self.duracion * 1000:.1f} ms, {self.muestras} muestras cada {self.intervalo * 1000:g} ms, {self.inactivas} de hilos en espera descartadas",
+            "# Funciones con más muestras propias:",
+        ]
+        lineas += [f"#   {cantidad:6d}  {funcion}" for funcion, cantidad in self.propias.most_common(15)]
+        lineas += [f"{pila} {cantidad}" for pila, cantidad in self.pilas.most_common()]
+        return "\n".join(lineas) + "\n"
+
+# Cabeceras de la respuesta original que describen su cuerpo y no aplican al perfil en texto
+_CABECERAS_DEL_CUERPO = {
+    b"content-type", b"content-length", b"content-encoding", b"content-disposition",
+    b"transfer-encoding", b"etag", b"last-modified", b"cache-control",
+}
+
+def _una_vez(funcion: Callable[[], None]) -> Callable[[], None]:
+    """Envuelve `funcion` para que solo se ejecute la primera vez que se llama, desde cualquier hilo."""
+    lock = threading.Lock()
+    llamada = []
+
+    def envoltura():
+        with lock:
+            if llamada:
+                return
+            llamada.append(True)
+        funcion()
+    return envoltura
+
+class PerfiladoPeticiones:
+    """
+    Middleware ASGI: si la petición trae ?profile=1 o la cabecera X-Profile: 1 y `autorizado(scope)` lo
+    permite, la atiende normalmente bajo el Muestreador y responde el perfil (text/plain) en lugar del
+    cuerpo original, con las cabeceras originales (CORS incluidas) salvo las que describen ese cuerpo; el
+    estado original va en la cabecera X-Profile-Status. Se perfila una petición a la vez: el turno se
+    libera al terminar el muestreo (a más tardar a los PERFILADO_MAX_S segundos), aunque la respuesta
+    siga enviándose. Los streams (text/event-stream) no terminan: se responden sin perfilar.
+    """
+
+    def __init__(self, app, autorizado: Callable[[dict], bool]):
+        self.app = app
+        self.autorizado = autorizado
+        self._en_uso = threading.Lock()
+
+    @staticmethod
+    def _solicitado(scope) -> bool:
+        if (b"x-profile", b"1") in scope.get("headers", []):
+            return True
+        return any(parte in (b"profile=1", b"profile=true") for parte in scope.get("query_string", b"").split(b"&"))
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not PERFILADO_ACTIVO or not self._solicitado(scope) or not self.autorizado(scope):
+            await self.app(scope, receive, send)
+            return
+        if not self._en_uso.acquire(blocking=False):
+            await self.app(scope, receive, send)
+            return
+
+        liberar = _una_vez(self._en_uso.release)
+        muestreador = Muestreador(threading.get_ident(), duracion_max=PERFILADO_MAX_S, al_terminar=liberar)
+        estado = {"codigo": 500, "cabeceras": [], "stream": False}
+
+        async def send_perfil(mensaje):
+            if estado["stream"]:
+                await send(mensaje)
+            elif mensaje["type"] == "http.response.start":
+                cabeceras = list(mensaje.get("headers", []))
+                if any(nombre.lower() == b"content-type" and valor.startswith(b"text/event-stream") for nombre, valor in cabeceras):
+                    # Un stream no termina: se deja pasar sin perfilar y se libera el turno de inmediato
+                    estado["stream"] = True
+                    muestreador.detener()
+                    await send({**mensaje, "headers": cabeceras + [(b"x-profile-status", b"omitido")]})
+                    return
+                estado["codigo"] = mensaje["status"]
+                estado["cabeceras"] = [(nombre, valor) for nombre, valor in cabeceras if nombre.lower() not in _CABECERAS_DEL_CUERPO]
+            elif mensaje["type"] == "http.response.body" and not mensaje.get("more_body", False):
+                muestreador.detener()
+                cuerpo = muestreador.reporte(f"Perfil de {scope['method']} {scope['path']} (estado {estado['codigo']})").encode()
+                await send({
+                    "type": "http.response.start",
+                    "status": 200,
+                    "headers": estado["cabeceras"] + [
+                        (b"content-type", b"text/plain; charset=utf-8"),
+                        (b"content-length", str(len(cuerpo)).encode()),
+                        (b"cache-control", b"no-store"),
+                        (b"x-profile-status", str(estado["codigo"]).encode()),
+                    ],
+                })
+                await send({"type": "http.response.body", "body": cuerpo})
+
+        try:
+            muestreador.start()
+            await self.app(scope, receive, send_perfil)
+        finally:
+            if muestreador.is_alive():
+                muestreador.detener()
+            liberar()
@@ -0,0 +1,155 @@
+# stats.py
+import os
+import uuid
+from datetime import datetime
+from typing import Optional
+
+import crud
+from cache import Cache
+from models import DivergenciaSensores, EstadisticasEnsayo, EstadisticasSensor, EstadisticasVariable
+
+# numpy (requirements.txt) solo se usa en las estadísticas de ensayos; si falta, el endpoint responde 501
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# --- Configuración de las estadísticas por ensayo ---
+# Umbrales por defecto del tiempo sobre umbral (se pueden cambiar en cada consulta)
+ESTADISTICAS_UMBRAL_TEMPERATURA = float(os.getenv("ESTADISTICAS_UMBRAL_TEMPERATURA", "40"))
+ESTADISTICAS_UMBRAL_HUMEDAD = float(os.getenv("ESTADISTICAS_UMBRAL_HUMEDAD", "70"))
+# Tiempo máximo, en segundos, que se atribuye a una lectura: un hueco mayor (controlador apagado)
+# no cuenta completo en el tiempo sobre umbral
+ESTADISTICAS_MAX_HUECO_S = float(os.getenv("ESTADISTICAS_MAX_HUECO_S", "900"))
+# Tamaño de las ventanas de tiempo en las que se comparan los sensores entre sí
+ESTADISTICAS_VENTANA_S = int(os.getenv("ESTADISTICAS_VENTANA_S", "60"))
+
+PERCENTILES = (5, 25, 50, 75, 95)
+
+# Resultados por (ensayo, umbrales): se reutilizan mientras no cambie la versión de las lecturas del ensayo
+estadisticas_cache = Cache(max_entradas=256)
+
+def numpy_disponible() -> bool:
+    return np is not None
+
+def _cargar_columnas(uuid_ensayo: uuid.UUID):
+    """
+    Lee las lecturas del ensayo en lotes y las junta en arreglos por columna (sensor, ts, temperatura,
+    humedad). Cada lote se convierte de una vez a un arreglo estructurado, sin recorrer filas en Python.
+    """
+    tipo = np.dtype([("sensor", np.int8), ("ts", np.int64), ("temperatura", np.float64), ("humedad", np.float64)])
+    lotes = [np.array(filas, dtype=tipo) for filas in crud.iter_series_ensayo(uuid_ensayo)]
+    datos = np.concatenate(lotes) if lotes else np.empty(0, dtype=tipo)
+    return datos["sensor"], datos["ts"], datos["temperatura"], datos["humedad"]
+
+def _estadisticas_variable(valores, duraciones, umbral: float) -> EstadisticasVariable:
+    """`duraciones[i]` es el tiempo (s) atribuido a la lectura i, hasta la siguiente del mismo sensor."""
+    percentiles = np.percentile(valores, PERCENTILES)
+    medido = float(duraciones.sum())
+    sobre_umbral = float(duraciones[valores > umbral].sum())
+    return EstadisticasVariable(
+        promedio=float(valores.mean()),
+        desviacion=float(valores.std()),
+        minimo=float(valores.min()),
+        maximo=float(valores.max()),
+        percentiles={f"p{p}": float(valor) for p, valor in zip(PERCENTILES, percentiles)},
+        segundos_sobre_umbral=sobre_umbral,
+        fraccion_sobre_umbral=sobre_umbral / medido if medido else 0.0,
+    )
+
+def _pendiente_por_hora(ts, valores) -> Optional[float]:
+    """Pendiente de la recta de mínimos cuadrados de `valores` contra el tiempo, en unidades por hora."""
+    horas = (ts - ts[0]) / 3_600_000
+    horas = horas - horas.mean()
+    denominador = float(np.dot(horas, horas))
+    if denominador == 0:
+        return None
+    return float(np.dot(horas, valores - valores.mean()) / denominador)
+
+def _comparar_sensores(sensor, ts, temperatura, humedad, ventana_s: int):
+    """
+    Promedia cada sensor por ventana de tiempo en una matriz ventanas x sensores (con bincount) y, en las
+    ventanas con al menos dos sensores, calcula el rango entre sensores y la diferencia de cada uno con el
+    promedio de la ventana. Retorna (ids de sensor, diferencias por variable y sensor, divergencia).
+    """
+    ids, columna = np.unique(sensor, return_inverse=True)
+    _, fila = np.unique((ts - ts.min()) // (ventana_s * 1000), return_inverse=True)
+    celdas = fila.max() + 1, len(ids)
+    indice = fila * len(ids) + columna
+    cantidad = np.bincount(indice, minlength=celdas[0] * celdas[1]).reshape(celdas)
+    comparables = (cantidad > 0).sum(axis=1) >= 2
+    presentes = cantidad[comparables] > 0
+    diferencias, divergencia = {}, {"ventanas": int(comparables.sum())}
+    for nombre, valores in (("temperatura", temperatura), ("humedad", humedad)):
+        if not divergencia["ventanas"]:
+            diferencias[nombre] = [None] * len(ids)
+            continue
+        sumas = np.bincount(indice, weights=valores, minlength=celdas[0] * celdas[1]).reshape(celdas)[comparables]
+        promedios = np.divide(sumas, cantidad[comparables], out=np.zeros_like(sumas), where=presentes)
+        maximos = np.where(presentes, promedios, -np.inf).max(axis=1)
+        minimos = np.where(presentes, promedios, np.inf).min(axis=1)
+        rangos = maximos - minimos
+        promedio_ventana = promedios.sum(axis=1) / presentes.sum(axis=1)
+        desvio = np.where(presentes, promedios - promedio_ventana[:, None], 0.0)
+        por_sensor = presentes.sum(axis=0)
+        diferencias[nombre] = [float(d / n) if n else None for d, n in zip(desvio.sum(axis=0), por_sensor)]
+        divergencia[f"{nombre}_prom"] = float(rangos.mean())
+        divergencia[f"{nombre}_max"] = float(rangos.max())
+    return ids, diferencias, DivergenciaSensores(**divergencia)
+
+def calcular_estadisticas(
+    sensor, ts, temperatura, humedad, uuid_ensayo: uuid.UUID,
+    umbral_temperatura: float, umbral_humedad: float, ventana_s: int = ESTADISTICAS_VENTANA_S,
+) -> EstadisticasEnsayo:
+    """Estadísticas del ensayo a partir de sus lecturas en arreglos por columna, en orden cronológico."""
+    sensores = []
+    divergencia = DivergenciaSensores(ventanas=0)
+    if len(ts):
+        ids, diferencias, divergencia = _comparar_sensores(sensor, ts, temperatura, humedad, ventana_s)
+        # Orden estable por sensor: cada sensor queda en un tramo contiguo y en orden cronológico
+        orden = np.argsort(sensor, kind="stable")
+        sensor, ts, temperatura, humedad = sensor[orden], ts[orden], temperatura[orden], humedad[orden]
+        cortes = np.flatnonzero(np.diff(sensor)) + 1
+        for i, (inicio, fin) in enumerate(zip(np.r_[0, cortes], np.r_[cortes, len(ts)])):
+            ts_sensor = ts[inicio:fin]
+            # La última lectura del sensor no tiene siguiente: no se le atribuye tiempo
+            duraciones = np.minimum(np.diff(ts_sensor, append=ts_sensor[-1]) / 1000, ESTADISTICAS_MAX_HUECO_S)
+            sensores.append(EstadisticasSensor(
+                id_sensor=int(ids[i]),
+                cantidad=int(fin - inicio),
+                inicio=datetime.fromtimestamp(ts_sensor[0] / 1000, crud.COLOMBIA_TIMEZONE),
+                fin=datetime.fromtimestamp(ts_sensor[-1] / 1000, crud.COLOMBIA_TIMEZONE),
+                temperatura=_estadisticas_variable(temperatura[inicio:fin], duraciones, umbral_temperatura),
+                humedad=_estadisticas_variable(humedad[inicio:fin], duraciones, umbral_humedad),
+                tasa_secado=_pendiente_por_hora(ts_sensor, humedad[inicio:fin]),
+                diferencia_temperatura=diferencias["temperatura"][i],
+                diferencia_humedad=diferencias["humedad"][i],
+            ))
+    return EstadisticasEnsayo(
+        uuid_ensayo=uuid_ensayo,
+        cantidad=len(ts),
+        umbral_temperatura=umbral_temperatura,
+        umbral_humedad=umbral_humedad,
+        ventana_s=ventana_s,
+        sensores=sensores,
+        divergencia=divergencia,
+    )
+
+def get_estadisticas_ensayo(
+    uuid_ensayo: uuid.UUID,
+    umbral_temperatura: float = ESTADISTICAS_UMBRAL_TEMPERATURA,
+    umbral_humedad: float = ESTADISTICAS_UMBRAL_HUMEDAD,
+) -> EstadisticasEnsayo:
+    """
+    Estadísticas de todas las lecturas de un ensayo (incluidas las archivadas), calculadas con operaciones
+    vectorizadas de numpy sobre las columnas cargadas en bloque. Se debe comprobar antes `numpy_disponible()`.
+    El resultado se guarda en caché hasta que el ensayo recibe lecturas nuevas o se archiva.
+    """
+    clave = (uuid_ensayo, umbral_temperatura, umbral_humedad)
+    version = crud.versiones.version("lecturas", uuid_ensayo)
+    guardado = estadisticas_cache.get(clave)
+    if guardado is not None and guardado[0] == version:
+        return guardado[1]
+    resultado = calcular_estadisticas(*_cargar_columnas(uuid_ensayo), uuid_ensayo, umbral_temperatura, umbral_humedad)
+    estadisticas_cache.set(clave, (version, resultado))
+    return resultado
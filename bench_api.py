@@ -0,0 +1,294 @@
+# bench_api.py
+"""
+Benchmark de ingesta y consultas con una flota simulada de controladores ESP32.
+
+Cada controlador simulado envía lo mismo que controller/controller.ino (un lote con sus 4 sensores)
+y consulta lo mismo que el panel web. Se mide req/s y latencia p50/p95/p99 con la tabla de lecturas
+en varios tamaños, y el resultado se guarda en JSON para comparar entre commits.
+
+Uso (desde la raíz del repositorio):
+    python bench_api.py                                   # ASGI en el mismo proceso, 10k y 100k filas
+    python bench_api.py --filas 10000,1000000,10000000 --controladores 50
+    python bench_api.py --comparar bench_anterior.json    # muestra la variación respecto a otra corrida
+
+Contra un uvicorn local, el servidor debe usar la misma base de datos que se llena aquí:
+    cd app && SENSORES_DB_PATH=/tmp/bench.db uvicorn main:app
+    python bench_api.py --url http://localhost:8000 --db /tmp/bench.db
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+
+import httpx
+
+ESCENARIOS = ("ingesta_lote", "ingesta_individual", "ultima_lectura", "panel_lecturas", "panel_pagina_maxima", "panel_historial", "panel_controladores", "panel_general")
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Benchmark de la API de sensores con una flota simulada de controladores.")
+    parser.add_argument("--url", default=None, help="URL de un servidor en ejecución (por defecto se usa la app en el mismo proceso).")
+    parser.add_argument("--db", default=None, help="Archivo SQLite a usar (por defecto uno temporal).")
+    parser.add_argument("--filas", default="10000,100000", help="Tamaños de la tabla de lecturas, separados por comas.")
+    parser.add_argument("--controladores", type=int, default=20, help="Controladores simulados (peticiones concurrentes).")
+    parser.add_argument("--peticiones", type=int, default=500, help="Peticiones por escenario y tamaño.")
+    parser.add_argument("--escenarios", default=",".join(ESCENARIOS), help="Escenarios a ejecutar, separados por comas.")
+    parser.add_argument("--salida", default=None, help="Archivo JSON de resultados (por defecto bench_<commit>.json).")
+    parser.add_argument("--comparar", default=None, help="JSON de una corrida anterior para mostrar la variación.")
+    parser.add_argument("--semilla", type=int, default=1234, help="Semilla de los datos generados.")
+    return parser.parse_args()
+
+
+ARGS = parse_args()
+# La base de datos se elige antes de importar la aplicación (database.py la abre al importarse)
+os.environ["SENSORES_DB_PATH"] = ARGS.db or str(Path(tempfile.mkdtemp()) / "bench.db")
+sys.path.insert(0, str(Path(__file__).resolve().parent / "app"))
+
+import crud  # noqa: E402
+import database  # noqa: E402
+
+
+def commit_actual() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "desconocido"
+
+
+def percentil(cortes, p):
+    return round(cortes[p - 1] * 1000, 3)
+
+
+# --- Datos de la tabla de lecturas ---
+
+class Sembrador:
+    """
+    Llena lecturas_sensor (y sus resúmenes) directamente en SQLite hasta el tamaño pedido, con lecturas
+    de los controladores de la flota cada minuto, hacia atrás desde el momento de arranque.
+    Insertar por la API 10M de lecturas tardaría horas; aquí solo interesa el tamaño de la tabla.
+    """
+
+    def __init__(self, flota, semilla: int):
+        self.flota = flota
+        self.rng = random.Random(semilla)
+        self.base_ms = database.to_epoch_ms(datetime.now(timezone.utc)) - 60_000
+        self.minuto = 0
+
+    def _ids(self, cursor):
+        uuids = [u for controlador in self.flota for u in (controlador["uuid_controlador"], controlador["uuid_ensayo_generico"])]
+        cursor.executemany("INSERT OR IGNORE INTO identificadores (uuid) VALUES (?)", [(u,) for u in uuids])
+        cursor.execute(f"SELECT uuid, id FROM identificadores WHERE uuid IN ({', '.join('?' for _ in uuids)})", uuids)
+        return dict(cursor.fetchall())
+
+    def llenar(self, total: int):
+        with database.get_db_connection() as conn:
+            cursor = conn.cursor()
+            actual = cursor.execute("SELECT COUNT(*) FROM lecturas_sensor").fetchone()[0]
+            ids = self._ids(cursor)
+            resumenes = {}
+            filas = []
+            while actual + len(filas) < total:
+                ts = self.base_ms - self.minuto * 60_000
+                self.minuto += 1
+                local = datetime.fromtimestamp(ts / 1000, timezone.utc) - timedelta(seconds=crud.DESFASE_COLOMBIA_S)
+                for controlador in self.flota:
+                    for id_sensor in range(1, 5):
+                        temperatura = round(self.rng.uniform(15, 45), 2)
+                        humedad = round(self.rng.uniform(20, 90), 2)
+                        filas.append((
+                            self.rng.getrandbits(128).to_bytes(16, "big"),
+                            ids[controlador["uuid_controlador"]],
+                            ids[controlador["uuid_ensayo_generico"]],
+                            id_sensor, ts, temperatura, humedad, None,
+                        ))
+                        for periodo, inicio in (("hora", local.strftime("%Y-%m-%dT%H:00:00-05:00")), ("dia", local.strftime("%Y-%m-%dT00:00:00-05:00"))):
+                            clave = (periodo, inicio, controlador["uuid_controlador"], controlador["uuid_ensayo_generico"], id_sensor)
+                            r = resumenes.setdefault(clave, [0, 0.0, temperatura, temperatura, 0.0, 0.0, humedad, humedad, 0.0])
+                            r[0] += 1
+                            r[1] += temperatura; r[2] = min(r[2], temperatura); r[3] = max(r[3], temperatura); r[4] += temperatura * temperatura
+                            r[5] += humedad; r[6] = min(r[6], humedad); r[7] = max(r[7], humedad); r[8] += humedad * humedad
+                if len(filas) >= 50_000:
+                    cursor.executemany("INSERT INTO lecturas_sensor VALUES (NULL, ?, ?, ?, ?, ?, ?, ?, ?)", filas)
+                    actual += len(filas)
+                    filas = []
+            cursor.executemany("INSERT INTO lecturas_sensor VALUES (NULL, ?, ?, ?, ?, ?, ?, ?, ?)", filas)
+            cursor.executemany(
+                """
+                INSERT INTO resumen_lecturas VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, 0, NULL, NULL, NULL, NULL)
+                ON CONFLICT (periodo, uuid_controlador, uuid_ensayo, id_sensor, inicio) DO UPDATE SET
+                    cantidad = cantidad + excluded.cantidad,
+                    temperatura_suma = temperatura_suma + excluded.temperatura_suma,
+                    temperatura_min = MIN(temperatura_min, excluded.temperatura_min),
+                    temperatura_max = MAX(temperatura_max, excluded.temperatura_max),
+                    temperatura_suma_cuadrados = temperatura_suma_cuadrados + excluded.temperatura_suma_cuadrados,
+                    humedad_suma = humedad_suma + excluded.humedad_suma,
+                    humedad_min = MIN(humedad_min, excluded.humedad_min),
+                    humedad_max = MAX(humedad_max, excluded.humedad_max),
+                    humedad_suma_cuadrados = humedad_suma_cuadrados + excluded.humedad_suma_cuadrados
+                """,
+                [(*clave, *valores) for clave, valores in resumenes.items()],
+            )
+            conn.commit()
+
+
+# --- Escenarios ---
+
+def peticion(escenario: str, controlador: dict, rng: random.Random):
+    """Método, ruta, parámetros y cuerpo de una petición del escenario para un controlador simulado."""
+    uuid_controlador = controlador["uuid_controlador"]
+    if escenario == "ingesta_lote":
+        # Mismo cuerpo que envía controller.ino en cada ciclo
+        cuerpo = [
+            {
+                "uuid_controlador": uuid_controlador,
+                "id_sensor": id_sensor,
+                "lectura_temperatura": round(rng.uniform(15, 45), 2),
+                "lectura_humedad": round(rng.uniform(20, 90), 2),
+                "lectura_bateria": round(rng.uniform(3.3, 4.2), 2),
+            }
+            for id_sensor in range(1, 5)
+        ]
+        return "POST", "/api/sensor/batch", None, cuerpo
+    if escenario == "ingesta_individual":
+        cuerpo = {
+            "uuid_controlador": uuid_controlador,
+            "id_sensor": rng.randint(1, 4),
+            "lectura_temperatura": round(rng.uniform(15, 45), 2),
+            "lectura_humedad": round(rng.uniform(20, 90), 2),
+        }
+        return "POST", "/api/sensor/", None, cuerpo
+    if escenario == "ultima_lectura":
+        return "GET", "/api/sensor/latest", None, None
+    if escenario == "panel_lecturas":
+        # Lo que consulta Static/js/app.js al seleccionar un controlador
+        return "GET", "/api/sensor/", {"uuid_controlador": uuid_controlador, "limit": 100}, None
+    if escenario == "panel_pagina_maxima":
+        # Página más grande que permite la API (exportaciones y gráficas largas)
+        return "GET", "/api/sensor/", {"uuid_controlador": uuid_controlador, "limit": 1000}, None
+    if escenario == "panel_historial":
+        desde = (datetime.now(timezone.utc) - timedelta(days=1)).replace(minute=0, second=0, microsecond=0)
+        return "GET", "/api/sensor/history", {"uuid_controlador": uuid_controlador, "bucket": "1h", "desde": desde.isoformat()}, None
+    if escenario == "panel_controladores":
+        return "GET", "/api/controller", None, None
+    if escenario == "panel_general":
+        return "GET", "/api/overview", None, None
+    raise ValueError(f"Escenario desconocido: {escenario}")
+
+
+async def ejecutar_escenario(client: httpx.AsyncClient, escenario: str, flota, total: int, rng: random.Random) -> dict:
+    """Cada controlador simulado envía sus peticiones en serie; los controladores van en paralelo."""
+    latencias = []
+    errores = 0
+    por_controlador = [total // len(flota) + (1 if i < total % len(flota) else 0) for i in range(len(flota))]
+
+    async def controlador_simulado(controlador, cantidad):
+        nonlocal errores
+        for _ in range(cantidad):
+            metodo, ruta, params, cuerpo = peticion(escenario, controlador, rng)
+            inicio = time.perf_counter()
+            respuesta = await client.request(metodo, ruta, params=params, json=cuerpo)
+            latencias.append(time.perf_counter() - inicio)
+            if respuesta.status_code >= 400:
+                errores += 1
+
+    inicio = time.perf_counter()
+    await asyncio.gather(*(controlador_simulado(c, n) for c, n in zip(flota, por_controlador)))
+    duracion = time.perf_counter() - inicio
+    cortes = statistics.quantiles(latencias, n=100, method="inclusive")
+    return {
+        "escenario": escenario,
+        "peticiones": len(latencias),
+        "errores": errores,
+        "req_s": round(len(latencias) / duracion, 1),
+        "p50_ms": percentil(cortes, 50),
+        "p95_ms": percentil(cortes, 95),
+        "p99_ms": percentil(cortes, 99),
+    }
+
+
+async def crear_flota(client: httpx.AsyncClient, cantidad: int):
+    usuario = {"nombre_usuario": "bench", "correo": "bench@example.com", "password": "bench-password"}
+    await client.post("/api/register", json=usuario)
+    token = (await client.post("/api/token", data={"username": usuario["nombre_usuario"], "password": usuario["password"]})).json()["access_token"]
+    cabeceras = {"Authorization": f"Bearer {token}"}
+    flota = []
+    for i in range(cantidad):
+        respuesta = await client.post("/api/controller", json={"nombre_controlador": f"Bench {i + 1}"}, headers=cabeceras)
+        respuesta.raise_for_status()
+        flota.append(respuesta.json()["controlador"])
+    return flota
+
+
+async def benchmark():
+    tamanos = [int(valor) for valor in ARGS.filas.split(",")]
+    escenarios = [valor.strip() for valor in ARGS.escenarios.split(",") if valor.strip()]
+    rng = random.Random(ARGS.semilla)
+
+    if ARGS.url:
+        client = httpx.AsyncClient(base_url=ARGS.url, timeout=60)
+        lifespan = None
+    else:
+        import main
+        client = httpx.AsyncClient(transport=httpx.ASGITransport(app=main.app), base_url="http://bench", timeout=60)
+        lifespan = main.app.router.lifespan_context(main.app)
+        await lifespan.__aenter__()
+
+    resultados = []
+    try:
+        flota = await crear_flota(client, ARGS.controladores)
+        sembrador = Sembrador(flota, ARGS.semilla)
+        for filas in sorted(tamanos):
+            inicio = time.perf_counter()
+            sembrador.llenar(filas)
+            print(f"\n{filas:,} filas (llenado en {time.perf_counter() - inicio:.1f} s)")
+            print(f"{'escenario':<22}{'req/s':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'errores':>9}")
+            for escenario in escenarios:
+                resultado = await ejecutar_escenario(client, escenario, flota, ARGS.peticiones, rng)
+                resultado["filas"] = filas
+                resultados.append(resultado)
+                print(f"{escenario:<22}{resultado['req_s']:>10}{resultado['p50_ms']:>10}{resultado['p95_ms']:>10}{resultado['p99_ms']:>10}{resultado['errores']:>9}")
+    finally:
+        await client.aclose()
+        if lifespan:
+            await lifespan.__aexit__(None, None, None)
+    return resultados
+
+
+def comparar(resultados, archivo_anterior: str):
+    anteriores = {(r["filas"], r["escenario"]): r for r in json.loads(Path(archivo_anterior).read_text())["resultados"]}
+    print(f"\nVariación respecto a {archivo_anterior} (negativo en latencia = mejor)")
+    print(f"{'filas':>12} {'escenario':<22}{'req/s':>10}{'p50':>10}{'p95':>10}{'p99':>10}")
+    for r in resultados:
+        anterior = anteriores.get((r["filas"], r["escenario"]))
+        if not anterior:
+            continue
+        def variacion(campo):
+            return f"{(r[campo] / anterior[campo] - 1) * 100:+.1f}%" if anterior[campo] else "-"
+        print(f"{r['filas']:>12,} {r['escenario']:<22}{variacion('req_s'):>10}{variacion('p50_ms'):>10}{variacion('p95_ms'):>10}{variacion('p99_ms'):>10}")
+
+
+if __name__ == "__main__":
+    commit = commit_actual()
+    resultados = asyncio.run(benchmark())
+    salida = Path(ARGS.salida or f"bench_{commit}.json")
+    salida.write_text(json.dumps({
+        "commit": commit,
+        "fecha": datetime.now(timezone.utc).isoformat(),
+        "modo": ARGS.url or "asgi",
+        "controladores": ARGS.controladores,
+        "peticiones_por_escenario": ARGS.peticiones,
+        "python": sys.version.split()[0],
+        "sqlite": database.sqlite3.sqlite_version,
+        "resultados": resultados,
+    }, indent=2))
+    print(f"\nResultados guardados en {salida}")
+    if ARGS.comparar:
+        comparar(resultados, ARGS.comparar)
@@ -0,0 +1,10 @@
+# conftest.py
+import os
+import sys
+import tempfile
+from pathlib import Path
+
+# Las pruebas que importan directamente los módulos de la aplicación (sin el servidor corriendo)
+# usan un archivo SQLite temporal en lugar de app/data/sensores.db.
+os.environ.setdefault("SENSORES_DB_PATH", str(Path(tempfile.mkdtemp()) / "sensores_test.db"))
+sys.path.insert(0, str(Path(__file__).resolve().parent / "app"))
@@ -10,7 +10,7 @@ const char* WIFI_PASSWORD = ""; // ¡CAMBIA ESTO por una cadena vacía para rede
 // --- Configuración de la API ---
 const char* API_HOST = "secador-solar-gia.online"; // O la IP de tu servidor si no usas dominio/Traefik
 const int API_PORT = 443; // Usar 443 para HTTPS con Traefik
-const char* API_PATH = "/api/sensor/"; // Ruta del endpoint para enviar lecturas
+const char* API_PATH = "/api/sensor/batch"; // Ruta del endpoint para enviar las lecturas de los 4 sensores en un solo lote
 
 // --- UUIDs del Controlador y Ensayo ---
 // ¡IMPORTANTE! Genera estos UUIDs en tu frontend o en línea y pégalos aquí.
@@ -77,6 +77,10 @@ void loop() {
         DHT* dhts[] = {&dht1, &dht2, &dht3, &dht4};
         int dhtPins[] = {DHTPIN1, DHTPIN2, DHTPIN3, DHTPIN4};
 
+        // Todas las lecturas del ciclo se envían juntas en un arreglo JSON (una sola petición HTTPS)
+        StaticJsonDocument<1024> doc; // Tamaño del documento JSON para 4 lecturas (ajustar si es necesario)
+        JsonArray lecturas = doc.to<JsonArray>();
+
         for (int i = 0; i < 4; i++) {
             int sensorId = i + 1; // ID del sensor (1 a 4)
 
@@ -97,44 +101,47 @@ void loop() {
             Serial.print("%, Temperatura = "); Serial.print(t);
             Serial.println("°C");
 
-            // Construir el JSON para enviar a la API
-            StaticJsonDocument<256> doc; // Tamaño del documento JSON (ajustar si es necesario)
-            doc["uuid_controlador"] = CONTROLLER_UUID;
-            doc["id_sensor"] = sensorId;
-            doc["uuid_ensayo"] = ENSAYO_UUID;
-            doc["nombre_ensayo"] = ENSAYO_NOMBRE;
-            doc["lectura_temperatura"] = t;
-            doc["lectura_humedad"] = h;
-
-            String jsonPayload;
-            serializeJson(doc, jsonPayload); // Serializar el JSON a un String
-            Serial.print("Payload JSON: ");
-            Serial.println(jsonPayload);
-
-            // Enviar datos a la API
-            HTTPClient http;
-
-            // Para HTTPS, usar http.begin(url) con un host y puerto separados.
-            // Esto permite que la librería maneje la conexión segura.
-            http.begin(API_HOST, API_PORT, API_PATH);
-            http.addHeader("Content-Type", "application/json"); // Establecer el tipo de contenido
-
-            Serial.print("Enviando POST al servidor...");
-            int httpResponseCode = http.POST(jsonPayload); // Enviar la solicitud POST
-
-            if (httpResponseCode > 0) {
-                Serial.print("Código de respuesta HTTP: ");
-                Serial.println(httpResponseCode);
-                String response = http.getString(); // Obtener la respuesta del servidor
-                Serial.print("Respuesta del servidor: ");
-                Serial.println(response);
-            } else {
-                Serial.print("Error en la solicitud HTTP: ");
-                Serial.println(http.errorToString(httpResponseCode).c_str());
-            }
+            // Agregar la lectura al lote
+            JsonObject lectura = lecturas.createNestedObject();
+            lectura["uuid_controlador"] = CONTROLLER_UUID;
+            lectura["id_sensor"] = sensorId;
+            lectura["lectura_temperatura"] = t;
+            lectura["lectura_humedad"] = h;
+        }
 
-            http.end(); // Cerrar la conexión
-            delay(100); // Pequeña pausa entre envíos de sensores para evitar saturación
+        // No enviar nada si todos los sensores fallaron
+        if (lecturas.size() == 0) {
+            Serial.println("Ninguna lectura válida en este ciclo, no se envía el lote.");
+            return;
         }
+
+        String jsonPayload;
+        serializeJson(doc, jsonPayload); // Serializar el JSON a un String
+        Serial.print("Payload JSON: ");
+        Serial.println(jsonPayload);
+
+        // Enviar datos a la API
+        HTTPClient http;
+
+        // Para HTTPS, usar http.begin(url) con un host y puerto separados.
+        // Esto permite que la librería maneje la conexión segura.
+        http.begin(API_HOST, API_PORT, API_PATH);
+        http.addHeader("Content-Type", "application/json"); // Establecer el tipo de contenido
+
+        Serial.print("Enviando POST al servidor...");
+        int httpResponseCode = http.POST(jsonPayload); // Enviar la solicitud POST
+
+        if (httpResponseCode > 0) {
+            Serial.print("Código de respuesta HTTP: ");
+            Serial.println(httpResponseCode);
+            String response = http.getString(); // Obtener la respuesta del servidor
+            Serial.print("Respuesta del servidor: ");
+            Serial.println(response);
+        } else {
+            Serial.print("Error en la solicitud HTTP: ");
+            Serial.println(http.errorToString(httpResponseCode).c_str());
+        }
+
+        http.end(); // Cerrar la conexión
     }
 }
@@ -248,4 +248,134 @@ def test_create_lectura_sensor():
     # response = requests.post(f"{API_URL}/sensor/", json=payload)
     # assert response.status_code == 201
     # assert "timestamp" in response.json()
-    pass # Esta prueba está comentada para evitar fallos por UUIDs inexistentes.
\ No newline at end of file
+    pass # Esta prueba está comentada para evitar fallos por UUIDs inexistentes.
+
+def test_create_lecturas_sensor_batch(api_client):
+    """Prueba el registro de un lote de lecturas de varios controladores en una sola petición."""
+    uuids = []
+    for nombre in ("Controlador Lote A", "Controlador Lote B"):
+        response = api_client.post(f"{API_URL}/controller", json={"nombre_controlador": nombre})
+        uuids.append(response.json()["controlador"]["uuid_controlador"])
+
+    payload = [
+        {
+            "uuid_controlador": controlador_uuid,
+            "id_sensor": id_sensor,
+            "lectura_temperatura": 25.5,
+            "lectura_humedad": 60.0,
+        }
+        for controlador_uuid in uuids
+        for id_sensor in range(1, 5)
+    ]
+    response = requests.post(f"{API_URL}/sensor/batch", json=payload)
+    assert response.status_code == 201, f"Expected 201, got {response.status_code} with {response.json()}"
+    data = response.json()
+    assert len(data) == 8
+    assert {item["uuid_controlador"] for item in data} == set(uuids)
+    assert all(item["uuid_ensayo"] for item in data)
+
+    # Un controlador inexistente invalida todo el lote
+    payload.append({**payload[0], "uuid_controlador": str(uuid.uuid4())})
+    response = requests.post(f"{API_URL}/sensor/batch", json=payload)
+    assert response.status_code == 404
+
+
+def test_read_lecturas_sensor_cursor(api_client):
+    """Prueba que la paginación por cursor recorra las mismas lecturas que la paginación por desplazamiento."""
+    response = api_client.post(f"{API_URL}/controller", json={"nombre_controlador": "Controlador Cursor"})
+    controlador_uuid = response.json()["controlador"]["uuid_controlador"]
+    payload = [
+        {"uuid_controlador": controlador_uuid, "id_sensor": id_sensor, "lectura_temperatura": 20.0, "lectura_humedad": 50.0}
+        for id_sensor in range(1, 5)
+    ]
+    for _ in range(3):
+        requests.post(f"{API_URL}/sensor/batch", json=payload)
+
+    esperadas = requests.get(f"{API_URL}/sensor/", params={"uuid_controlador": controlador_uuid, "limit": 1000}).json()
+
+    recibidas = []
+    params = {"uuid_controlador": controlador_uuid, "limit": 5}
+    while True:
+        response = requests.get(f"{API_URL}/sensor/", params=params)
+        assert response.status_code == 200
+        recibidas.extend(response.json())
+        if "X-Next-Cursor" not in response.headers:
+            break
+        params["cursor"] = response.headers["X-Next-Cursor"]
+
+    assert [item["uuid_lectura"] for item in recibidas] == [item["uuid_lectura"] for item in esperadas]
+    assert len(recibidas) == 12
+
+
+def test_read_lecturas_agregadas(api_client):
+    """Prueba el historial agregado por intervalos (min/prom/max por sensor)."""
+    response = api_client.post(f"{API_URL}/controller", json={"nombre_controlador": "Controlador Historial"})
+    controlador_uuid = response.json()["controlador"]["uuid_controlador"]
+    payload = [
+        {"uuid_controlador": controlador_uuid, "id_sensor": 1, "lectura_temperatura": temperatura, "lectura_humedad": 50.0}
+        for temperatura in (20.0, 30.0)
+    ]
+    requests.post(f"{API_URL}/sensor/batch", json=payload)
+
+    response = requests.get(f"{API_URL}/sensor/history", params={"uuid_controlador": controlador_uuid, "bucket": "1h"})
+    assert response.status_code == 200
+    data = response.json()
+    assert len(data) == 1
+    assert data[0]["cantidad"] == 2
+    assert data[0]["temperatura_min"] == 20.0
+    assert data[0]["temperatura_prom"] == 25.0
+    assert data[0]["temperatura_max"] == 30.0
+
+    response = requests.get(f"{API_URL}/sensor/history", params={"bucket": "1x"})
+    assert response.status_code == 400
+
+
+def test_export_lecturas_ensayo(api_client):
+    """Prueba la exportación de las lecturas de un ensayo en CSV y NDJSON."""
+    response = api_client.post(f"{API_URL}/controller", json={"nombre_controlador": "Controlador Exportacion"})
+    controlador = response.json()["controlador"]
+    payload = [
+        {"uuid_controlador": controlador["uuid_controlador"], "id_sensor": id_sensor, "lectura_temperatura": 22.0, "lectura_humedad": 60.0}
+        for id_sensor in range(1, 5)
+    ]
+    requests.post(f"{API_URL}/sensor/batch", json=payload)
+    uuid_ensayo = controlador["uuid_ensayo_generico"]
+
+    response = requests.get(f"{API_URL}/ensayos/{uuid_ensayo}/export", params={"format": "csv"})
+    assert response.status_code == 200
+    lineas = response.text.strip().splitlines()
+    assert lineas[0].startswith("uuid_lectura,uuid_controlador,uuid_ensayo")
+    assert len(lineas) == 5
+
+    response = requests.get(f"{API_URL}/ensayos/{uuid_ensayo}/export", params={"format": "ndjson"})
+    assert response.status_code == 200
+    assert len(response.text.strip().splitlines()) == 4
+
+    response = requests.get(f"{API_URL}/ensayos/{uuid.uuid4()}/export")
+    assert response.status_code == 404
+
+
+def test_read_lecturas_sensor_etag(api_client):
+    """Prueba que una consulta repetida con If-None-Match reciba 304 hasta que llegue una lectura nueva."""
+    response = api_client.post(f"{API_URL}/controller", json={"nombre_controlador": "Controlador ETag"})
+    controlador_uuid = response.json()["controlador"]["uuid_controlador"]
+    lectura = {"uuid_controlador": controlador_uuid, "id_sensor": 1, "lectura_temperatura": 20.0, "lectura_humedad": 50.0}
+    requests.post(f"{API_URL}/sensor/", json=lectura)
+
+    params = {"uuid_controlador": controlador_uuid}
+    response = requests.get(f"{API_URL}/sensor/", params=params)
+    etag = response.headers["ETag"]
+
+    response = requests.get(f"{API_URL}/sensor/", params=params, headers={"If-None-Match": etag})
+    assert response.status_code == 304
+    assert response.content == b""
+
+    # Con otros parámetros la respuesta es otra: el mismo ETag no sirve
+    response = requests.get(f"{API_URL}/sensor/", params={**params, "id_sensor": 2}, headers={"If-None-Match": etag})
+    assert response.status_code == 200
+    assert response.headers["ETag"] != etag
+
+    requests.post(f"{API_URL}/sensor/", json=lectura)
+    response = requests.get(f"{API_URL}/sensor/", params=params, headers={"If-None-Match": etag})
+    assert response.status_code == 200
+    assert len(response.json()) == 2
@@ -0,0 +1,60 @@
+# test_archive.py
+import uuid
+from datetime import datetime
+
+# Pruebas del archivado de lecturas antiguas, sin el servidor corriendo (ver conftest.py).
+import archive
+import crud
+import database
+from models import LecturaSensor, PeriodoResumen
+
+
+def test_archivar_lecturas_antiguas(tmp_path, monkeypatch):
+    """Las lecturas antiguas pasan a un archivo por mes, sin perderse para la exportación ni los resúmenes."""
+    monkeypatch.setattr(database, "ARCHIVO_DIR", tmp_path)
+    monkeypatch.setattr(archive, "ARCHIVO_DIR", tmp_path)
+    uuid_controlador, uuid_ensayo = uuid.uuid4(), uuid.uuid4()
+    crud.insert_lecturas_sensor([
+        LecturaSensor(
+            uuid_lectura=uuid.uuid4(), uuid_controlador=uuid_controlador, uuid_ensayo=uuid_ensayo, id_sensor=1,
+            timestamp=datetime.fromisoformat(timestamp), lectura_temperatura=20.0, lectura_humedad=50.0, lectura_bateria=None,
+        )
+        for timestamp in ("2024-01-31T23:00:00-05:00", "2024-02-01T01:00:00-05:00", "2024-02-01T02:00:00-05:00")
+    ])
+
+    resultado = archive.archivar_lecturas(retencion_dias=30, archivar_finalizados=False, tamano_lote=2)
+
+    assert resultado.completo
+    assert resultado.por_mes == {"2024-01": 1, "2024-02": 2}
+    assert [ruta.name for ruta in database.get_archivos_lecturas()] == ["lecturas_2024-01.db", "lecturas_2024-02.db"]
+    lecturas, _ = crud.get_lecturas_sensor(uuid_ensayo=uuid_ensayo)
+    assert lecturas == []
+    exportadas = [fila for lote in crud.iter_lecturas_ensayo(uuid_ensayo) for fila in lote]
+    assert [fila[4] for fila in exportadas] == [
+        "2024-01-31T23:00:00.000-05:00", "2024-02-01T01:00:00.000-05:00", "2024-02-01T02:00:00.000-05:00",
+    ]
+    assert sum(r.cantidad for r in crud.get_resumen_lecturas(PeriodoResumen.dia, uuid_ensayo=uuid_ensayo)) == 3
+
+
+def test_archivar_de_nuevo_el_mismo_mes(tmp_path, monkeypatch):
+    """Las lecturas que llegan después de archivar un mes no reutilizan llaves ya archivadas."""
+    monkeypatch.setattr(database, "ARCHIVO_DIR", tmp_path)
+    monkeypatch.setattr(archive, "ARCHIVO_DIR", tmp_path)
+    uuid_controlador, uuid_ensayo = uuid.uuid4(), uuid.uuid4()
+
+    def insertar(*timestamps):
+        crud.insert_lecturas_sensor([
+            LecturaSensor(
+                uuid_lectura=uuid.uuid4(), uuid_controlador=uuid_controlador, uuid_ensayo=uuid_ensayo, id_sensor=1,
+                timestamp=datetime.fromisoformat(timestamp), lectura_temperatura=20.0, lectura_humedad=50.0, lectura_bateria=None,
+            )
+            for timestamp in timestamps
+        ])
+
+    insertar("2023-06-01T00:00:00-05:00", "2023-06-02T00:00:00-05:00")
+    assert archive.archivar_lecturas(retencion_dias=30, archivar_finalizados=False).por_mes["2023-06"] == 2
+    insertar("2023-06-03T00:00:00-05:00", "2023-06-04T00:00:00-05:00")
+    assert archive.archivar_lecturas(retencion_dias=30, archivar_finalizados=False).por_mes["2023-06"] == 2
+
+    exportadas = [fila for lote in crud.iter_lecturas_ensayo(uuid_ensayo) for fila in lote]
+    assert [fila[4][:10] for fila in exportadas] == ["2023-06-01", "2023-06-02", "2023-06-03", "2023-06-04"]
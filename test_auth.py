@@ -0,0 +1,87 @@
+# test_auth.py
+import asyncio
+
+import httpx
+import pytest
+
+# La aplicación se prueba en el mismo proceso (ASGI) sobre un archivo SQLite temporal (ver conftest.py).
+import crud
+import main
+
+
+def peticiones(*solicitudes):
+    """Ejecuta en orden las peticiones (método, ruta, kwargs) contra la aplicación y retorna las respuestas."""
+    async def ejecutar():
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            return [await client.request(metodo, ruta, **kwargs) for metodo, ruta, kwargs in solicitudes]
+    return asyncio.run(ejecutar())
+
+
+def registrar_y_entrar(nombre: str, password: str = "clave-segura"):
+    """Registra un usuario y retorna su UUID y la cabecera con su token."""
+    registro, token = peticiones(
+        ("POST", "/api/register", {"json": {"nombre_usuario": nombre, "correo": f"{nombre}@example.com", "password": password}}),
+        ("POST", "/api/token", {"data": {"username": nombre, "password": password}}),
+    )
+    return registro.json()["uuid_usuario"], {"Authorization": f"Bearer {token.json()['access_token']}"}
+
+
+def crear_controlador(cabeceras):
+    return ("POST", "/api/controller", {"json": {"nombre_controlador": "Auth"}, "headers": cabeceras})
+
+
+def test_token_en_cache_se_revalida_al_cambiar_la_contrasena(monkeypatch):
+    """Tras cambiar la contraseña, el token en caché se vuelve a validar contra la base de datos."""
+    _, cabeceras = registrar_y_entrar("auth_cambio")
+    consultas = []
+    get_user_by_uuid = crud.get_user_by_uuid
+    monkeypatch.setattr(crud, "get_user_by_uuid", lambda uuid_usuario: consultas.append(uuid_usuario) or get_user_by_uuid(uuid_usuario))
+
+    respuestas = peticiones(crear_controlador(cabeceras), crear_controlador(cabeceras))
+    assert [respuesta.status_code for respuesta in respuestas] == [200, 200]
+    assert len(consultas) == 1 # La segunda petición usó el token en caché
+
+    crud.update_user_password(consultas[0], main.get_password_hash("otra-clave"))
+    assert peticiones(crear_controlador(cabeceras))[0].status_code == 200
+    assert len(consultas) == 2
+
+
+def test_token_en_cache_rechazado_al_eliminar_el_usuario():
+    """Un token ya verificado (en caché) recibe 401 en cuanto se elimina su usuario."""
+    _, cabeceras = registrar_y_entrar("auth_eliminado")
+    antes, eliminado, despues = peticiones(
+        crear_controlador(cabeceras),
+        ("DELETE", "/api/users/me", {"headers": cabeceras}),
+        crear_controlador(cabeceras),
+    )
+    assert antes.status_code == 200
+    assert eliminado.status_code == 200
+    assert despues.status_code == 401
+
+
+def test_inicio_de_sesion_actualiza_el_costo_del_hash(monkeypatch):
+    """Una contraseña guardada con un costo menor se vuelve a hashear con BCRYPT_COSTO al iniciar sesión."""
+    import bcrypt
+    from models import UserCreate
+    monkeypatch.setattr(main, "BCRYPT_COSTO", 5)
+    hash_antiguo = bcrypt.hashpw(b"clave-antigua", bcrypt.gensalt(rounds=4)).decode("utf-8")
+    crud.create_user(UserCreate(nombre_usuario="auth_rehash", correo="auth_rehash@example.com", password="clave-antigua"), hash_antiguo)
+
+    respuesta, = peticiones(("POST", "/api/token", {"data": {"username": "auth_rehash", "password": "clave-antigua"}}))
+    assert respuesta.status_code == 200
+    guardado = crud.get_user_by_username("auth_rehash").hashed_password
+    assert guardado.startswith("$2b$05$")
+    assert main.verify_password("clave-antigua", guardado)
+    assert not main.requiere_rehash(guardado)
+
+
+def test_inicios_de_sesion_saturados_responden_503(monkeypatch):
+    """Con LOGINS_CONCURRENTES_MAX inicios de sesión en curso, el siguiente recibe 503 sin hashear."""
+    from models import UserCreate
+    crud.create_user(UserCreate(nombre_usuario="auth_saturado", correo="auth_saturado@example.com", password="clave-segura"), "$2b$04$sin-uso")
+    monkeypatch.setattr(main, "logins_en_curso", asyncio.Semaphore(0)) # Todos los cupos ocupados
+    monkeypatch.setattr(main, "verify_password", lambda *args: pytest.fail("No debe llegar a bcrypt"))
+    respuesta, = peticiones(("POST", "/api/token", {"data": {"username": "auth_saturado", "password": "clave-segura"}}))
+    assert respuesta.status_code == 503
+    assert respuesta.headers["Retry-After"] == "1"
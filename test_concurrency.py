@@ -0,0 +1,42 @@
+# test_concurrency.py
+import asyncio
+import time
+
+import httpx
+
+# La aplicación se prueba en el mismo proceso (ASGI) sobre un archivo SQLite temporal (ver conftest.py).
+import crud
+import main
+
+RETARDO = 0.3
+PETICIONES = 4
+
+
+def test_peticiones_concurrentes_se_solapan(monkeypatch):
+    """
+    Las consultas a SQLite se ejecutan en el pool de hilos de base de datos y no en el event loop:
+    varias peticiones lentas simultáneas deben tardar en total bastante menos que su suma.
+    """
+    llamadas = []
+
+    def get_controladores_json_lento(skip: int = 0, limit: int = 100):
+        llamadas.append(skip)
+        time.sleep(RETARDO) # Simula una consulta lenta y bloqueante
+        return b"[]"
+
+    # El endpoint usa la ruta rápida (JSON directo de las filas)
+    monkeypatch.setattr(crud, "get_controladores_json", get_controladores_json_lento)
+
+    async def peticiones():
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            inicio = time.perf_counter()
+            respuestas = await asyncio.gather(*(client.get("/api/controller") for _ in range(PETICIONES)))
+            return respuestas, time.perf_counter() - inicio
+
+    respuestas, duracion = asyncio.run(peticiones())
+
+    assert all(respuesta.status_code == 200 for respuesta in respuestas)
+    assert len(llamadas) == PETICIONES # Cada petición pasó por la consulta lenta
+    # En serie tardarían PETICIONES * RETARDO (1.2 s)
+    assert duracion < RETARDO * PETICIONES / 2
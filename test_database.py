@@ -0,0 +1,248 @@
+# test_database.py
+import sqlite3
+
+import uuid
+
+import pytest
+
+# Estas pruebas usan directamente la capa de base de datos (sin el servidor corriendo) sobre
+# un archivo SQLite temporal (ver conftest.py).
+import crud
+import database
+
+
+def query_plan(conn, query, params):
+    """Devuelve el detalle de EXPLAIN QUERY PLAN como un solo texto."""
+    rows = conn.execute(f"EXPLAIN QUERY PLAN {query}", params).fetchall()
+    return " | ".join(row[-1] for row in rows)
+
+
+@pytest.fixture
+def conn():
+    with database.get_db_connection() as conn:
+        yield conn
+
+
+# --- PRUEBAS DE MIGRACIONES ---
+
+def test_migraciones_aplicadas(conn):
+    """La base de datos queda en la última versión del esquema."""
+    assert conn.execute("PRAGMA user_version").fetchone()[0] == len(database.MIGRATIONS)
+
+
+def test_migraciones_sobre_base_existente(tmp_path):
+    """Las migraciones se aplican sobre un sensores.db antiguo sin perder datos y son idempotentes."""
+    legacy = sqlite3.connect(tmp_path / "legacy.db")
+    legacy.execute("""
+        CREATE TABLE lecturas_sensor (
+            uuid_lectura TEXT PRIMARY KEY, uuid_controlador TEXT NOT NULL, uuid_ensayo TEXT,
+            id_sensor INTEGER NOT NULL, timestamp TEXT NOT NULL, lectura_temperatura REAL NOT NULL,
+            lectura_humedad REAL NOT NULL, lectura_bateria REAL
+        )
+    """)
+    legacy.execute(
+        "INSERT INTO lecturas_sensor VALUES ('l1', 'c1', 'e1', 1, '2024-01-01T00:00:00-05:00', 20.0, 50.0, NULL)"
+    )
+    # init_db crea controladores (esquema original) antes de aplicar las migraciones
+    legacy.execute("""
+        CREATE TABLE controladores (
+            uuid_controlador TEXT PRIMARY KEY, uuid_ensayo_generico TEXT NOT NULL, uuid_ensayo_activo TEXT,
+            nombre_controlador TEXT NOT NULL, timestamp_registro TEXT NOT NULL,
+            estado TEXT NOT NULL DEFAULT 'Inactivo', bateria REAL
+        )
+    """)
+    legacy.execute("INSERT INTO controladores VALUES ('c1', 'g1', 'e1', 'Legado', '2023-12-01T00:00:00-05:00', 'Activo', 3.7)")
+    legacy.commit()
+
+    database.apply_migrations(legacy)
+    database.apply_migrations(legacy)
+
+    indices = {row[0] for row in legacy.execute("SELECT name FROM sqlite_master WHERE type = 'index'")}
+    assert {"idx_lecturas_controlador_timestamp", "idx_lecturas_ensayo_timestamp"} <= indices
+    assert legacy.execute("PRAGMA user_version").fetchone()[0] == len(database.MIGRATIONS)
+    assert legacy.execute("SELECT COUNT(*) FROM lecturas_sensor").fetchone()[0] == 1
+    # Formato compacto: llaves enteras y timestamp en milisegundos (UTC)
+    fila = legacy.execute(
+        "SELECT c.uuid, e.uuid, l.ts FROM lecturas_sensor l"
+        " JOIN identificadores c ON c.id = l.id_controlador JOIN identificadores e ON e.id = l.id_ensayo"
+    ).fetchone()
+    assert fila == ("c1", "e1", 1704085200000)
+    # Los resúmenes por hora y por día se llenan con las lecturas existentes
+    resumenes = legacy.execute("SELECT periodo, inicio, cantidad FROM resumen_lecturas ORDER BY periodo").fetchall()
+    assert resumenes == [("dia", "2024-01-01T00:00:00-05:00", 1), ("hora", "2024-01-01T00:00:00-05:00", 1)]
+    # Hora y valores de la última lectura en controladores; la batería no reportada se conserva
+    controlador = legacy.execute(
+        "SELECT ultima_lectura_ts, temperatura_sensor_1, humedad_sensor_1, bateria FROM controladores"
+    ).fetchone()
+    assert controlador == (1704085200000, 20.0, 50.0, 3.7)
+    legacy.close()
+
+
+# --- PRUEBAS DE PLANES DE CONSULTA ---
+
+def test_plan_lecturas_por_controlador(conn):
+    """Filtrar por controlador y ordenar por timestamp usa el índice, sin ordenar en memoria."""
+    filtros, params = crud._filtros_lecturas(uuid_controlador=uuid.uuid4())
+    plan = query_plan(
+        conn,
+        crud._SELECT_LECTURAS + filtros + " ORDER BY l.ts DESC, l.id DESC LIMIT ? OFFSET ?",
+        (*params, 100, 0),
+    )
+    assert "idx_lecturas_controlador_timestamp" in plan
+    assert "TEMP B-TREE" not in plan
+
+
+def test_plan_lecturas_por_ensayo(conn):
+    """Filtrar por ensayo y ordenar por timestamp usa el índice, sin ordenar en memoria."""
+    filtros, params = crud._filtros_lecturas(uuid_ensayo=uuid.uuid4())
+    plan = query_plan(
+        conn,
+        crud._SELECT_LECTURAS + filtros + " ORDER BY l.ts DESC, l.id DESC LIMIT ? OFFSET ?",
+        (*params, 100, 0),
+    )
+    assert "idx_lecturas_ensayo_timestamp" in plan
+    assert "TEMP B-TREE" not in plan
+
+
+def test_plan_ultima_lectura(conn):
+    """La última lectura se obtiene recorriendo el índice de timestamp, no la tabla completa."""
+    plan = query_plan(conn, crud._SELECT_LECTURAS + " ORDER BY l.ts DESC, l.id DESC LIMIT 1", ())
+    assert "idx_lecturas_timestamp" in plan
+    assert "TEMP B-TREE" not in plan
+
+
+def test_plan_ultima_lectura_por_sensor(conn):
+    """La carga de las últimas lecturas por sensor recorre el índice del controlador hacia atrás."""
+    plan = query_plan(conn, crud._SELECT_ULTIMA_POR_SENSOR, (1, 1))
+    assert "idx_lecturas_controlador_timestamp (id_controlador=?)" in plan
+    assert "TEMP B-TREE" not in plan
+
+
+def test_plan_lecturas_por_cursor(conn):
+    """La paginación por cursor hace una búsqueda en el índice en lugar de saltar filas."""
+    filtros, params = crud._filtros_lecturas(uuid_controlador=uuid.uuid4())
+    plan = query_plan(
+        conn,
+        crud._SELECT_LECTURAS + filtros + " AND (l.ts, l.id) < (?, ?) ORDER BY l.ts DESC, l.id DESC LIMIT ? OFFSET ?",
+        (*params, 1704085200000, 1, 100, 0),
+    )
+    assert "idx_lecturas_controlador_timestamp (id_controlador=? AND ts<?)" in plan
+    assert "TEMP B-TREE" not in plan
+
+
+def test_plan_extremos_recientes(conn):
+    """Los extremos de las últimas horas leen solo ese rango de resúmenes, no todo el historial."""
+    plan = query_plan(conn, crud._SELECT_EXTREMOS_RECIENTES, ("2024-01-01T00:00:00-05:00",))
+    assert "idx_resumen_inicio (periodo=? AND inicio>?)" in plan
+
+
+# --- PRUEBAS DEL REGISTRO DE CONSULTAS LENTAS ---
+
+def test_consultas_lentas_ocultan_parametros(conn, monkeypatch):
+    """Con umbral 0 toda sentencia se registra con su plan, su origen y sin revelar los textos."""
+    import profiling
+    monkeypatch.setattr(profiling, "CONSULTA_LENTA_MS", 0)
+    profiling.clear_consultas_lentas()
+    conn.execute("SELECT nombre_controlador FROM controladores WHERE uuid_controlador = ? AND bateria > ?", ("secreto", 3.5)).fetchall()
+
+    registro = profiling.get_consultas_lentas()[0]
+    assert registro["sql"].startswith("SELECT nombre_controlador")
+    assert registro["parametros"] == ["<texto de 7 caracteres>", "3.5"]
+    assert registro["origen"].startswith("test_consultas_lentas_ocultan_parametros")
+    assert any("sqlite_autoindex_controladores_1" in paso for paso in registro["plan"])
+
+
+# --- PRUEBAS DEL MONITOR DE ACTIVIDAD ---
+
+def test_actividad_marca_inactivos_y_los_reactiva(conn):
+    """Un controlador sin lecturas recientes pasa a Inactivo y vuelve a Activo cuando reporta."""
+    from models import ControladorCreate
+    controlador, _ = crud.create_controlador(ControladorCreate(nombre_controlador="Monitor"))
+    uuid_controlador = str(controlador.uuid_controlador)
+    estado = lambda: crud.get_controlador(controlador.uuid_controlador).estado.value
+
+    def ultima_lectura(ts):
+        conn.execute("UPDATE controladores SET ultima_lectura_ts = ? WHERE uuid_controlador = ?", (ts, uuid_controlador))
+        conn.commit()
+
+    ultima_lectura(1_000)
+    crud.update_actividad_controladores(inactivo_antes_ms=2_000)
+    assert estado() == "Inactivo"
+    ultima_lectura(3_000)
+    assert crud.update_actividad_controladores(inactivo_antes_ms=2_000) == 1
+    assert estado() == "Activo"
+
+
+def test_ingesta_actualiza_ultimos_valores_controlador(conn):
+    """La batería y la última lectura de cada sensor quedan en controladores al insertar un grupo."""
+    from models import ControladorCreate, LecturaSensorCreate
+    controlador, ensayo = crud.create_controlador(ControladorCreate(nombre_controlador="Ultimos valores"))
+    asignados = {controlador.uuid_controlador: ensayo.uuid_ensayo}
+    lectura = lambda sensor, temperatura, bateria=None: LecturaSensorCreate(
+        uuid_controlador=controlador.uuid_controlador, id_sensor=sensor,
+        lectura_temperatura=temperatura, lectura_humedad=50.0, lectura_bateria=bateria,
+    )
+    crud.insert_lecturas_sensor(crud.build_lecturas_sensor([lectura(1, 20.0, bateria=3.7), lectura(2, 21.0), lectura(1, 22.0)], asignados))
+    # Un grupo posterior sin batería ni sensor 2 conserva esos valores
+    crud.insert_lecturas_sensor(crud.build_lecturas_sensor([lectura(1, 23.0)], asignados))
+
+    # La ingesta no cambia la versión de controladores; la de los últimos valores sube una vez por tanda del monitor
+    version_controladores, version_valores = crud.versiones.version("controladores"), crud.versiones.version("ultimos_valores")
+    crud.insert_lecturas_sensor(crud.build_lecturas_sensor([lectura(1, 23.0)], asignados))
+    assert crud.versiones.version("controladores") == version_controladores
+    assert crud.versiones.version("ultimos_valores") == version_valores
+    assert crud.publicar_ultimos_valores()
+    assert not crud.publicar_ultimos_valores()
+    assert crud.versiones.version("ultimos_valores") != version_valores
+
+    guardado = crud.get_controlador(controlador.uuid_controlador)
+    assert guardado.bateria == 3.7
+    assert (guardado.temperatura_sensor_1, guardado.temperatura_sensor_2, guardado.temperatura_sensor_3) == (23.0, 21.0, None)
+    assert guardado.ultima_lectura is not None
+
+
+def test_panel_general(conn):
+    """El panel trae cada controlador con su ensayo activo, sus últimas lecturas y extremos de 24 horas."""
+    import overview
+    from models import ControladorCreate, LecturaSensorCreate
+    controlador, ensayo = crud.create_controlador(ControladorCreate(nombre_controlador="Panel"))
+    lecturas = [
+        LecturaSensorCreate(uuid_controlador=controlador.uuid_controlador, id_sensor=1, lectura_temperatura=temperatura, lectura_humedad=50.0)
+        for temperatura in (30.0, 20.0, 25.0)
+    ]
+    crud.insert_lecturas_sensor(crud.build_lecturas_sensor(lecturas, {controlador.uuid_controlador: ensayo.uuid_ensayo}))
+
+    panel = {item.controlador.uuid_controlador: item for item in overview.armar_panel()}[controlador.uuid_controlador]
+    assert panel.ensayo_activo.uuid_ensayo == ensayo.uuid_ensayo
+    assert [sensor.id_sensor for sensor in panel.sensores] == [1, 2, 3, 4]
+    uno, dos = panel.sensores[:2]
+    assert uno.ultima_lectura.lectura_temperatura == 25.0
+    assert (uno.temperatura_min_24h, uno.temperatura_max_24h) == (20.0, 30.0)
+    assert dos.ultima_lectura is None and dos.temperatura_max_24h is None
+
+
+def test_cambio_de_ensayo_invalida_la_cache_de_ingesta(conn):
+    """Tras cambiar el ensayo activo, la siguiente lectura se asigna al ensayo nuevo y no al que estaba en caché."""
+    from models import ControladorCreate, EnsayoCreate, LecturaSensorCreate
+    controlador, generico = crud.create_controlador(ControladorCreate(nombre_controlador="Cambio de ensayo"))
+    uuid_controlador = controlador.uuid_controlador
+    lectura = LecturaSensorCreate(uuid_controlador=uuid_controlador, id_sensor=1, lectura_temperatura=20.0, lectura_humedad=50.0)
+    guardar = lambda: crud.create_lecturas_sensor_batch([lectura], crud.get_ensayos_asignados([uuid_controlador]))[0]
+
+    assert guardar().uuid_ensayo == generico.uuid_ensayo # Deja la resolución en caché
+    ensayo = crud.create_ensayo(EnsayoCreate(nombre_ensayo="Secado 1", uuid_controlador=uuid_controlador))
+    crud.update_controlador_ensayo(uuid_controlador, ensayo.uuid_ensayo)
+    assert guardar().uuid_ensayo == ensayo.uuid_ensayo
+    lecturas, _ = crud.get_lecturas_sensor(uuid_ensayo=ensayo.uuid_ensayo)
+    assert len(lecturas) == 1
+
+    # Editar el ensayo activo también descarta la resolución en caché
+    crud.update_ensayo(ensayo.uuid_ensayo, EnsayoCreate(nombre_ensayo="Secado 1b", uuid_controlador=uuid_controlador))
+    assert crud.ensayos_controlador_cache.get(uuid_controlador) is None
+    assert crud.get_ensayo_asignado(uuid_controlador) == ensayo.uuid_ensayo
+
+    # Un controlador eliminado deja de resolverse aunque estuviera en caché
+    eliminado, _ = crud.create_controlador(ControladorCreate(nombre_controlador="Eliminado"))
+    assert crud.get_ensayo_asignado(eliminado.uuid_controlador) is not None
+    crud.delete_controlador(eliminado.uuid_controlador)
+    assert crud.get_ensayo_asignado(eliminado.uuid_controlador) is None
@@ -0,0 +1,45 @@
+# test_events.py
+import asyncio
+import uuid
+from datetime import datetime
+
+# Pruebas del difusor de lecturas del stream (Server-Sent Events), sin el servidor corriendo.
+import events
+from models import LecturaSensor
+
+CONTROLADOR = uuid.uuid4()
+
+
+def lectura(uuid_controlador=CONTROLADOR):
+    return LecturaSensor(
+        uuid_lectura=uuid.uuid4(), uuid_controlador=uuid_controlador, uuid_ensayo=uuid.uuid4(), id_sensor=1,
+        timestamp=datetime.now(), lectura_temperatura=20.0, lectura_humedad=50.0, lectura_bateria=None,
+    )
+
+
+def test_stream_filtra_por_controlador_y_reanuda():
+    """Cada suscriptor recibe solo su controlador y al reconectarse recupera lo publicado después de Last-Event-ID."""
+    async def escenario():
+        difusor = events.DifusorLecturas(historial=10, tamano_buffer=10)
+        suscriptor = difusor.suscribir(CONTROLADOR)
+        difusor.publicar([lectura(), lectura(uuid.uuid4()), lectura()])
+        ids = [id_evento for id_evento, _ in suscriptor.pendientes]
+        assert len(ids) == 2 and ids[0] < ids[1]
+
+        difusor.desuscribir(suscriptor)
+        reconectado = difusor.suscribir(CONTROLADOR, ultimo_id=ids[0])
+        assert [id_evento for id_evento, _ in reconectado.pendientes] == ids[1:]
+
+    asyncio.run(escenario())
+
+
+def test_stream_buffer_acotado():
+    """Un cliente lento no acumula eventos sin límite: se descartan los más antiguos."""
+    async def escenario():
+        difusor = events.DifusorLecturas(historial=10, tamano_buffer=2)
+        suscriptor = difusor.suscribir(None)
+        difusor.publicar([lectura() for _ in range(5)])
+        assert len(suscriptor.pendientes) == 2
+        assert suscriptor.descartados == 3
+
+    asyncio.run(escenario())
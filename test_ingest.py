@@ -0,0 +1,103 @@
+# test_ingest.py
+import asyncio
+import time
+import uuid
+
+import httpx
+
+# Estas pruebas usan el escritor de la ingesta diferida con un guardado simulado, salvo la del
+# endpoint, que usa la aplicación en el mismo proceso (ASGI) sobre un SQLite temporal (ver conftest.py).
+import crud
+import ingest
+import main
+from models import ControladorCreate, LecturaSensorCreate
+
+
+def lecturas(cantidad: int):
+    uuid_controlador = uuid.uuid4()
+    creadas = [
+        LecturaSensorCreate(uuid_controlador=uuid_controlador, id_sensor=1, lectura_temperatura=20.0, lectura_humedad=50.0)
+        for _ in range(cantidad)
+    ]
+    return crud.build_lecturas_sensor(creadas, {uuid_controlador: uuid.uuid4()})
+
+
+def guardado_simulado(monkeypatch):
+    """Reemplaza el guardado en la base de datos; retorna la lista de tamaños de los grupos guardados."""
+    grupos = []
+    monkeypatch.setattr(crud, "insert_lecturas_sensor", lambda lote: grupos.append(len(lote)))
+    return grupos
+
+
+def esperar(condicion, timeout: float = 2):
+    limite = time.monotonic() + timeout
+    while not condicion() and time.monotonic() < limite:
+        time.sleep(0.01)
+    return condicion()
+
+
+def test_cola_llena_rechaza_sin_encolar():
+    escritor = ingest.EscritorDiferido(cola_max=5)
+    assert escritor.encolar(lecturas(4))
+    assert not escritor.encolar(lecturas(2)) # No caben completas: no se encola ninguna
+    assert escritor.metricas().pendientes == 4
+    assert escritor.lecturas_rechazadas == 2
+
+
+def test_cola_llena_responde_503(monkeypatch):
+    controlador, _ = crud.create_controlador(ControladorCreate(nombre_controlador="Cola llena"))
+    monkeypatch.setattr(ingest, "escritor", ingest.EscritorDiferido(cola_max=1)) # Sin iniciar: nada se vacía
+    cuerpo = [
+        {"uuid_controlador": str(controlador.uuid_controlador), "id_sensor": id_sensor, "lectura_temperatura": 20.0, "lectura_humedad": 50.0}
+        for id_sensor in (1, 2)
+    ]
+
+    async def peticion():
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            return await client.post("/api/sensor/batch", json=cuerpo)
+
+    respuesta = asyncio.run(peticion())
+    assert respuesta.status_code == 503
+    assert respuesta.headers["Retry-After"] == "1"
+
+
+def test_guarda_al_juntar_lote_max(monkeypatch):
+    grupos = guardado_simulado(monkeypatch)
+    escritor = ingest.EscritorDiferido(lote_max=3, intervalo_ms=60_000)
+    escritor.start()
+    try:
+        escritor.encolar(lecturas(7))
+        # Los grupos completos se guardan sin esperar el intervalo; el resto queda pendiente
+        assert esperar(lambda: grupos == [3, 3])
+        time.sleep(0.1)
+        assert grupos == [3, 3]
+    finally:
+        escritor.stop()
+    assert grupos == [3, 3, 1]
+
+
+def test_guarda_al_pasar_el_intervalo(monkeypatch):
+    grupos = guardado_simulado(monkeypatch)
+    escritor = ingest.EscritorDiferido(lote_max=100, intervalo_ms=50)
+    escritor.start()
+    try:
+        escritor.encolar(lecturas(2))
+        assert esperar(lambda: grupos == [2])
+        assert escritor.commits == 1
+    finally:
+        escritor.stop()
+
+
+def test_stop_guarda_las_pendientes(monkeypatch):
+    grupos = guardado_simulado(monkeypatch)
+    escritor = ingest.EscritorDiferido(lote_max=4, intervalo_ms=60_000)
+    escritor.start()
+    escritor.encolar(lecturas(3))
+    escritor.encolar(lecturas(6))
+    inicio = time.monotonic()
+    escritor.stop()
+    assert time.monotonic() - inicio < 5 # No espera el intervalo de 60 s
+    assert sum(grupos) == 9
+    assert escritor.lecturas_guardadas == 9 and escritor.metricas().pendientes == 0
+    assert not escritor.encolar(lecturas(1)) # Detenido: ya no acepta lecturas
@@ -0,0 +1,31 @@
+# test_metrics.py
+# Pruebas del formato de texto de Prometheus generado por metrics.py, sin el servidor corriendo.
+import metrics
+
+
+def test_histograma_acumula_cubetas_por_etiqueta():
+    """Las cubetas son acumulativas, terminan en +Inf y cada combinación de etiquetas es una serie."""
+    histograma = metrics.Histograma("prueba_duracion_seconds", "Prueba.", ("route",), limites=(0.1, 1.0))
+    metrics.REGISTRO.remove(histograma)
+    histograma.observe(0.05, "/a")
+    histograma.observe(0.5, "/a")
+    histograma.observe(5.0, "/a")
+    histograma.observe(0.05, "/b")
+
+    lineas = histograma.render()
+    assert lineas[:2] == ["# HELP prueba_duracion_seconds Prueba.", "# TYPE prueba_duracion_seconds histogram"]
+    assert 'prueba_duracion_seconds_bucket{route="/a",le="0.1"} 1' in lineas
+    assert 'prueba_duracion_seconds_bucket{route="/a",le="1.0"} 2' in lineas
+    assert 'prueba_duracion_seconds_bucket{route="/a",le="+Inf"} 3' in lineas
+    assert 'prueba_duracion_seconds_sum{route="/a"} 5.55' in lineas
+    assert 'prueba_duracion_seconds_count{route="/b"} 1' in lineas
+
+
+def test_medidor_escapa_etiquetas_y_elimina_series():
+    medidor = metrics.Medidor("prueba_valor", "Prueba.", ("nombre",))
+    metrics.REGISTRO.remove(medidor)
+    medidor.set_max(3, 'con "comillas"')
+    medidor.set_max(2, 'con "comillas"')
+    assert medidor.render()[2] == 'prueba_valor{nombre="con \\"comillas\\""} 3'
+    medidor.remove('con "comillas"')
+    assert len(medidor.render()) == 2
@@ -0,0 +1,82 @@
+# test_profiling.py
+import asyncio
+
+# Estas pruebas usan el middleware de perfilado sobre una aplicación ASGI mínima (sin el servidor corriendo)
+import profiling
+
+
+def app_respuesta(tipo: bytes, partes=(b"{}",)):
+    """Aplicación ASGI que responde con CORS y el cuerpo en `partes` (varias partes = respuesta en stream)."""
+    async def app(scope, receive, send):
+        await send({"type": "http.response.start", "status": 201, "headers": [
+            (b"content-type", tipo),
+            (b"access-control-allow-origin", b"https://secador-solar-gia.online"),
+            (b"etag", b'W/"1"'),
+        ]})
+        for i, parte in enumerate(partes):
+            await asyncio.sleep(0)
+            await send({"type": "http.response.body", "body": parte, "more_body": i < len(partes) - 1})
+    return app
+
+
+def perfilar(middleware):
+    """Ejecuta una petición con ?profile=1 y retorna los mensajes enviados al servidor."""
+    enviados = []
+
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(mensaje):
+        enviados.append(mensaje)
+
+    scope = {"type": "http", "method": "GET", "path": "/api/prueba", "headers": [], "query_string": b"profile=1"}
+    asyncio.run(middleware(scope, receive, send))
+    return enviados
+
+
+def test_perfil_conserva_las_cabeceras_originales():
+    middleware = profiling.PerfiladoPeticiones(app_respuesta(b"application/json"), autorizado=lambda scope: True)
+    inicio, cuerpo = perfilar(middleware)
+    cabeceras = dict(inicio["headers"])
+    assert cabeceras[b"access-control-allow-origin"] == b"https://secador-solar-gia.online"
+    assert cabeceras[b"content-type"] == b"text/plain; charset=utf-8"
+    assert cabeceras[b"x-profile-status"] == b"201"
+    assert b"etag" not in cabeceras # Describe el cuerpo original, no el perfil
+    assert cuerpo["body"].startswith(b"# Perfil de GET /api/prueba")
+
+
+def test_stream_no_se_perfila_ni_ocupa_el_turno():
+    middleware = profiling.PerfiladoPeticiones(app_respuesta(b"text/event-stream", (b"a", b"b", b"")), autorizado=lambda scope: True)
+    turnos = []
+    original = middleware.app
+
+    async def app(scope, receive, send):
+        async def send_revisado(mensaje):
+            if mensaje["type"] == "http.response.body":
+                turnos.append(middleware._en_uso.locked())
+            await send(mensaje)
+        await original(scope, receive, send_revisado)
+
+    middleware.app = app
+    enviados = perfilar(middleware)
+    assert [mensaje.get("body") for mensaje in enviados[1:]] == [b"a", b"b", b""]
+    assert dict(enviados[0]["headers"])[b"x-profile-status"] == b"omitido"
+    assert turnos == [False, False, False] # Otro perfil puede empezar mientras el stream sigue abierto
+
+
+def test_turno_se_libera_al_llegar_a_la_duracion_maxima(monkeypatch):
+    monkeypatch.setattr(profiling, "PERFILADO_MAX_S", 0.05)
+    middleware = profiling.PerfiladoPeticiones(None, autorizado=lambda scope: True)
+    turnos = []
+
+    async def app(scope, receive, send):
+        await send({"type": "http.response.start", "status": 200, "headers": [(b"content-type", b"text/csv")]})
+        turnos.append(middleware._en_uso.locked())
+        await asyncio.sleep(0.3) # Exportación larga: sigue enviando después del límite
+        turnos.append(middleware._en_uso.locked())
+        await send({"type": "http.response.body", "body": b"", "more_body": False})
+
+    middleware.app = app
+    enviados = perfilar(middleware)
+    assert turnos == [True, False]
+    assert dict(enviados[0]["headers"])[b"x-profile-status"] == b"200"
@@ -0,0 +1,43 @@
+# test_stats.py
+import uuid
+
+import pytest
+
+# Estas pruebas usan directamente el cálculo de estadísticas (sin el servidor corriendo)
+np = pytest.importorskip("numpy")
+import stats
+
+
+def test_estadisticas_por_sensor():
+    """Dos sensores con lecturas cada minuto: promedios, umbral, tasa de secado y diferencia entre ellos."""
+    minutos = np.arange(5)
+    ts = np.repeat(minutos * 60_000, 2) + 1_700_000_000_000
+    sensor = np.tile([1, 2], 5)
+    temperatura = np.array([30.0, 32.0, 40.0, 42.0, 50.0, 52.0, 40.0, 42.0, 30.0, 32.0])
+    humedad = np.repeat(80.0 - minutos * 0.5, 2) # Baja 30 % por hora en ambos sensores
+
+    resultado = stats.calcular_estadisticas(sensor, ts, temperatura, humedad, uuid.uuid4(), umbral_temperatura=41, umbral_humedad=100)
+
+    assert resultado.cantidad == 10
+    uno, dos = resultado.sensores
+    assert (uno.id_sensor, uno.cantidad) == (1, 5)
+    assert uno.temperatura.promedio == pytest.approx(38.0)
+    assert uno.temperatura.percentiles["p50"] == pytest.approx(40.0)
+    # Solo la lectura de 50 °C del sensor 1 supera 41 °C; la última lectura no suma tiempo
+    assert uno.temperatura.segundos_sobre_umbral == pytest.approx(60)
+    assert uno.temperatura.fraccion_sobre_umbral == pytest.approx(0.25)
+    assert dos.temperatura.segundos_sobre_umbral == pytest.approx(180)
+    assert uno.humedad.segundos_sobre_umbral == 0
+    assert uno.tasa_secado == pytest.approx(-30.0)
+    assert (uno.diferencia_temperatura, dos.diferencia_temperatura) == (pytest.approx(-1.0), pytest.approx(1.0))
+    assert resultado.divergencia.ventanas == 5
+    assert resultado.divergencia.temperatura_max == pytest.approx(2.0)
+    assert resultado.divergencia.humedad_max == pytest.approx(0.0)
+
+
+def test_estadisticas_sin_lecturas():
+    vacio = np.array([], dtype=np.int64)
+    resultado = stats.calcular_estadisticas(vacio, vacio, vacio.astype(float), vacio.astype(float), uuid.uuid4(), 40, 70)
+    assert resultado.cantidad == 0
+    assert resultado.sensores == []
+    assert resultado.divergencia.ventanas == 0